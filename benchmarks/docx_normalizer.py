@@ -0,0 +1,261 @@
+"""Benchmark of the DOCX document normalizer against the previous multi-pass implementation.
+
+Usage:
+    python benchmarks/docx_normalizer.py <directory or .docx files> [--repeat N] [--output results.json]
+
+For every DOCX file, 'word/document.xml' is filtered by both implementations, comparing wall time,
+peak memory (resident set size growth of a fresh process) and equality of the output.
+Exits with status 1 if outputs of any document differ."""
+
+import argparse
+import glob
+import io
+import json
+import multiprocessing
+import os
+import re
+import resource
+import statistics
+import sys
+import time
+import zipfile
+
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tildemt.file_translator import docx_filter # pylint: disable=wrong-import-position
+
+
+def legacy_remove_tags(tags):
+    for tag in tags:
+        try:
+            parent = tag.getparent()
+            while len(parent.getchildren()) == 1:
+                tag = parent
+                parent = parent.getparent()
+
+            parent.remove(tag)
+        except Exception: # pylint: disable=broad-except
+            pass
+
+
+def legacy_filter_document(buffer):
+    """Previous implementation of document.xml filtering, kept as a reference"""
+    xml_doc = etree.fromstring(buffer, etree.XMLParser(recover=False))
+
+    etree.strip_tags(
+        xml_doc,
+        '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}fldSimple',
+        '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sdt',
+        '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sdtContent',
+        '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}softHyphen'
+    )
+
+    etree.strip_elements(
+        xml_doc,
+        '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sdtPr',
+        '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sdtEndPr',
+        '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}instrText',
+        '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}fldChar'
+    )
+
+    deletable = []
+    text_break = r'\s|\W'
+
+    for paragraph in xml_doc.iterfind('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p'):
+        paragraph_elements = paragraph.findall('./{http://schemas.openxmlformats.org/wordprocessingml/2006/main}r/*')
+        txt_elements = paragraph.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t')
+        if len(txt_elements) < 2:
+            continue
+        last_txt_elem = txt_elements[-1]
+        merged_word = ''
+        word_start = None
+        word_parts = 0
+
+        for element in paragraph_elements:
+            if element.tag in (
+                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}tab',
+                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}br',
+                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}cr',
+                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}noBreakHyphen'
+            ):
+                if word_parts > 1:
+                    word_start.text = merged_word
+                merged_word = ''
+                word_parts = 0
+                word_start = None
+            elif element.tag == '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rPr':
+                for run_props in element:
+                    if (
+                        run_props.tag == '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}vertAlign'
+                    ) and (
+                        run_props.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val')
+                        == 'superscript' or
+                        run_props.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val') == 'subscript'
+                    ):
+                        if word_parts > 1:
+                            word_start.text = merged_word
+                        merged_word = ''
+                        word_parts = 0
+                        word_start = None
+            elif element.tag == '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t' and element.text:
+                if re.match(text_break, element.text[0]):
+                    if word_parts > 1:
+                        word_start.text = merged_word
+                    merged_word = ''
+                    word_parts = 0
+                    word_start = None
+                    if not re.match(text_break, element.text[-1]):
+                        merged_word += element.text
+                        word_parts += 1
+                        word_start = element
+                elif re.match(text_break, element.text[-1]) or element == last_txt_elem:
+                    if word_parts >= 1:
+                        merged_word += element.text
+                        word_start.text = merged_word
+                        deletable.append(element)
+                    merged_word = ''
+                    word_parts = 0
+                    word_start = None
+                else:
+                    merged_word += element.text
+                    if word_parts > 0:
+                        deletable.append(element)
+                    word_parts += 1
+                    if word_start is None:
+                        word_start = element
+
+    legacy_remove_tags(deletable)
+    deletable = []
+
+    for tag in xml_doc.iter():
+        tag_name = tag.tag
+        if (
+            'proofErr' in tag_name or '{http://schemas.openxmlformats.org/drawingml/2006/main}txSp' in tag_name
+            or 'commentRangeStart' in tag_name or 'commentRangeEnd' in tag_name
+            or (tag_name == 'w:r' and not tag.getchildren())
+        ):
+            deletable.append(tag)
+
+    legacy_remove_tags(deletable)
+    return etree.tostring(xml_doc)
+
+
+def normalizer_filter_document(buffer):
+    return docx_filter.filter_xml_file('word/document.xml', io.BytesIO(buffer))
+
+
+IMPLEMENTATIONS = {
+    'legacy': legacy_filter_document,
+    'normalizer': normalizer_filter_document,
+}
+
+
+def get_memory_status():
+    """Current and peak resident set size of the process in KB. Peak size reported by getrusage is
+    inherited from the parent process, so /proc is preferred where available"""
+    try:
+        with open('/proc/self/status', 'r', encoding='utf-8') as status:
+            values = dict(line.split(':', 1) for line in status)
+        return int(values['VmRSS'].split()[0]), int(values['VmHWM'].split()[0])
+    except (OSError, KeyError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak, peak
+
+
+def measure_peak_memory(implementation, buffer, result_queue):
+    """Runs in a fresh process, reports growth of the peak resident set size in KB"""
+    before, _ = get_memory_status()
+    IMPLEMENTATIONS[implementation](buffer)
+    result_queue.put(get_memory_status()[1] - before)
+
+
+def get_peak_memory(implementation, buffer):
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=measure_peak_memory, args=(implementation, buffer, result_queue))
+    process.start()
+    peak = result_queue.get()
+    process.join()
+    return peak
+
+
+def benchmark_document(file_path, repeat):
+    with zipfile.ZipFile(file_path, 'r') as archive:
+        buffer = archive.read('word/document.xml')
+
+    result = {'file': file_path, 'size': len(buffer)}
+    outputs = {}
+
+    for name, implementation in IMPLEMENTATIONS.items():
+        timings = []
+        try:
+            for _ in range(repeat):
+                start_time = time.perf_counter()
+                outputs[name] = implementation(buffer)
+                timings.append(time.perf_counter() - start_time)
+        except Exception as ex:
+            result[name] = {'error': repr(ex)}
+            continue
+
+        result[name] = {
+            'min_seconds': min(timings),
+            'median_seconds': statistics.median(timings),
+            'peak_rss_kb': get_peak_memory(name, buffer),
+        }
+
+    result['equal'] = len(outputs) == len(IMPLEMENTATIONS) and outputs['legacy'] == outputs['normalizer']
+    return result
+
+
+def get_documents(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, '**', '*.docx'), recursive=True))
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help="DOCX files or directories with DOCX files")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per document")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for file_path in get_documents(args.paths):
+        try:
+            result = benchmark_document(file_path, args.repeat)
+        except (KeyError, zipfile.BadZipFile) as ex:
+            print(f"{file_path}: skipped ({ex})")
+            continue
+
+        results.append(result)
+
+        timings = ', '.join(
+            f"{name}: {result[name]['min_seconds'] * 1000:.1f} ms / {result[name]['peak_rss_kb']} KB"
+            if 'error' not in result[name] else f"{name}: {result[name]['error']}" for name in IMPLEMENTATIONS
+        )
+        print(f"{file_path}: {timings}, equal: {result['equal']}")
+
+    measured = [result for result in results if all('error' not in result[name] for name in IMPLEMENTATIONS)]
+    if measured:
+        legacy_time = sum(result['legacy']['min_seconds'] for result in measured)
+        normalizer_time = sum(result['normalizer']['min_seconds'] for result in measured)
+        print(
+            f"Total: legacy {legacy_time:.3f} s, normalizer {normalizer_time:.3f} s, "
+            f"speedup {legacy_time / normalizer_time:.2f}x, "
+            f"different outputs: {sum(1 for result in results if not result['equal'])}/{len(results)}"
+        )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    return 0 if all(result['equal'] for result in measured) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
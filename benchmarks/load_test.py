@@ -0,0 +1,420 @@
+"""End-to-end load test of the worker with local stand-ins for the message broker, the file translation service
+and the translation API.
+
+Usage:
+    python benchmarks/load_test.py [--formats txt,tmx] [--size 100] [--jobs 20] [--consumers 1,2,4]
+                                   [--mt-capacity 1,4] [--mt-latency 0.2] [--mt-chars-per-second 0]
+                                   [--mt-timeout-rate 0] [--deadline SECONDS] [--output results.json]
+
+A round is run for each combination of consumer count (jobs translated concurrently by the worker) and
+MT capacity (requests served concurrently by the translation API, further requests wait). All jobs of a round
+are published at once. Job latency is measured from publishing of the job until its final status is stored,
+MT utilization is the share of MT capacity busy with requests during the round.
+
+Fake translation API returns the source text after the latency, 'mt-timeout-rate' of the requests fail with
+status 504. Jobs published with '--deadline' that are abandoned at their deadline are counted as expired.
+Formats translated with Okapi Tikal (docx, xlsx, pptx, odt) need Tikal to be installed"""
+
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic # pylint: disable=wrong-import-position
+from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus # pylint: disable=wrong-import-position
+from tildemt.enums.file_translation_status_type import FileTranslationStatusType # pylint: disable=wrong-import-position
+from tildemt.translator import Translator # pylint: disable=wrong-import-position
+
+# Seconds to wait before consuming the next message after a job has been deferred, as JOB_DEFER_DELAY of the worker
+DEFER_DELAY = 1
+# Times a message can be returned to the queue, as JOB_MAX_DEFERRALS of the worker
+MAX_DEFERRALS = 10
+
+FINAL_STATUSES = (FileTranslationStatusType.SUCCEEDED.value, FileTranslationStatusType.ERROR.value)
+
+
+class FakeStorage():
+    """File translation service: metadata and files of the jobs at '/file/{task}'"""
+    def __init__(self):
+        self.__jobs = {}
+        self.__lock = threading.Lock()
+        self.__finished = threading.Condition(self.__lock)
+
+        storage = self
+
+        class Handler(_Handler):
+            def do_GET(self): # pylint: disable=invalid-name
+                storage.get(self)
+
+            def do_PUT(self): # pylint: disable=invalid-name
+                storage.put(self)
+
+            def do_POST(self): # pylint: disable=invalid-name
+                storage.post(self)
+
+        self.url = _serve(Handler)
+
+    def add_job(self, source_path, source_lang, target_lang):
+        """Adds a queued job of the source file, returns the task id"""
+        task = f'load-{len(self.__jobs)}-{random.getrandbits(32):08x}'
+        _, extension = os.path.splitext(source_path)
+
+        with self.__lock:
+            self.__jobs[task] = {
+                'source_path': source_path,
+                'published': time.monotonic(),
+                'finished': None,
+                'uploads': {},
+                'metadata': {
+                    'id': task,
+                    'srcLang': source_lang,
+                    'trgLang': target_lang,
+                    'domain': None,
+                    'segments': 0,
+                    'translatedSegments': 0,
+                    'status': None,
+                    'substatus': None,
+                    'files': [{
+                        'id': task,
+                        'category': 'Source',
+                        'extension': extension,
+                        'size': os.path.getsize(source_path)
+                    }]
+                }
+            }
+
+        return task
+
+    def wait(self, tasks, timeout=None):
+        """Waits until all tasks reach the final status, returns False on timeout"""
+        with self.__finished:
+            return self.__finished.wait_for(
+                lambda: all(self.__jobs[task]['finished'] is not None for task in tasks),
+                timeout
+            )
+
+    def get_job(self, task):
+        with self.__lock:
+            return dict(self.__jobs[task])
+
+    def get(self, request):
+        parts = urlparse(request.path).path.strip('/').split('/')
+        job = self.__jobs.get(parts[1]) if len(parts) > 1 else None
+        if job is None:
+            request.send_body(404, b'')
+        elif parts[0] == 'File' and len(parts) == 3:
+            with open(job['source_path'], 'rb') as source:
+                request.send_body(200, source.read(), 'application/octet-stream')
+        else:
+            with self.__lock:
+                request.send_json(job['metadata'])
+
+    def put(self, request):
+        task = urlparse(request.path).path.strip('/').split('/')[1]
+        update = json.loads(request.rfile.read(int(request.headers['Content-Length'])))
+
+        with self.__finished:
+            job = self.__jobs[task]
+            job['metadata'].update(update)
+
+            if job['metadata']['status'] in FINAL_STATUSES and job['finished'] is None:
+                job['finished'] = time.monotonic()
+                self.__finished.notify_all()
+
+            metadata = dict(job['metadata'])
+
+        request.send_json(metadata)
+
+    def post(self, request):
+        url = urlparse(request.path)
+        task = url.path.strip('/').split('/')[1]
+        category = dict(parameter.split('=', 1) for parameter in url.query.split('&') if parameter)['category']
+
+        # Multipart body is not parsed, only the size of the upload is recorded
+        size = int(request.headers['Content-Length'])
+        remaining = size
+        while remaining:
+            remaining -= len(request.rfile.read(min(remaining, 1024 * 1024)))
+
+        with self.__lock:
+            self.__jobs[task]['uploads'][category] = size
+
+        request.send_body(200, b'')
+
+
+class FakeTranslationAPI():
+    """Translation API returning the source text with latency, serving 'capacity' requests at a time"""
+    def __init__(self, latency, chars_per_second, timeout_rate, seed=0):
+        self.latency = latency
+        self.chars_per_second = chars_per_second
+        self.timeout_rate = timeout_rate
+
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(1)
+        self.__capacity = 1
+
+        # Seconds the capacity was busy with requests
+        self.busy_seconds = 0
+        self.requests = 0
+        self.timeouts = 0
+
+        api = self
+
+        class Handler(_Handler):
+            def do_POST(self): # pylint: disable=invalid-name
+                api.translate(self)
+
+        self.url = _serve(Handler)
+
+    def reset(self, capacity):
+        self.__slots = threading.BoundedSemaphore(capacity)
+        self.__capacity = capacity
+        self.busy_seconds = 0
+        self.requests = 0
+        self.timeouts = 0
+
+    def get_utilization(self, seconds):
+        return self.busy_seconds / (self.__capacity * seconds) if seconds else 0
+
+    def translate(self, request):
+        body = json.loads(request.rfile.read(int(request.headers['Content-Length'])))
+
+        with self.__lock:
+            timed_out = self.__random.random() < self.timeout_rate
+
+        latency = self.latency
+        if self.chars_per_second:
+            latency += sum(len(text) for text in body['text']) / self.chars_per_second
+
+        with self.__slots:
+            time.sleep(latency)
+
+        with self.__lock:
+            self.busy_seconds += latency
+            self.requests += 1
+            self.timeouts += timed_out
+
+        if timed_out:
+            request.send_body(504, b'')
+        else:
+            request.send_json({
+                'domain': body['domain'] or 'general',
+                'translations': [{'translation': text} for text in body['text']]
+            })
+
+
+class LocalBroker():
+    """In-process queue of job messages consumed as by the worker's RabbitMQ consumer"""
+    def __init__(self):
+        self.__queue = queue.Queue()
+
+        # Times messages have been returned to the queue, by task
+        self.__deferrals = {}
+
+    def publish(self, message):
+        self.__queue.put((json.dumps(message).encode('utf-8'), time.time()))
+
+    def consume(self, consumers):
+        """Starts consumer threads, returns function stopping them"""
+        threads = [threading.Thread(target=self.__consume, daemon=True) for _ in range(consumers)]
+        for thread in threads:
+            thread.start()
+
+        def stop():
+            for _ in threads:
+                self.__queue.put(None)
+            for thread in threads:
+                thread.join()
+
+        return stop
+
+    def __consume(self):
+        for message, published_at in iter(self.__queue.get, None):
+            message_body = json.loads(message)
+            translator = Translator(
+                message_body["task"],
+                profile=bool(message_body.get("profile")),
+                translation_memory=message_body.get("translationMemory"),
+                deadline=message_body.get("deadline"),
+                published_at=published_at,
+                may_defer=self.__deferrals.get(message_body["task"], 0) < MAX_DEFERRALS
+            )
+
+            if not translator.translate():
+                # Job returned to the queue until resources are free
+                self.__deferrals[message_body["task"]] = self.__deferrals.get(message_body["task"], 0) + 1
+                self.__queue.put((message, published_at))
+                time.sleep(DEFER_DELAY)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def send_body(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, value):
+        self.send_body(200, json.dumps(value).encode('utf-8'))
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+
+def _serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0
+
+
+def run_round(storage, mt_api, documents, jobs, consumers, mt_capacity, timeout, deadline=None):
+    """Translates 'jobs' documents with 'consumers' concurrent jobs, each job with a deadline 'deadline' seconds
+    after it is published if set. Returns results of the round"""
+    mt_api.reset(mt_capacity)
+    broker = LocalBroker()
+
+    start_time = time.monotonic()
+    tasks = []
+    for document in itertools.islice(itertools.cycle(documents), jobs):
+        task = storage.add_job(document, 'en', 'lv')
+        tasks.append(task)
+
+        message = {'task': task}
+        if deadline is not None:
+            message['deadline'] = (
+                datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=deadline)
+            ).isoformat()
+        broker.publish(message)
+
+    stop = broker.consume(consumers)
+    completed = storage.wait(tasks, timeout)
+    seconds = time.monotonic() - start_time
+    if completed:
+        stop()
+
+    finished = [storage.get_job(task) for task in tasks]
+    finished = [job for job in finished if job['finished'] is not None]
+    latencies = [job['finished'] - job['published'] for job in finished]
+
+    return {
+        'consumers': consumers,
+        'mtCapacity': mt_capacity,
+        'jobs': jobs,
+        'finished': len(finished),
+        'succeeded': sum(job['metadata']['status'] == FileTranslationStatusType.SUCCEEDED.value for job in finished),
+        'expired': sum(
+            job['metadata']['substatus'] == FileTranslationSubstatus.DEADLINE_EXCEEDED.value for job in finished
+        ),
+        'seconds': seconds,
+        'jobsPerMinute': len(finished) / seconds * 60 if seconds else 0,
+        'latencyP50': percentile(latencies, 0.5),
+        'latencyP95': percentile(latencies, 0.95),
+        'latencyMean': statistics.mean(latencies) if latencies else 0,
+        'mtRequests': mt_api.requests,
+        'mtTimeouts': mt_api.timeouts,
+        'mtUtilization': mt_api.get_utilization(seconds)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the worker with local broker, storage and MT")
+    parser.add_argument('--formats', default='txt,tmx', help=f"comma separated: {', '.join(synthetic.GENERATORS)}")
+    parser.add_argument('--size', type=int, default=100, help="paragraphs, rows, lines or units of a document")
+    parser.add_argument('--jobs', type=int, default=20, help="jobs published in each round")
+    parser.add_argument('--consumers', default='1,2,4', help="comma separated counts of concurrent jobs")
+    parser.add_argument('--mt-capacity', default='1,4', help="comma separated counts of concurrent MT requests")
+    parser.add_argument('--mt-latency', type=float, default=0.2, help="seconds per MT request")
+    parser.add_argument('--mt-chars-per-second', type=float, default=0, help="MT speed added to the latency")
+    parser.add_argument('--mt-timeout-rate', type=float, default=0, help="share of MT requests failing with 504")
+    parser.add_argument('--timeout', type=float, default=3600, help="seconds to wait for the jobs of a round")
+    parser.add_argument('--deadline', type=float, help="deadline of each job in seconds after it is published")
+    parser.add_argument('--output', help="path of the JSON results")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)-8s [%(name)s:%(funcName)s:%(lineno)d] %(message)s"
+    )
+
+    storage = FakeStorage()
+    mt_api = FakeTranslationAPI(args.mt_latency, args.mt_chars_per_second, args.mt_timeout_rate)
+    os.environ['FILE_TRANSLATION_SERVICE_URL'] = storage.url
+    os.environ['TRANSLATION_API_SERVICE_URL'] = mt_api.url
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        documents = []
+        for extension in args.formats.split(','):
+            path = os.path.join(work_dir, f'source.{extension}')
+            synthetic.GENERATORS[extension](path, args.size)
+            documents.append(path)
+
+        print(
+            f"{'consumers':>9} {'MT cap':>6} {'jobs':>9} {'jobs/min':>9} {'p50 s':>8} {'p95 s':>8} "
+            f"{'MT req':>7} {'504':>5} {'MT util':>8} {'expired':>7}"
+        )
+        for consumers, mt_capacity in itertools.product(
+            [int(value) for value in args.consumers.split(',')],
+            [int(value) for value in args.mt_capacity.split(',')]
+        ):
+            result = run_round(
+                storage, mt_api, documents, args.jobs, consumers, mt_capacity, args.timeout, args.deadline
+            )
+            results.append(result)
+
+            print(
+                f"{consumers:>9} {mt_capacity:>6} {result['succeeded']:>4}/{result['jobs']:<4} "
+                f"{result['jobsPerMinute']:>9.1f} {result['latencyP50']:>8.2f} {result['latencyP95']:>8.2f} "
+                f"{result['mtRequests']:>7} {result['mtTimeouts']:>5} {result['mtUtilization']:>8.1%} "
+                f"{result['expired']:>7}"
+            )
+
+            if result['finished'] < result['jobs']:
+                print(f"Round timed out, {result['finished']}/{result['jobs']} jobs finished", file=sys.stderr)
+                return 1
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(
+                {
+                    'settings': {
+                        'formats': args.formats,
+                        'size': args.size,
+                        'mtLatency': args.mt_latency,
+                        'mtCharsPerSecond': args.mt_chars_per_second,
+                        'mtTimeoutRate': args.mt_timeout_rate,
+                        'deadline': args.deadline
+                    },
+                    'results': results
+                },
+                output_file,
+                indent=2
+            )
+
+    # Jobs abandoned at their deadline are expected with --deadline
+    return 0 if all(result['succeeded'] + result['expired'] == result['jobs'] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""Benchmark suite of document processing stages on synthetic documents.
+
+Usage:
+    python benchmarks/suite.py [--sizes small,medium,large] [--cases REGEX] [--repeat N]
+                               [--output results.json] [--baseline baseline.json] [--threshold 0.2]
+                               [--min-time 0.005]
+
+Cases:
+    docx.preprocess, pptx.preprocess  - DOCXTranslator.preprocess
+    encoding.detect, encoding.decode  - FileEncoder detection and decoding of TXT documents in several encodings
+    tikal.extract, tikal.merge        - Okapi Tikal extraction and merge of DOCX, XLSX, PPTX and ODT documents,
+                                        skipped if Tikal is not installed
+    mt.batches                        - batching of segments for the translation API
+    xlf_inline.segments               - segment loop of XLFInlineTranslator.translate_file
+    tmx.translate                     - TMX translation
+Segment loop and TMX translation use a local translation API returning the source text.
+
+Results (minimum and median wall time of the runs) are written to the output file. Median time of each case
+is compared with the baseline results, exits with status 1 if any case is slower than the baseline
+by more than the threshold. Cases faster than the minimum time are too noisy to be compared"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import lxml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic # pylint: disable=wrong-import-position
+from tildemt.file_translator.types.docx import DOCXTranslator # pylint: disable=wrong-import-position
+from tildemt.file_translator.types.tikal import TikalTranslator # pylint: disable=wrong-import-position
+from tildemt.file_translator.types.tmx import TMXTranslator # pylint: disable=wrong-import-position
+from tildemt.file_translator.xlf_inline import XLFInlineTranslator # pylint: disable=wrong-import-position
+from tildemt.services.text_translation_service import TextTranslationService # pylint: disable=wrong-import-position
+from tildemt.utils.file_encoder import FileEncoder # pylint: disable=wrong-import-position
+
+# Paragraphs, rows, lines or translation units of the documents
+SIZES = {
+    'small': 100,
+    'medium': 1000,
+    'large': 10000
+}
+
+METADATA = {'srcLang': 'en', 'trgLang': 'lv', 'domain': 'benchmark'}
+
+TEXT_ENCODINGS = ['utf-8', 'utf-16', 'cp1257']
+
+# pylint: disable=protected-access
+
+
+class EchoTranslationHandler(BaseHTTPRequestHandler):
+    """Translation API returning the source text"""
+    def do_POST(self): # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        body = json.dumps({
+            'domain': request['domain'] or 'general',
+            'translations': [{'translation': text} for text in request['text']]
+        }).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+
+def start_translation_api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EchoTranslationHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['TRANSLATION_API_SERVICE_URL'] = f'http://127.0.0.1:{server.server_port}'
+
+
+def is_tikal_installed():
+    return os.path.isfile(TikalTranslator._TikalTranslator__TIKAL_PATH)
+
+
+def get_cases(work_dir, size_name):
+    """Returns benchmark cases of the size, a case is a name and a function preparing a single run.
+    The preparation is not timed, it returns a function that is timed"""
+    size = SIZES[size_name]
+    cases = []
+
+    def document(extension, **options):
+        path = os.path.join(work_dir, f'{size_name}.{"-".join(options.values()) or "source"}.{extension}')
+        if not os.path.exists(path):
+            synthetic.GENERATORS[extension](path, size, **options)
+        return path
+
+    def copy(path):
+        target = os.path.join(work_dir, 'run', os.path.basename(path))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+        return target
+
+    for extension in ('docx', 'pptx'):
+        def prepare_preprocess(extension=extension):
+            source = copy(document(extension))
+            translator = DOCXTranslator(METADATA)
+            return lambda: translator.preprocess(source)
+
+        cases.append((f'{extension}.preprocess[{size_name}]', prepare_preprocess))
+
+    for encoding in TEXT_ENCODINGS:
+        def prepare_detect(encoding=encoding):
+            source = document('txt', encoding=encoding)
+            return lambda: FileEncoder().get_encoding(source, 'lv')
+
+        def prepare_decode(encoding=encoding):
+            source = document('txt', encoding=encoding)
+            detected, _ = FileEncoder().get_encoding(source, 'lv')
+
+            def decode():
+                with io.open(source, 'r', encoding=detected, newline='') as file:
+                    for _ in file:
+                        pass
+
+            return decode
+
+        cases.append((f'encoding.detect[{encoding}-{size_name}]', prepare_detect))
+        cases.append((f'encoding.decode[{encoding}-{size_name}]', prepare_decode))
+
+    if is_tikal_installed():
+        for extension in ('docx', 'xlsx', 'pptx', 'odt'):
+            def prepare_extract(extension=extension):
+                source = copy(document(extension))
+                translator = TikalTranslator(METADATA)
+                return lambda: list(translator._TikalTranslator__to_inline(source))
+
+            def prepare_merge(extension=extension):
+                source = copy(document(extension))
+                translator = TikalTranslator(METADATA)
+                extracted = ''.join(translator._TikalTranslator__to_inline(source))
+
+                inline_target = f'{source}.mxlf.lv'
+                with open(inline_target, 'w', encoding='utf-8', newline='') as file:
+                    file.write(extracted)
+
+                target = os.path.join(os.path.dirname(source), f'target.{extension}')
+                return lambda: translator._TikalTranslator__from_inline(inline_target, source, target)
+
+            cases.append((f'tikal.extract[{extension}-{size_name}]', prepare_extract))
+            cases.append((f'tikal.merge[{extension}-{size_name}]', prepare_merge))
+
+    segments = synthetic.sentences(size, size)
+
+    def prepare_batches():
+        service = TextTranslationService(METADATA['srcLang'], METADATA['trgLang'], METADATA['domain'])
+        return lambda: list(service._TextTranslationService__get_batches(segments))
+
+    def prepare_segment_loop():
+        translator = XLFInlineTranslator(METADATA)
+        lines = [f'{segment}\n' for segment in segments]
+        return lambda: translator.translate_file(lines)
+
+    def prepare_tmx():
+        source = document('tmx')
+        target = os.path.join(work_dir, 'run', 'target.tmx')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        translator = TMXTranslator(METADATA)
+        return lambda: translator.translate(source, target)
+
+    cases.append((f'mt.batches[{size_name}]', prepare_batches))
+    cases.append((f'xlf_inline.segments[{size_name}]', prepare_segment_loop))
+    cases.append((f'tmx.translate[{size_name}]', prepare_tmx))
+
+    return cases
+
+
+def run_case(prepare, repeat):
+    """Returns wall times of the runs, the first run is a warm-up run and is not counted"""
+    times = []
+    for _ in range(repeat + 1):
+        run = prepare()
+
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    return times[1:]
+
+
+def compare(results, baseline, threshold, min_time):
+    """Prints comparison of results with the baseline, returns names of regressed cases"""
+    regressions = []
+
+    print(f"{'case':<40} {'median s':>10} {'baseline s':>10} {'change':>8}")
+    for name, result in results.items():
+        baseline_result = baseline.get(name)
+        if baseline_result is None:
+            print(f"{name:<40} {result['median']:>10.4f} {'-':>10} {'-':>8}")
+            continue
+
+        change = result['median'] / baseline_result['median'] - 1 if baseline_result['median'] else 0
+        regressed = change > threshold and result['median'] >= min_time
+        if regressed:
+            regressions.append(name)
+
+        print(
+            f"{name:<40} {result['median']:>10.4f} {baseline_result['median']:>10.4f} {change:>+8.1%}"
+            + (' REGRESSION' if regressed else '')
+        )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document processing stages on synthetic documents")
+    parser.add_argument('--sizes', default='small,medium', help=f"comma separated sizes: {', '.join(SIZES)}")
+    parser.add_argument('--cases', default='', help="regular expression of case names to run")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="path of the JSON results")
+    parser.add_argument('--baseline', help="path of JSON results to compare with")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed slowdown relative to the baseline")
+    parser.add_argument('--min-time', type=float, default=0.005, help="seconds, faster cases are not compared")
+    args = parser.parse_args()
+
+    start_translation_api()
+
+    if not is_tikal_installed():
+        print("Okapi Tikal is not installed, Tikal cases are skipped", file=sys.stderr)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size_name in args.sizes.split(','):
+            for name, prepare in get_cases(work_dir, size_name):
+                if not re.search(args.cases, name):
+                    continue
+
+                times = run_case(prepare, args.repeat)
+                results[name] = {'min': min(times), 'median': statistics.median(times), 'runs': len(times)}
+                print(f"{name:<40} {results[name]['median']:>10.4f} s", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(
+                {
+                    'environment': {
+                        'python': platform.python_version(),
+                        'lxml': lxml.__version__,
+                        'machine': platform.machine(),
+                        'cpus': os.cpu_count()
+                    },
+                    'results': results
+                },
+                output_file,
+                indent=2
+            )
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)['results']
+
+    regressions = compare(results, baseline, args.threshold, args.min_time)
+    if regressions:
+        print(f"{len(regressions)} cases slower than the baseline: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
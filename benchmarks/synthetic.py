@@ -0,0 +1,208 @@
+"""Synthetic documents for benchmarks. Documents are generated deterministically from the size,
+so that results of different runs and builds are comparable"""
+
+import random
+import zipfile
+
+WORDS = (
+    "the translation memory document file worker segment paragraph table cell slide text format "
+    "service request batch response language domain source target result machine quality review "
+    "process system user data value number page section chapter figure report summary"
+).split()
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+S = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+P = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+A = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_R = 'http://schemas.openxmlformats.org/package/2006/relationships'
+CT = 'http://schemas.openxmlformats.org/package/2006/content-types'
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+
+def sentences(count, seed):
+    """Returns 'count' sentences of 5 to 20 words"""
+    generator = random.Random(seed)
+    return [
+        ' '.join(generator.choice(WORDS) for _ in range(generator.randint(5, 20))).capitalize() + '.'
+        for _ in range(count)
+    ]
+
+
+def _relationships(*relationships):
+    return XML_DECLARATION + f'<Relationships xmlns="{PACKAGE_R}">' + ''.join(
+        f'<Relationship Id="{rid}" Type="{R}/{kind}" Target="{target}"/>' for rid, kind, target in relationships
+    ) + '</Relationships>'
+
+
+def _content_types(*overrides):
+    return XML_DECLARATION + f'<Types xmlns="{CT}">' \
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>' \
+        '<Default Extension="xml" ContentType="application/xml"/>' + ''.join(
+            f'<Override PartName="{part}" ContentType="{content_type}"/>' for part, content_type in overrides
+        ) + '</Types>'
+
+
+def _docx_paragraph(index, text):
+    """Paragraph with formatting split in several runs, as written by word processors"""
+    words = text.split(' ')
+    middle = len(words) // 2
+    return (
+        '<w:p><w:pPr><w:pStyle w:val="Normal"/></w:pPr>'
+        f'<w:r><w:t xml:space="preserve">{" ".join(words[:middle])} </w:t></w:r>'
+        '<w:proofErr w:type="spellStart"/>'
+        f'<w:r><w:rPr><w:b/></w:rPr><w:t xml:space="preserve">{words[middle]}</w:t></w:r>'
+        '<w:proofErr w:type="spellEnd"/>'
+        f'<w:bookmarkStart w:id="{index}" w:name="b{index}"/><w:bookmarkEnd w:id="{index}"/>'
+        f'<w:r><w:t xml:space="preserve"> {" ".join(words[middle + 1:])}</w:t></w:r>'
+        '</w:p>'
+    )
+
+
+def make_docx(path, size):
+    paragraphs = ''.join(_docx_paragraph(index, text) for index, text in enumerate(sentences(size, size)))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _content_types(
+            ('/word/document.xml', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml')
+        ))
+        archive.writestr('_rels/.rels', _relationships(('rId1', 'officeDocument', 'word/document.xml')))
+        archive.writestr('word/_rels/document.xml.rels', _relationships())
+        archive.writestr(
+            'word/document.xml',
+            XML_DECLARATION + f'<w:document xmlns:w="{W}" xmlns:r="{R}"><w:body>{paragraphs}</w:body></w:document>'
+        )
+
+
+def make_xlsx(path, size):
+    strings = sentences(size, size)
+    rows = ''.join(
+        f'<row r="{index + 1}"><c r="A{index + 1}" t="s"><v>{index}</v></c>'
+        f'<c r="B{index + 1}"><v>{index}</v></c></row>'
+        for index in range(size)
+    )
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _content_types(
+            ('/xl/workbook.xml', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml'),
+            ('/xl/worksheets/sheet1.xml', 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'),
+            ('/xl/sharedStrings.xml', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml')
+        ))
+        archive.writestr('_rels/.rels', _relationships(('rId1', 'officeDocument', 'xl/workbook.xml')))
+        archive.writestr('xl/_rels/workbook.xml.rels', _relationships(
+            ('rId1', 'worksheet', 'worksheets/sheet1.xml'),
+            ('rId2', 'sharedStrings', 'sharedStrings.xml')
+        ))
+        archive.writestr(
+            'xl/workbook.xml',
+            XML_DECLARATION + f'<workbook xmlns="{S}" xmlns:r="{R}">'
+            '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        )
+        archive.writestr(
+            'xl/worksheets/sheet1.xml',
+            XML_DECLARATION + f'<worksheet xmlns="{S}"><sheetData>{rows}</sheetData></worksheet>'
+        )
+        archive.writestr(
+            'xl/sharedStrings.xml',
+            XML_DECLARATION + f'<sst xmlns="{S}" count="{size}" uniqueCount="{size}">'
+            + ''.join(f'<si><t>{text}</t></si>' for text in strings) + '</sst>'
+        )
+
+
+def make_pptx(path, size):
+    """Presentation with 10 text boxes per slide"""
+    texts = sentences(size, size)
+    slides = [texts[index:index + 10] for index in range(0, size, 10)]
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        content_type = 'application/vnd.openxmlformats-officedocument.presentationml'
+        archive.writestr('[Content_Types].xml', _content_types(
+            ('/ppt/presentation.xml', f'{content_type}.presentation.main+xml'),
+            *((f'/ppt/slides/slide{number}.xml', f'{content_type}.slide+xml') for number in range(1, len(slides) + 1))
+        ))
+        archive.writestr('_rels/.rels', _relationships(('rId1', 'officeDocument', 'ppt/presentation.xml')))
+        archive.writestr('ppt/_rels/presentation.xml.rels', _relationships(
+            *((f'rId{number}', 'slide', f'slides/slide{number}.xml') for number in range(1, len(slides) + 1))
+        ))
+        archive.writestr(
+            'ppt/presentation.xml',
+            XML_DECLARATION + f'<p:presentation xmlns:p="{P}" xmlns:r="{R}"><p:sldIdLst>' + ''.join(
+                f'<p:sldId id="{255 + number}" r:id="rId{number}"/>' for number in range(1, len(slides) + 1)
+            ) + '</p:sldIdLst></p:presentation>'
+        )
+
+        for number, slide in enumerate(slides, 1):
+            shapes = ''.join(
+                f'<p:sp><p:nvSpPr><p:cNvPr id="{index + 2}" name="TextBox {index}"/><p:cNvSpPr txBox="1"/><p:nvPr/>'
+                f'</p:nvSpPr><p:spPr/><p:txBody><a:bodyPr/><a:p><a:r><a:rPr lang="en-US"/><a:t>{text}</a:t></a:r>'
+                '</a:p></p:txBody></p:sp>'
+                for index, text in enumerate(slide)
+            )
+            archive.writestr(
+                f'ppt/slides/slide{number}.xml',
+                XML_DECLARATION + f'<p:sld xmlns:p="{P}" xmlns:a="{A}" xmlns:r="{R}"><p:cSld><p:spTree>'
+                '<p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr><p:grpSpPr/>'
+                f'{shapes}</p:spTree></p:cSld></p:sld>'
+            )
+
+
+def make_odt(path, size):
+    office = 'urn:oasis:names:tc:opendocument:xmlns:office:1.0'
+    text_ns = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'
+    manifest = 'urn:oasis:names:tc:opendocument:xmlns:manifest:1.0'
+    paragraphs = ''.join(
+        f'<text:p text:style-name="Standard">{text[:len(text) // 2]}<text:span text:style-name="T1">'
+        f'{text[len(text) // 2:]}</text:span></text:p>'
+        for text in sentences(size, size)
+    )
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        # Mimetype has to be the first member and stored without compression
+        archive.writestr('mimetype', 'application/vnd.oasis.opendocument.text', compress_type=zipfile.ZIP_STORED)
+        archive.writestr(
+            'META-INF/manifest.xml',
+            XML_DECLARATION + f'<manifest:manifest xmlns:manifest="{manifest}" manifest:version="1.2">'
+            '<manifest:file-entry manifest:full-path="/" '
+            'manifest:media-type="application/vnd.oasis.opendocument.text"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+            '</manifest:manifest>'
+        )
+        archive.writestr(
+            'content.xml',
+            XML_DECLARATION + f'<office:document-content xmlns:office="{office}" xmlns:text="{text_ns}" '
+            f'office:version="1.2"><office:body><office:text>{paragraphs}</office:text></office:body>'
+            '</office:document-content>'
+        )
+
+
+def make_txt(path, size, encoding='utf-8'):
+    """Text of 'size' lines, non-ASCII characters are included for codepage and UTF detection"""
+    with open(path, 'w', encoding=encoding, newline='\n') as file:
+        for text in sentences(size, size):
+            file.write(f'{text} Ā ē ī\n')
+
+
+def make_tmx(path, size):
+    units = ''.join(
+        f'    <tu tuid="{index}">\n'
+        f'      <tuv xml:lang="en-US"><seg>{text[:10]}<bpt i="1">&lt;b&gt;</bpt>{text[10:20]}'
+        f'<ept i="1">&lt;/b&gt;</ept>{text[20:]}</seg></tuv>\n'
+        '    </tu>\n'
+        for index, text in enumerate(sentences(size, size))
+    )
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n<tmx version="1.4">\n'
+            '  <header creationtool="benchmark" creationtoolversion="1" segtype="sentence" o-tmf="tmx" '
+            'adminlang="en-US" srclang="en-US" datatype="plaintext"/>\n'
+            f'  <body>\n{units}  </body>\n</tmx>\n'
+        )
+
+
+GENERATORS = {
+    'docx': make_docx,
+    'xlsx': make_xlsx,
+    'pptx': make_pptx,
+    'odt': make_odt,
+    'txt': make_txt,
+    'tmx': make_tmx
+}
@@ -0,0 +1,66 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+# Inline tags of the translated text
+TAG = re.compile(r'(<[^>]*>)')
+
+
+def translate(text):
+    """Returns the text in upper case, inline tags are kept as they are"""
+    return ''.join(part if TAG.fullmatch(part) else part.upper() for part in TAG.split(text))
+
+
+class TranslationAPI():
+    """Local translation API translating text to upper case, 'latency' - seconds per character of a request"""
+    def __init__(self):
+        self.latency = 0
+        # Batches of the requests in the order they were received
+        self.requests = []
+        self.lock = threading.Lock()
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self): # pylint: disable=invalid-name
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with api.lock:
+                    api.requests.append(body['text'])
+
+                time.sleep(api.latency * sum(len(text) for text in body['text']))
+
+                response = json.dumps({
+                    'domain': body['domain'] or 'general',
+                    'translations': [{'translation': translate(text)} for text in body['text']]
+                }).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args): # pylint: disable=redefined-builtin
+                pass
+
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.__server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.__server.server_address[1]}'
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+@pytest.fixture
+def translation_api(monkeypatch):
+    api = TranslationAPI()
+    monkeypatch.setenv('TRANSLATION_API_SERVICE_URL', api.url)
+    yield api
+    api.close()
@@ -0,0 +1,45 @@
+import contextvars
+import concurrent.futures
+
+from tildemt.file_translator import docx_filter
+from tildemt.utils import accounting
+
+
+def busy(seconds):
+    total = 0
+    while total < seconds:
+        start_time = accounting.time.thread_time()
+        sum(range(10000))
+        total += accounting.time.thread_time() - start_time
+    return total
+
+
+def test_counts_cpu_time_of_pool_threads_for_the_job():
+    account = accounting.JobAccount('task')
+    account.start()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, accounting.measured(busy), 0.05) for _ in range(2)
+        ]
+        pool_seconds = sum(future.result() for future in futures)
+
+    record = account.stop('txt')
+
+    assert record['cpuSeconds'] >= pool_seconds
+
+
+def test_pool_threads_without_a_job_are_not_counted():
+    assert accounting.measured(busy)(0.01) >= 0.01
+
+
+def test_filtered_buffer_reports_cpu_time_of_the_worker():
+    document = (
+        b'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        b'<w:body><w:p><w:r><w:t>Text</w:t></w:r></w:p></w:body></w:document>'
+    )
+
+    filtered, cpu_seconds = docx_filter.filter_xml_buffer('word/document.xml', document)
+
+    assert b'Text' in filtered
+    assert cpu_seconds >= 0
@@ -0,0 +1,61 @@
+import os
+
+from tildemt.utils.artifact_cache import ArtifactCache
+
+
+def write(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+def test_restores_stored_artifacts(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 1024)
+    cache.put('aa01', 'result', write(tmp_path, 'source', 10))
+
+    assert cache.get('aa01', 'result', str(tmp_path / 'restored'))
+    assert os.path.getsize(tmp_path / 'restored') == 10
+    assert not cache.get('aa01', 'metadata', str(tmp_path / 'missing'))
+    assert not cache.get('bb01', 'result', str(tmp_path / 'missing'))
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 250)
+    source = write(tmp_path, 'source', 100)
+    cache.put('aa01', 'result', source)
+    cache.put('bb01', 'result', source)
+
+    # Entry 'aa01' becomes the most recently used one
+    assert cache.get('aa01', 'result', str(tmp_path / 'restored'))
+    cache.put('cc01', 'result', source)
+
+    assert cache.get('aa01', 'result', str(tmp_path / 'restored'))
+    assert not cache.get('bb01', 'result', str(tmp_path / 'restored'))
+    assert not os.path.exists(tmp_path / 'cache' / 'bb' / 'bb01')
+    assert cache.get('cc01', 'result', str(tmp_path / 'restored'))
+
+
+def test_replaced_artifacts_are_counted_once(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), 250)
+    source = write(tmp_path, 'source', 100)
+    cache.put('aa01', 'result', source)
+    cache.put('aa01', 'result', source)
+    cache.put('bb01', 'result', source)
+
+    assert cache.get('aa01', 'result', str(tmp_path / 'restored'))
+
+
+def test_indexes_existing_entries_at_start(tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache = ArtifactCache(directory, 1024)
+    source = write(tmp_path, 'source', 100)
+    cache.put('aa01', 'result', source)
+    cache.put('bb01', 'result', source)
+    os.utime(os.path.join(directory, 'aa', 'aa01'), (1, 1))
+
+    # Least recently used entry on disk is evicted when the cache no longer fits in the limit
+    cache = ArtifactCache(directory, 150)
+
+    assert not cache.get('aa01', 'result', str(tmp_path / 'restored'))
+    assert not os.path.exists(os.path.join(directory, 'aa', 'aa01'))
+    assert cache.get('bb01', 'result', str(tmp_path / 'restored'))
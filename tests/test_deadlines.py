@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
+from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.utils import deadlines
+
+
+@pytest.fixture(autouse=True)
+def no_deadline():
+    yield
+    deadlines.activate(None)
+
+
+def test_parses_iso_times():
+    assert deadlines.parse('2026-01-02T03:04:05Z') == deadlines.parse('2026-01-02T05:04:05+02:00')
+    assert deadlines.parse('2026-01-02T03:04:05') == deadlines.parse('2026-01-02T03:04:05+00:00')
+    assert deadlines.parse(None) is None
+
+
+def test_ignores_malformed_deadlines():
+    assert deadlines.parse('tomorrow') is None
+    assert deadlines.parse(3600) is None
+
+
+def test_request_timeout_is_positive_close_to_the_deadline():
+    assert deadlines.request_timeout() is None
+
+    deadlines.activate(time.time() - 1)
+    assert deadlines.request_timeout() == deadlines.MIN_REQUEST_TIMEOUT
+
+    deadlines.activate(time.time() + 60)
+    assert 59 < deadlines.request_timeout() <= 60
+
+
+def test_check_raises_past_the_deadline():
+    deadlines.check('mt')
+
+    deadlines.activate(time.time() + 60)
+    deadlines.check('mt')
+
+    deadlines.activate(time.time() - 1)
+    with pytest.raises(FileTranslationException) as error:
+        deadlines.check('mt')
+
+    assert error.value.error_type == FileTranslationSubstatus.DEADLINE_EXCEEDED
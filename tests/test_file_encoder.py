@@ -0,0 +1,53 @@
+import codecs
+
+from tildemt.utils.file_encoder import DETECTION_SAMPLE_SIZE, FileEncoder
+
+
+def write(tmp_path, content):
+    path = tmp_path / 'source.txt'
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_detects_byte_order_marks(tmp_path):
+    assert FileEncoder().get_encoding(write(tmp_path, codecs.BOM_UTF8 + 'ā'.encode('utf-8')))[0] == 'utf-8-sig'
+    assert FileEncoder().get_encoding(write(tmp_path, 'ā b c'.encode('utf-16')))[0] == 'utf-16'
+
+
+def test_detects_utf16_without_byte_order_mark(tmp_path):
+    assert FileEncoder().get_encoding(write(tmp_path, 'Hello world'.encode('utf-16-le')))[0] == 'utf-16-le'
+
+
+def test_detects_ascii_and_utf8(tmp_path):
+    assert FileEncoder().get_encoding(write(tmp_path, b'plain text\n'))[0] == 'us-ascii'
+    assert FileEncoder().get_encoding(write(tmp_path, 'garumzīmes\n'.encode('utf-8')))[0] == 'utf-8'
+
+
+def test_falls_back_to_codepage_of_the_language(tmp_path):
+    path = write(tmp_path, 'garumzīmes\n'.encode('windows-1257'))
+
+    assert FileEncoder().get_encoding(path, 'lv') == ('windows-1257', True)
+
+    with FileEncoder().open(path, 'lv')[0] as file:
+        assert file.read() == 'garumzīmes\n'
+
+
+def test_decodes_codepage_bytes_after_ascii_sample(tmp_path):
+    prefix = b'ascii line\r\n' * (DETECTION_SAMPLE_SIZE // 12 + 1)
+    path = write(tmp_path, prefix + 'garumzīmes\n'.encode('windows-1257') + 'utf-8 ā\n'.encode('utf-8'))
+
+    file, encoding = FileEncoder().open(path, 'lv')
+    with file:
+        lines = file.readlines()
+
+    assert encoding == 'utf-8'
+    assert lines[0] == 'ascii line\r\n'
+    assert lines[-2:] == ['garumzīmes\n', 'utf-8 ā\n']
+
+
+def test_replaces_invalid_bytes_without_language(tmp_path):
+    prefix = b'a' * DETECTION_SAMPLE_SIZE
+    path = write(tmp_path, prefix + b'\xe2x\n')
+
+    with FileEncoder().open(path)[0] as file:
+        assert file.read()[len(prefix):] == '�x\n'
@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from tildemt.services.file_translation_service import FileTranslationService
+from tildemt.utils import deadlines
+
+CONTENT = b'Hello world\n'
+
+METADATA = {
+    'segments': 0,
+    'translatedSegments': 0,
+    'status': None,
+    'substatus': None,
+    'domain': None,
+    'files': [{'id': 'source', 'category': 'Source', 'extension': '.txt', 'size': len(CONTENT)}]
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self): # pylint: disable=invalid-name
+        if self.path == '/file/slow':
+            time.sleep(3)
+
+        if self.path in ('/file/task', '/file/slow'):
+            self.send_content(json.dumps(METADATA).encode('utf-8'))
+        else:
+            self.send_content(CONTENT)
+
+    def do_PUT(self): # pylint: disable=invalid-name
+        update = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        # Update response does not list the files of the task
+        self.send_content(json.dumps(update).encode('utf-8'))
+
+    def send_content(self, content):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def storage_url(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('FILE_TRANSLATION_SERVICE_URL', f'http://127.0.0.1:{server.server_address[1]}')
+    monkeypatch.setenv('FILE_TRANSLATION_SERVICE_USER', 'worker')
+    monkeypatch.setenv('FILE_TRANSLATION_SERVICE_PASS', 'secret')
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetches_files_missing_from_updated_metadata(tmp_path, storage_url):
+    service = FileTranslationService('task')
+    service.update_metadata({'status': 'Initializing'})
+
+    file_path, storage_name, _ = service.download_source_file(str(tmp_path))
+
+    assert storage_name == 'Source.txt'
+    assert open(file_path, 'rb').read() == CONTENT
+
+
+def test_requests_do_not_outlast_the_deadline(storage_url):
+    deadlines.activate(time.time() + 0.5)
+    try:
+        with pytest.raises(requests.exceptions.Timeout):
+            FileTranslationService('slow').get_metadata()
+    finally:
+        deadlines.activate(None)
@@ -0,0 +1,194 @@
+import zipfile
+
+import pytest
+from lxml import etree
+
+from tildemt.file_translator.ooxml import DRAWING_NS, WORDPROCESSING_NS, OOXMLDocument, OOXMLUnsupportedError
+
+W = f'{{{WORDPROCESSING_NS}}}'
+A = f'{{{DRAWING_NS}}}'
+NAMESPACES = (
+    f'xmlns:w="{WORDPROCESSING_NS}" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+)
+
+
+def make_docx(tmp_path, body, parts=None):
+    """Writes DOCX document with the body and other 'parts' by name"""
+    path = str(tmp_path / 'source.docx')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        archive.writestr(
+            'word/document.xml',
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<w:document {NAMESPACES}><w:body>{body}</w:body></w:document>'
+        )
+        for name, content in (parts or {}).items():
+            archive.writestr(name, content)
+    return path
+
+
+def translate(tmp_path, body, translate_segment=lambda segment: segment):
+    """Extracts segments of the document, merges their translations and returns segments and translated body"""
+    source = make_docx(tmp_path, body)
+    document = OOXMLDocument(source, 'docx')
+    segments = document.extract()
+    document.merge([translate_segment(segment) for segment in segments])
+
+    target = str(tmp_path / 'target.docx')
+    document.save(target)
+    with zipfile.ZipFile(target) as archive:
+        root = etree.fromstring(archive.read('word/document.xml'))
+
+    return segments, root.find(f'{W}body')
+
+
+def text_of(element):
+    return ''.join(text.text or '' for text in element.iter(f'{W}t'))
+
+
+def test_plain_runs_round_trip(tmp_path):
+    segments, body = translate(
+        tmp_path,
+        '<w:p><w:pPr><w:jc w:val="center"/></w:pPr><w:r><w:t xml:space="preserve">Hello </w:t></w:r>'
+        '<w:r><w:rPr><w:b/></w:rPr><w:t>bold</w:t></w:r><w:r><w:t xml:space="preserve"> world</w:t></w:r></w:p>'
+    )
+
+    assert segments == ['Hello <g id="1">bold</g> world']
+
+    paragraph = body.find(f'{W}p')
+    assert paragraph[0].tag == f'{W}pPr'
+    assert text_of(paragraph) == 'Hello bold world'
+    assert paragraph.find(f'{W}r/{W}rPr/{W}b') is not None
+
+
+def test_hints_and_range_markers_are_not_placeholders(tmp_path):
+    segments, body = translate(
+        tmp_path,
+        '<w:p><w:r><w:t xml:space="preserve">One </w:t></w:r><w:bookmarkStart w:id="0" w:name="mark"/>'
+        '<w:proofErr w:type="spellStart"/><w:r><w:lastRenderedPageBreak/><w:t>twoo</w:t></w:r>'
+        '<w:proofErr w:type="spellEnd"/><w:bookmarkEnd w:id="0"/><w:r><w:t xml:space="preserve"> three</w:t></w:r></w:p>',
+        lambda segment: segment.upper()
+    )
+
+    assert segments == ['One twoo three']
+
+    paragraph = body.find(f'{W}p')
+    assert text_of(paragraph) == 'ONE TWOO THREE'
+    assert paragraph.find(f'{W}bookmarkStart').get(f'{W}name') == 'mark'
+    assert paragraph.find(f'{W}bookmarkEnd') is not None
+    assert paragraph.find(f'{W}proofErr') is None
+    assert next(paragraph.iter(f'{W}lastRenderedPageBreak'), None) is None
+
+
+def test_tabs_and_breaks_stay_inline_objects(tmp_path):
+    segments, body = translate(tmp_path, '<w:p><w:r><w:t>Name</w:t><w:tab/><w:t>Value</w:t></w:r></w:p>')
+
+    assert segments == ['Name<x id="1"/>Value']
+    assert [element.tag for element in body.find(f'{W}p/{W}r')] == [f'{W}t', f'{W}tab', f'{W}t']
+
+
+def test_hyperlink_runs_are_nested_runs(tmp_path):
+    segments, body = translate(
+        tmp_path,
+        '<w:p><w:r><w:t xml:space="preserve">Visit </w:t></w:r><w:hyperlink r:id="rId5">'
+        '<w:r><w:rPr><w:rStyle w:val="Hyperlink"/></w:rPr><w:t>our site</w:t></w:r></w:hyperlink>'
+        '<w:r><w:t xml:space="preserve"> today</w:t></w:r></w:p>',
+        lambda segment: segment.replace('Visit', 'Apmeklē').replace('our site', 'mūsu vietni')
+    )
+
+    assert segments == ['Visit <g id="1">our site</g> today']
+
+    hyperlink = body.find(f'{W}p/{W}hyperlink')
+    assert hyperlink.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id') == 'rId5'
+    assert text_of(hyperlink) == 'mūsu vietni'
+    assert hyperlink.find(f'{W}r/{W}rPr/{W}rStyle') is not None
+    assert text_of(body) == 'Apmeklē mūsu vietni today'
+
+
+def test_tracked_insertions_and_content_controls_are_nested_runs(tmp_path):
+    segments, body = translate(
+        tmp_path,
+        '<w:p><w:r><w:t xml:space="preserve">Signed by </w:t></w:r>'
+        '<w:ins w:id="1" w:author="A"><w:r><w:t>John</w:t></w:r></w:ins>'
+        '<w:sdt><w:sdtPr><w:alias w:val="Date"/></w:sdtPr><w:sdtContent>'
+        '<w:r><w:t xml:space="preserve"> today</w:t></w:r></w:sdtContent></w:sdt></w:p>'
+    )
+
+    assert segments == ['Signed by <g id="1">John</g><g id="2"> today</g>']
+
+    paragraph = body.find(f'{W}p')
+    assert text_of(paragraph.find(f'{W}ins')) == 'John'
+    assert paragraph.find(f'{W}ins').get(f'{W}author') == 'A'
+    assert paragraph.find(f'{W}sdt/{W}sdtPr/{W}alias') is not None
+    assert text_of(paragraph.find(f'{W}sdt/{W}sdtContent')) == ' today'
+
+
+def test_words_split_in_runs_are_merged(tmp_path):
+    segments, body = translate(
+        tmp_path,
+        '<w:p><w:r><w:rPr><w:lang w:val="en-US"/></w:rPr><w:t>Trans</w:t></w:r>'
+        '<w:r><w:rPr><w:lang w:val="en-GB"/></w:rPr><w:t xml:space="preserve">lation memory</w:t></w:r></w:p>'
+    )
+
+    assert segments == ['Translation memory']
+    assert text_of(body) == 'Translation memory'
+
+
+def test_superscript_is_not_merged_into_words(tmp_path):
+    segments, _ = translate(
+        tmp_path,
+        '<w:p><w:r><w:t>m</w:t></w:r><w:r><w:rPr><w:vertAlign w:val="superscript"/></w:rPr><w:t>2</w:t></w:r></w:p>'
+    )
+
+    assert segments == ['m<g id="1">2</g>']
+
+
+def test_text_in_unknown_containers_is_unsupported(tmp_path):
+    source = make_docx(tmp_path, '<w:p><w:customTag><w:r><w:t>Text</w:t></w:r></w:customTag></w:p>')
+
+    with pytest.raises(OOXMLUnsupportedError):
+        OOXMLDocument(source, 'docx').extract()
+
+
+@pytest.mark.parametrize('name, content, text_tag', [
+    (
+        'word/charts/chart1.xml',
+        f'<c:chartSpace xmlns:c="http://schemas.openxmlformats.org/drawingml/2006/chart" xmlns:a="{DRAWING_NS}">'
+        '<c:chart><c:title><c:tx><c:rich><a:p><a:r><a:t>Chart title</a:t></a:r></a:p></c:rich></c:tx></c:title>'
+        '</c:chart></c:chartSpace>',
+        f'{A}t'
+    ),
+    (
+        'word/diagrams/data1.xml',
+        f'<dgm:dataModel xmlns:dgm="http://schemas.openxmlformats.org/drawingml/2006/diagram" xmlns:a="{DRAWING_NS}">'
+        '<dgm:ptLst><dgm:pt modelId="1"><dgm:t><a:p><a:r><a:t>Chart title</a:t></a:r></a:p></dgm:t></dgm:pt>'
+        '</dgm:ptLst></dgm:dataModel>',
+        f'{A}t'
+    ),
+    (
+        'word/diagrams/drawing1.xml',
+        f'<dsp:drawing xmlns:dsp="http://schemas.microsoft.com/office/drawing/2008/diagram" xmlns:a="{DRAWING_NS}">'
+        '<dsp:spTree><dsp:sp><dsp:txBody><a:p><a:r><a:t>Chart title</a:t></a:r></a:p></dsp:txBody></dsp:sp>'
+        '</dsp:spTree></dsp:drawing>',
+        f'{A}t'
+    ),
+    (
+        'word/glossary/document.xml',
+        f'<w:glossaryDocument {NAMESPACES}><w:docParts><w:docPart><w:docPartBody>'
+        '<w:p><w:r><w:t>Chart title</w:t></w:r></w:p></w:docPartBody></w:docPart></w:docParts></w:glossaryDocument>',
+        f'{W}t'
+    ),
+])
+def test_text_of_charts_diagrams_and_glossary_is_translated(tmp_path, name, content, text_tag):
+    source = make_docx(tmp_path, '<w:p><w:r><w:t>Body text</w:t></w:r></w:p>', {name: content})
+    document = OOXMLDocument(source, 'docx')
+    segments = document.extract()
+    document.merge([segment.upper() for segment in segments])
+
+    target = str(tmp_path / 'target.docx')
+    document.save(target)
+
+    assert sorted(segments) == ['Body text', 'Chart title']
+    with zipfile.ZipFile(target) as archive:
+        assert [text.text for text in etree.fromstring(archive.read(name)).iter(text_tag)] == ['CHART TITLE']
@@ -0,0 +1,33 @@
+import json
+import tracemalloc
+
+from tildemt.utils.profiler import JobProfiler
+
+
+def test_memory_tracing_stops_with_the_last_profiled_job(tmp_path):
+    first = JobProfiler(str(tmp_path / 'first'))
+    second = JobProfiler(str(tmp_path / 'second'))
+
+    first.start('download')
+    second.start('download')
+    first.stop({'download': 1})
+
+    assert tracemalloc.is_tracing()
+
+    second.stop({'download': 2})
+
+    assert not tracemalloc.is_tracing()
+    assert (tmp_path / 'first' / 'memory.snapshot').exists()
+    assert json.loads((tmp_path / 'second' / 'summary.json').read_text())['download']['seconds'] == 2
+
+
+def test_keeps_memory_tracing_started_elsewhere(tmp_path):
+    tracemalloc.start()
+    try:
+        profiler = JobProfiler(str(tmp_path))
+        profiler.start()
+        profiler.stop({})
+
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,63 @@
+import threading
+import zipfile
+
+from tildemt.enums.admission_decision import AdmissionDecision
+from tildemt.utils import resource_budget
+from tildemt.utils.resource_budget import ResourceBudget, ResourceEstimate, estimate_resources
+
+MB = 1024 * 1024
+
+
+def test_rejects_jobs_exceeding_the_budget(tmp_path):
+    budget = ResourceBudget(100 * MB, None, str(tmp_path))
+
+    assert budget.reserve(ResourceEstimate(memory=200 * MB, disk=0)) == AdmissionDecision.REJECT
+
+
+def test_defers_jobs_only_while_other_jobs_hold_reservations(tmp_path, monkeypatch):
+    monkeypatch.setattr(resource_budget, 'get_available_memory', lambda: 50 * MB)
+    budget = ResourceBudget(100 * MB, None, str(tmp_path))
+
+    # Memory used by other processes can't be released by waiting for jobs of the worker
+    assert budget.reserve(ResourceEstimate(memory=60 * MB, disk=0)) == AdmissionDecision.ADMIT
+    assert budget.reserve(ResourceEstimate(memory=45 * MB, disk=0)) == AdmissionDecision.DEFER
+
+    budget.release(ResourceEstimate(memory=60 * MB, disk=0))
+    assert budget.reserve(ResourceEstimate(memory=45 * MB, disk=0)) == AdmissionDecision.ADMIT
+
+
+def test_waits_for_other_jobs_instead_of_deferring(tmp_path):
+    budget = ResourceBudget(100 * MB, None, str(tmp_path))
+    reservation = ResourceEstimate(memory=80 * MB, disk=0)
+    assert budget.reserve(reservation) == AdmissionDecision.ADMIT
+
+    timer = threading.Timer(0.1, budget.release, [reservation])
+    timer.start()
+
+    assert budget.reserve(ResourceEstimate(memory=50 * MB, disk=0), wait=True) == AdmissionDecision.ADMIT
+    timer.join()
+
+
+def test_replaces_previous_reservation(tmp_path):
+    budget = ResourceBudget(100 * MB, None, str(tmp_path))
+    other = ResourceEstimate(memory=40 * MB, disk=0)
+    previous = ResourceEstimate(memory=40 * MB, disk=0)
+    assert budget.reserve(other) == AdmissionDecision.ADMIT
+    assert budget.reserve(previous) == AdmissionDecision.ADMIT
+
+    assert budget.reserve(ResourceEstimate(memory=60 * MB, disk=0), previous) == AdmissionDecision.ADMIT
+
+
+def test_estimates_archive_content_before_download(tmp_path):
+    archive_path = tmp_path / 'document.docx'
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('word/document.xml', '<w:t>text</w:t>' * 10000)
+
+    file_size = archive_path.stat().st_size
+    assumed = estimate_resources('docx', file_size)
+    known = estimate_resources('docx', file_size, str(archive_path))
+
+    assert assumed.memory == file_size * resource_budget.ARCHIVE_XML_RATIO * resource_budget.DEFAULT_MEMORY_FACTOR
+    assert known.memory == 150000 * resource_budget.DEFAULT_MEMORY_FACTOR
+    assert ResourceBudget(MB, None, str(tmp_path)).limit(ResourceEstimate(memory=2 * MB, disk=MB)) == \
+        ResourceEstimate(memory=MB, disk=MB)
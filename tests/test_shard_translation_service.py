@@ -0,0 +1,107 @@
+import concurrent.futures
+import json
+
+import pytest
+
+from tildemt.services import shard_translation_service, translation_fixture
+from tildemt.services.shard_translation_service import ShardTranslationService
+from tildemt.services.text_translation_service import TextTranslationService
+
+METADATA = {'id': 'task', 'srcLang': 'en', 'trgLang': 'lv'}
+
+
+class Publisher():
+    """Translates published shards immediately, shards listed in 'failing' fail,
+    shards listed in 'unpublished' can't be published"""
+    def __init__(self, failing=(), unpublished=()):
+        self.failing = failing
+        self.unpublished = unpublished
+        self.published = []
+
+    def __call__(self, message_body):
+        if message_body['shard'] in self.unpublished:
+            raise ConnectionError("Connection closed")
+
+        self.published.append(message_body['shard'])
+
+        future = concurrent.futures.Future()
+        if message_body['shard'] in self.failing:
+            future.set_result({'error': 'Failed'})
+        else:
+            future.set_result({'translations': [f'shard:{segment}' for segment in message_body['segments']]})
+
+        return future
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    monkeypatch.setattr(shard_translation_service, 'SHARD_SEGMENTS', 2)
+    monkeypatch.setattr(shard_translation_service, 'SHARD_PUBLISH_AHEAD', 2)
+
+    publisher = Publisher()
+    shard_translation_service.set_shard_publisher(publisher)
+    yield publisher
+    shard_translation_service.set_shard_publisher(None)
+
+
+def translate(segments, fixture_name=None):
+    service = ShardTranslationService(TextTranslationService('en', 'lv', 'general', fixture_name), METADATA)
+    return service.translate(segments)
+
+
+def test_publishes_shards_ahead_of_collected_translations(translation_api, publisher):
+    read_segments = []
+
+    def read():
+        for index in range(10):
+            read_segments.append(index)
+            yield f'segment {index}'
+
+    translations = translate(read())
+
+    assert next(translations) == {'translation': 'SEGMENT 0'}
+    assert publisher.published == [1, 2]
+    assert len(read_segments) == 6
+
+    assert [result['translation'] for result in translations] == [
+        'SEGMENT 1', 'shard:segment 2', 'shard:segment 3', 'shard:segment 4', 'shard:segment 5',
+        'shard:segment 6', 'shard:segment 7', 'shard:segment 8', 'shard:segment 9'
+    ]
+    assert publisher.published == [1, 2, 3, 4]
+
+
+def test_translates_failed_shards_locally(translation_api, publisher):
+    publisher.failing = (1, 3)
+
+    translations = [result['translation'] for result in translate(f'segment {index}' for index in range(9))]
+
+    assert translations == [
+        'SEGMENT 0', 'SEGMENT 1', 'SEGMENT 2', 'SEGMENT 3', 'shard:segment 4', 'shard:segment 5',
+        'SEGMENT 6', 'SEGMENT 7', 'shard:segment 8'
+    ]
+
+
+def test_translates_shards_failed_to_publish_locally(translation_api, publisher):
+    publisher.unpublished = (2,)
+
+    translations = [result['translation'] for result in translate(f'segment {index}' for index in range(8))]
+
+    assert translations == [
+        'SEGMENT 0', 'SEGMENT 1', 'shard:segment 2', 'shard:segment 3', 'SEGMENT 4', 'SEGMENT 5',
+        'shard:segment 6', 'shard:segment 7'
+    ]
+    assert publisher.published == [1, 3]
+
+
+def test_records_requests_of_failed_shards_to_the_fixture(tmp_path, monkeypatch, translation_api, publisher):
+    monkeypatch.setattr(translation_fixture, 'MT_RECORD_DIR', str(tmp_path))
+    publisher.failing = (2,)
+
+    list(translate((f'segment {index}' for index in range(8)), 'fixture'))
+
+    with open(tmp_path / 'fixture.json', 'r', encoding='utf-8') as fixture_file:
+        requests = json.load(fixture_file)['requests']
+
+    assert sorted(request['request']['text'] for request in requests) == [
+        ['segment 0', 'segment 1'], ['segment 4', 'segment 5']
+    ]
@@ -0,0 +1,59 @@
+import pytest
+
+from tildemt.services import text_translation_service
+from tildemt.services.text_translation_service import LatencyModel, TextTranslationService
+
+PAIR = ('en', 'lv')
+
+
+def test_estimates_characters_of_unseen_language_pairs():
+    assert LatencyModel().estimate(PAIR, 120) == 120
+
+
+def test_estimates_latency_from_linear_regression():
+    latency_model = LatencyModel(decay=1)
+    for characters in (100, 200, 300, 400):
+        latency_model.observe(PAIR, characters, 0.5 + characters / 100)
+
+    assert latency_model.estimate(PAIR, 250) == pytest.approx(3)
+    assert latency_model.estimate(('en', 'et'), 250) == 250
+
+
+def test_estimates_latency_in_proportion_to_characters_of_similar_batches():
+    latency_model = LatencyModel(decay=1)
+    latency_model.observe(PAIR, 500, 2)
+    latency_model.observe(PAIR, 500, 3)
+
+    assert latency_model.estimate(PAIR, 250) == pytest.approx(1.25)
+
+
+def test_recent_requests_outweigh_older_ones():
+    latency_model = LatencyModel(decay=0.5)
+    for seconds in (10, 10, 1, 1, 1, 1):
+        latency_model.observe(PAIR, 500, seconds)
+
+    assert latency_model.estimate(PAIR, 500) < 2
+
+
+def test_sends_longest_batches_of_the_window_first(translation_api, monkeypatch):
+    monkeypatch.setattr(text_translation_service, 'MT_CONCURRENCY', 1)
+    monkeypatch.setattr(text_translation_service, 'LATENCY_MODEL', LatencyModel())
+    # Each segment is a batch of its own
+    segments = [character * length for character, length in zip('abcdef', (300, 400, 350, 450, 260, 270))]
+
+    translations = TextTranslationService('en', 'lv', 'general').translate(segments)
+
+    assert [result['translation'] for result in translations] == [segment.upper() for segment in segments]
+    assert [batch[0][0] for batch in translation_api.requests[:4]] == ['d', 'b', 'c', 'a']
+    assert sorted(batch[0][0] for batch in translation_api.requests) == list('abcdef')
+
+
+def test_concurrent_batches_are_returned_in_document_order(translation_api, monkeypatch):
+    monkeypatch.setattr(text_translation_service, 'MT_CONCURRENCY', 3)
+    monkeypatch.setattr(text_translation_service, 'LATENCY_MODEL', LatencyModel())
+    translation_api.latency = 0.0001
+    segments = [f'{index} ' * length for index, length in enumerate((50, 150, 100, 200, 60, 120, 80, 40))]
+
+    translations = TextTranslationService('en', 'lv', 'general').translate(segments)
+
+    assert [result['translation'] for result in translations] == [segment.upper() for segment in segments]
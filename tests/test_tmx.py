@@ -0,0 +1,75 @@
+from lxml import etree
+
+from tildemt.file_translator.tmx_markup import XML_LANG
+from tildemt.file_translator.types.tmx import TMXTranslator
+
+METADATA = {'srcLang': 'en', 'trgLang': 'lv', 'domain': 'general', 'extension': 'tmx'}
+
+DOCUMENT = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE tmx SYSTEM "tmx14.dtd">
+<!-- Exported translation memory -->
+<tmx version="1.4">
+  <header srclang="en-US" datatype="plaintext"/>
+  <body>
+    <tu>
+      <tuv xml:lang="en-US"><seg>Hello <bpt i="1">&lt;b&gt;</bpt>world<ept i="1">&lt;/b&gt;</ept></seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="en-US"><seg>Already translated</seg></tuv>
+      <tuv xml:lang="lv-LV"><seg>Jau iztulkots</seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="en-US"><seg> Spaced text </seg></tuv>
+      <tuv xml:lang="lv-LV"><seg></seg></tuv>
+    </tu>
+  </body>
+</tmx>
+'''
+
+
+def translate(tmp_path, document):
+    source_path = tmp_path / 'source.tmx'
+    source_path.write_text(document, encoding='utf-8')
+    target_path = tmp_path / 'target.tmx'
+
+    TMXTranslator(dict(METADATA)).translate(str(source_path), str(target_path))
+
+    return target_path
+
+
+def get_segments(tree, language):
+    return [
+        (tuv.get(XML_LANG), etree.tostring(tuv.find('seg'), encoding='unicode', with_tail=False))
+        for tuv in tree.iterfind('body/tu/tuv')
+        if tuv.get(XML_LANG).startswith(language)
+    ]
+
+
+def test_keeps_doctype_and_prolog(tmp_path, translation_api):
+    target_path = translate(tmp_path, DOCUMENT)
+    tree = etree.parse(str(target_path))
+
+    assert tree.docinfo.doctype == '<!DOCTYPE tmx SYSTEM "tmx14.dtd">'
+    assert tree.getroot().getprevious().text == ' Exported translation memory '
+
+
+def test_translates_units_without_target_segments(tmp_path, translation_api):
+    tree = etree.parse(str(translate(tmp_path, DOCUMENT)))
+
+    # Language code used in the document is not known yet when the first unit is translated
+    assert get_segments(tree, 'lv') == [
+        ('lv', '<seg>HELLO <bpt i="1">&lt;b&gt;</bpt>WORLD<ept i="1">&lt;/b&gt;</ept></seg>'),
+        ('lv-LV', '<seg>Jau iztulkots</seg>'),
+        ('lv-LV', '<seg> SPACED TEXT </seg>'),
+    ]
+    assert translation_api.requests == [['Hello <g id="1">world</g>', 'Spaced text']]
+
+
+def test_copies_document_without_units_to_translate(tmp_path, translation_api):
+    document = DOCUMENT.replace('Hello <bpt i="1">&lt;b&gt;</bpt>world<ept i="1">&lt;/b&gt;</ept>', ' ') \
+        .replace('<seg> Spaced text </seg>', '<seg> </seg>')
+    tree = etree.parse(str(translate(tmp_path, document)))
+
+    assert tree.docinfo.doctype == '<!DOCTYPE tmx SYSTEM "tmx14.dtd">'
+    assert get_segments(tree, 'lv') == [('lv-LV', '<seg>Jau iztulkots</seg>'), ('lv-LV', '<seg/>')]
+    assert not translation_api.requests
@@ -0,0 +1,91 @@
+from tildemt.file_translator.translation_memory import TranslationMemory
+from tildemt.services.pretranslation_service import PretranslationService
+from tildemt.services.text_translation_service import TextTranslationService
+
+MEMORY = '''<?xml version="1.0" encoding="UTF-8"?>
+<tmx version="1.4">
+  <header srclang="en-US"/>
+  <body>
+    <tu>
+      <tuv xml:lang="en-US"><seg>The cat sat on the mat.</seg></tuv>
+      <tuv xml:lang="lv-LV"><seg>Kaķis sēdēja uz paklāja.</seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="en"><seg>Press  the   button</seg></tuv>
+      <tuv xml:lang="lv"><seg>Nospiediet pogu</seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="en"><seg>Save <bpt i="1">&lt;b&gt;</bpt>all<ept i="1">&lt;/b&gt;</ept></seg></tuv>
+      <tuv xml:lang="lv"><seg>Saglabāt <bpt i="1">&lt;b&gt;</bpt>visu<ept i="1">&lt;/b&gt;</ept></seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="en"><seg>Press the button</seg></tuv>
+      <tuv xml:lang="lv"><seg>Spiediet pogu</seg></tuv>
+    </tu>
+  </body>
+</tmx>
+'''
+
+
+def load(tmp_path, fuzzy_threshold=1):
+    path = tmp_path / 'memory.tmx'
+    path.write_text(MEMORY, encoding='utf-8')
+
+    translation_memory = TranslationMemory(fuzzy_threshold)
+    translation_memory.load(str(path), 'en', 'lv')
+    return translation_memory
+
+
+def test_exact_matches_ignore_whitespace(tmp_path):
+    translation_memory = load(tmp_path)
+
+    assert len(translation_memory) == 2
+    assert translation_memory.lookup('The cat sat on the mat.') == 'Kaķis sēdēja uz paklāja.'
+    # Later units replace earlier ones
+    assert translation_memory.lookup(' Press the\tbutton ') == 'Spiediet pogu'
+    assert translation_memory.lookup('The cat sat on the mat!') is None
+
+
+def test_segments_with_tags_are_not_matched(tmp_path):
+    translation_memory = load(tmp_path)
+
+    assert translation_memory.lookup('Save <g id="1">all</g>') is None
+    assert translation_memory.lookup('Save all') is None
+
+
+def test_fuzzy_matches_above_threshold(tmp_path):
+    translation_memory = load(tmp_path, fuzzy_threshold=0.9)
+
+    assert translation_memory.lookup('The cat sat on the mat!') == 'Kaķis sēdēja uz paklāja.'
+    assert translation_memory.lookup('The dog slept under the table.') is None
+    assert load(tmp_path).lookup('The cat sat on the mat!') is None
+
+
+def test_pretranslated_segments_keep_document_order(tmp_path, translation_api):
+    service = PretranslationService(TextTranslationService('en', 'lv', 'general'), load(tmp_path))
+
+    translations = service.translate([
+        'Press the button',
+        'Open the file',
+        'The cat sat on the mat.',
+        'Press the button',
+        'Close the file',
+    ])
+
+    assert [result['translation'] for result in translations] == [
+        'Spiediet pogu',
+        'OPEN THE FILE',
+        'Kaķis sēdēja uz paklāja.',
+        'Spiediet pogu',
+        'CLOSE THE FILE',
+    ]
+    assert translation_api.requests == [['Open the file', 'Close the file']]
+
+
+def test_fully_matched_segments_are_not_sent_to_translation(tmp_path, translation_api):
+    service = PretranslationService(TextTranslationService('en', 'lv', 'general'), load(tmp_path))
+
+    translations = service.translate(['Press the button', 'The cat sat on the mat.'])
+
+    assert [result['translation'] for result in translations] == ['Spiediet pogu', 'Kaķis sēdēja uz paklāja.']
+    assert not translation_api.requests
@@ -0,0 +1,173 @@
+import glob
+import json
+import os
+import threading
+import zipfile
+
+from tildemt import translator as translator_module
+from tildemt.enums.admission_decision import AdmissionDecision
+from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
+from tildemt.enums.file_translation_status_type import FileTranslationStatusType
+from tildemt.services.local_file_translation_service import LocalFileTranslationService
+from tildemt.translator import Translator
+from tildemt.utils.artifact_cache import ArtifactCache
+from tildemt.utils.resource_budget import ResourceBudget, ResourceEstimate
+
+MB = 1024 * 1024
+
+S = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+
+class SlowUploadService(LocalFileTranslationService):
+    """Local service holding the upload of the translated file until 'upload' is set"""
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.upload = threading.Event()
+
+    def upload_file(self, file_path, file_type):
+        self.upload.wait(10)
+        super().upload_file(file_path, file_type)
+
+
+def test_job_finishes_after_background_upload(tmp_path, translation_api, monkeypatch):
+    monkeypatch.setattr(translator_module, 'RESULT_CACHE', None)
+    source_path = tmp_path / 'source.txt'
+    source_path.write_text('Hello world\n', encoding='utf-8')
+    target_path = tmp_path / 'target.txt'
+    service = SlowUploadService('task', str(source_path), str(target_path), 'en', 'lv', 'general')
+
+    translator = Translator('task', file_translation_service=service)
+    translator.temp_dir = str(tmp_path / 'temp')
+
+    assert translator.translate()
+    assert not translator.finished.done()
+
+    service.upload.set()
+    translator.finished.result(10)
+
+    assert service.metadata['status'] == FileTranslationStatusType.SUCCEEDED.value
+    assert target_path.read_text(encoding='utf-8') == 'HELLO WORLD\n'
+
+
+def test_background_upload_keeps_only_disk_reservation(tmp_path, translation_api, monkeypatch):
+    budget = ResourceBudget(MB, MB, str(tmp_path))
+    monkeypatch.setattr(translator_module, 'RESOURCE_BUDGET', budget)
+    monkeypatch.setattr(translator_module, 'RESULT_CACHE', None)
+    source_path = tmp_path / 'source.txt'
+    source_path.write_text('Hello world\n', encoding='utf-8')
+    service = SlowUploadService('task', str(source_path), str(tmp_path / 'target.txt'), 'en', 'lv', 'general')
+
+    translator = Translator('task', file_translation_service=service)
+    translator.temp_dir = str(tmp_path / 'temp')
+
+    assert translator.translate()
+    assert not translator.finished.done()
+
+    # Memory of the uploading job is free for the next job, its disk space is not
+    assert budget.reserve(ResourceEstimate(memory=MB, disk=0)) == AdmissionDecision.ADMIT
+    assert budget.reserve(ResourceEstimate(memory=0, disk=MB)) == AdmissionDecision.DEFER
+    budget.release(ResourceEstimate(memory=MB, disk=0))
+
+    service.upload.set()
+    translator.finished.result(10)
+
+    assert budget.reserve(ResourceEstimate(memory=MB, disk=MB)) == AdmissionDecision.ADMIT
+
+
+def translate(tmp_path, source_path, task='task', domain=None):
+    """Translates the source file with a local service, returns metadata of the document and the target path"""
+    target_path = tmp_path / f'{task}{os.path.splitext(source_path)[1]}'
+    service = LocalFileTranslationService(task, str(source_path), str(target_path), 'en', 'lv', domain)
+
+    translator = Translator(task, file_translation_service=service)
+    translator.temp_dir = str(tmp_path / 'temp')
+    assert translator.translate()
+    translator.finished.result(10)
+
+    return service.metadata, target_path
+
+
+def test_stores_translation_of_a_document(tmp_path, translation_api, monkeypatch):
+    monkeypatch.setattr(translator_module, 'RESULT_CACHE', ArtifactCache(str(tmp_path / 'cache'), MB))
+    source_path = tmp_path / 'source.txt'
+    source_path.write_text('Hello world\nGood morning\n', encoding='utf-8')
+
+    metadata, _ = translate(tmp_path, source_path)
+
+    assert metadata['status'] == FileTranslationStatusType.SUCCEEDED.value
+    [result_metadata_path] = glob.glob(str(tmp_path / 'cache' / '*' / '*' / 'metadata'))
+    with open(result_metadata_path, 'r', encoding='utf-8') as result_metadata_file:
+        assert json.load(result_metadata_file) == {'segments': 2, 'translatedSegments': 2, 'domain': 'general'}
+
+    with open(os.path.join(os.path.dirname(result_metadata_path), 'result'), 'r', encoding='utf-8') as result_file:
+        assert result_file.read() == 'HELLO WORLD\nGOOD MORNING\n'
+
+
+def test_restores_translation_of_an_identical_document(tmp_path, translation_api, monkeypatch):
+    monkeypatch.setattr(translator_module, 'RESULT_CACHE', ArtifactCache(str(tmp_path / 'cache'), MB))
+    source_path = tmp_path / 'source.txt'
+    source_path.write_text('Hello world\nGood morning\n', encoding='utf-8')
+    translate(tmp_path, source_path, 'first')
+    requests = len(translation_api.requests)
+
+    metadata, target_path = translate(tmp_path, source_path, 'second')
+
+    assert len(translation_api.requests) == requests
+    assert metadata['status'] == FileTranslationStatusType.SUCCEEDED.value
+    # Segment count and the detected domain are restored together with the translation
+    assert metadata['segments'] == 2
+    assert metadata['translatedSegments'] == 2
+    assert metadata['domain'] == 'general'
+    assert target_path.read_text(encoding='utf-8') == 'HELLO WORLD\nGOOD MORNING\n'
+
+
+def make_xlsx(tmp_path, strings):
+    """Writes XLSX workbook with a worksheet referring to the shared 'strings'"""
+    path = tmp_path / 'source.xlsx'
+    cells = ''.join(f'<c r="A{index + 1}" t="s"><v>{index}</v></c>' for index in range(len(strings)))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        archive.writestr(
+            'xl/worksheets/sheet1.xml',
+            f'<worksheet xmlns="{S}"><sheetData><row>{cells}</row></sheetData></worksheet>'
+        )
+        archive.writestr(
+            'xl/sharedStrings.xml',
+            f'<sst xmlns="{S}">' + ''.join(f'<si><t>{string}</t></si>' for string in strings) + '</sst>'
+        )
+    return path
+
+
+def test_translates_shared_strings_of_a_workbook(tmp_path, translation_api, monkeypatch):
+    monkeypatch.setattr(translator_module, 'RESULT_CACHE', None)
+    source_path = make_xlsx(tmp_path, ['Hello world', 'Total', 'Hello world'])
+
+    metadata, target_path = translate(tmp_path, source_path)
+
+    assert metadata['status'] == FileTranslationStatusType.SUCCEEDED.value
+    # Identical strings are translated once
+    assert sorted(text for batch in translation_api.requests for text in batch) == ['Hello world', 'Total']
+
+    with zipfile.ZipFile(source_path) as source, zipfile.ZipFile(target_path) as target:
+        assert target.read('xl/worksheets/sheet1.xml') == source.read('xl/worksheets/sheet1.xml')
+        shared_strings = target.read('xl/sharedStrings.xml').decode('utf-8')
+
+    assert shared_strings.count('<t>HELLO WORLD</t>') == 2
+    assert '<t>TOTAL</t>' in shared_strings
+
+
+def test_rejects_workbooks_that_are_not_archives(tmp_path, translation_api, monkeypatch):
+    monkeypatch.setattr(translator_module, 'RESULT_CACHE', None)
+    source_path = tmp_path / 'source.xlsx'
+    source_path.write_bytes(b'Not a workbook')
+
+    target_path = tmp_path / 'target.xlsx'
+    service = LocalFileTranslationService('task', str(source_path), str(target_path), 'en', 'lv', 'general')
+    translator = Translator('task', file_translation_service=service)
+    translator.temp_dir = str(tmp_path / 'temp')
+    translator.translate()
+    translator.finished.result(10)
+
+    assert service.metadata['status'] == FileTranslationStatusType.ERROR.value
+    assert service.metadata['substatus'] == FileTranslationSubstatus.BAD_FILE.value
+    assert not translation_api.requests
@@ -0,0 +1,41 @@
+import pytest
+
+from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
+from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.file_translator.xlf_inline import XLFInlineTranslator
+
+METADATA = {'srcLang': 'en', 'trgLang': 'lv', 'domain': 'general', 'extension': 'txt'}
+
+
+def create_translator(events):
+    translator = XLFInlineTranslator(dict(METADATA))
+    translator.min_progress_report_interval = 0
+    translator.on_start += lambda: events.append('start')
+    translator.on_progress += lambda **progress: events.append(progress)
+    return translator
+
+
+def test_progress_reports_segments_read_with_translated_segments(translation_api):
+    events = []
+    translator = create_translator(events)
+
+    translator.translate_file(f'Line {index}\r\n' for index in range(5))
+
+    assert translator.target_segments == [f'LINE {index}\r\n' for index in range(5)]
+    assert events[0] == 'start'
+
+    progress = [event for event in events[1:] if 'seg_translated' in event]
+    assert progress[-1] == {'domain': 'general', 'seg_count': 5, 'seg_translated': 5}
+    assert all(0 < event['seg_translated'] <= event['seg_count'] for event in progress)
+    assert {'domain': 'general', 'seg_count': 5} in events
+
+
+def test_documents_without_segments_fail_before_translation_starts(translation_api):
+    events = []
+
+    with pytest.raises(FileTranslationException) as error:
+        create_translator(events).translate_file([])
+
+    assert error.value.error_type == FileTranslationSubstatus.NO_TEXT_EXTRACTED
+    assert not events
+    assert not translation_api.requests
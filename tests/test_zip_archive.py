@@ -0,0 +1,70 @@
+import zipfile
+
+import pytest
+
+from tildemt.utils import zip_archive
+
+MEMBERS = [
+    ('[Content_Types].xml', b'<Types/>' * 100, zipfile.ZIP_DEFLATED),
+    ('word/media/image1.png', bytes(range(256)) * 40, zipfile.ZIP_STORED),
+    ('word/document.xml', '<w:t>Garumzīmes</w:t>'.encode('utf-8') * 500, zipfile.ZIP_DEFLATED),
+]
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    path = tmp_path / 'source.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data, compress_type in MEMBERS:
+            item = zipfile.ZipInfo(name, date_time=(2024, 1, 2, 3, 4, 6))
+            item.compress_type = compress_type
+            archive.writestr(item, data)
+
+    return path
+
+
+def copy(source_path, target_path, copy_function):
+    with zipfile.ZipFile(source_path, 'r') as source:
+        with zipfile.ZipFile(target_path, 'w') as target:
+            for item in source.infolist():
+                copy_function(source, target, item)
+
+
+@pytest.mark.skipif(not zip_archive.RAW_COPY_SUPPORTED, reason="Raw copy is not supported by this Python version")
+def test_raw_copy_is_byte_for_byte(source_path, tmp_path):
+    target_path = tmp_path / 'target.zip'
+    copy(source_path, target_path, zip_archive.copy_raw_member)
+
+    assert target_path.read_bytes() == source_path.read_bytes()
+
+
+@pytest.mark.parametrize('copy_function', [zip_archive.copy_member, zip_archive.recompress_member])
+def test_copied_members_are_unchanged(source_path, tmp_path, copy_function):
+    target_path = tmp_path / 'target.zip'
+    copy(source_path, target_path, copy_function)
+
+    with zipfile.ZipFile(target_path, 'r') as target:
+        assert target.testzip() is None
+        assert [(item.filename, item.compress_type) for item in target.infolist()] == \
+            [(name, compress_type) for name, _, compress_type in MEMBERS]
+        assert [target.read(name) for name, _, _ in MEMBERS] == [data for _, data, _ in MEMBERS]
+
+
+def test_copies_members_written_with_data_descriptors(source_path, tmp_path):
+    # Members written to unseekable files have sizes and CRC in data descriptors after the data
+    streamed_path = tmp_path / 'streamed.zip'
+    with open(streamed_path, 'wb') as file:
+        class Unseekable:
+            write = file.write
+            flush = file.flush
+
+        with zipfile.ZipFile(Unseekable(), 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data, _ in MEMBERS:
+                archive.writestr(name, data)
+
+    target_path = tmp_path / 'target.zip'
+    copy(streamed_path, target_path, zip_archive.copy_member)
+
+    with zipfile.ZipFile(target_path, 'r') as target:
+        assert target.testzip() is None
+        assert [target.read(name) for name, _, _ in MEMBERS] == [data for _, data, _ in MEMBERS]
@@ -0,0 +1,165 @@
+"""Translates a directory of local documents with the worker's file translators, without the message bus
+and the file translation service. Translation API is used as configured for the worker.
+
+Usage:
+    python -m tildemt.batch <input directory> <output directory> --source-lang en --target-lang lv
+        [--domain DOMAIN] [--translation-memory memory.tmx] [--jobs N] [--report report.json]
+
+Documents are translated to the same relative paths in the output directory. Timing of each document and
+the throughput of the batch are printed and written to the JSON report"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+import tildemt.translator
+from tildemt.enums.file_translation_status_type import FileTranslationStatusType
+from tildemt.file_translator import FILE_TYPES
+from tildemt.services.local_file_translation_service import TRANSLATION_MEMORY_FILE_ID, LocalFileTranslationService
+from tildemt.translator import Translator
+
+# Seconds to wait before retrying a document deferred for lack of resources
+DEFER_DELAY = 5
+# Times a document is retried, then it waits for other documents to release resources
+MAX_DEFERRALS = 10
+
+
+def find_documents(input_dir):
+    """Returns paths of supported documents in the directory and its subdirectories, relative to the directory"""
+    documents = []
+    for directory, _, file_names in os.walk(input_dir):
+        for file_name in file_names:
+            extension = os.path.splitext(file_name)[1][1:].lower()
+            if extension in FILE_TYPES:
+                documents.append(os.path.relpath(os.path.join(directory, file_name), input_dir))
+
+    return sorted(documents)
+
+
+def translate_document(document, input_dir, output_dir, source_lang, target_lang, domain, translation_memory=None):
+    """Translates the document, pre-translated from the TMX document 'translation_memory' if set.
+    Returns the local service holding metadata of the translated document"""
+    service = LocalFileTranslationService(
+        str(uuid.uuid4()),
+        os.path.join(input_dir, document),
+        os.path.join(output_dir, document),
+        source_lang,
+        target_lang,
+        domain,
+        translation_memory
+    )
+
+    deferrals = 0
+    while True:
+        translator = Translator(
+            service.metadata['id'],
+            file_translation_service=service,
+            translation_memory=TRANSLATION_MEMORY_FILE_ID if translation_memory else None,
+            may_defer=deferrals < MAX_DEFERRALS
+        )
+        if translator.translate():
+            break
+
+        deferrals += 1
+        time.sleep(DEFER_DELAY)
+
+    # Translated file might be uploaded in background
+    translator.finished.result()
+
+    return service
+
+
+def get_report(document, service):
+    metadata = service.metadata
+    return {
+        'file': document,
+        'status': metadata['status'],
+        'substatus': metadata['substatus'],
+        'segments': metadata['segments'],
+        'translatedSegments': metadata['translatedSegments'],
+        'bytes': metadata['files'][0]['size'],
+        'seconds': (service.end_time or time.monotonic()) - service.start_time
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate a directory of local documents")
+    parser.add_argument('input_dir', help="directory of documents to translate")
+    parser.add_argument('output_dir', help="directory for translated documents")
+    parser.add_argument('--source-lang', required=True)
+    parser.add_argument('--target-lang', required=True)
+    parser.add_argument('--domain', default=None, help="MT domain, detected from the text if not set")
+    parser.add_argument('--translation-memory', help="TMX document pre-translating segments of the documents")
+    parser.add_argument('--jobs', type=int, default=1, help="count of documents translated concurrently")
+    parser.add_argument('--report', help="path of the JSON report")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)-8s [%(name)s:%(funcName)s:%(lineno)d] %(message)s"
+    )
+
+    documents = find_documents(args.input_dir)
+    start_time = time.monotonic()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        services = [
+            executor.submit(
+                translate_document,
+                document,
+                args.input_dir,
+                args.output_dir,
+                args.source_lang,
+                args.target_lang,
+                args.domain,
+                args.translation_memory
+            )
+            for document in documents
+        ]
+        services = [service.result() for service in services]
+
+    # Translated documents might still be uploading in background
+    tildemt.translator.BACKGROUND_UPLOAD_EXECUTOR.shutdown(wait=True)
+
+    seconds = time.monotonic() - start_time
+    results = [get_report(document, service) for document, service in zip(documents, services)]
+    segments = sum(result['translatedSegments'] for result in results)
+
+    report = {
+        'srcLang': args.source_lang,
+        'trgLang': args.target_lang,
+        'domain': args.domain,
+        'translationMemory': args.translation_memory,
+        'jobs': args.jobs,
+        'files': len(results),
+        'succeeded': sum(result['status'] == FileTranslationStatusType.SUCCEEDED.value for result in results),
+        'seconds': seconds,
+        'filesPerMinute': len(results) / seconds * 60 if seconds else 0,
+        'segmentsPerSecond': segments / seconds if seconds else 0,
+        'results': results
+    }
+
+    for result in results:
+        print(
+            f"{result['file']:<50} {str(result['status']):<10} {result['translatedSegments']:>8} segments "
+            f"{result['bytes']:>12} bytes {result['seconds']:>9.2f} s"
+        )
+    print(
+        f"{report['succeeded']}/{report['files']} documents translated in {seconds:.2f} s, "
+        f"{report['filesPerMinute']:.1f} documents/min, {report['segmentsPerSecond']:.1f} segments/s"
+    )
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2)
+
+    return 0 if report['succeeded'] == report['files'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
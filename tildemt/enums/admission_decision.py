@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class AdmissionDecision(Enum):
+    ADMIT = "Admit"
+    DEFER = "Defer"
+    REJECT = "Reject"
@@ -6,4 +6,5 @@ class FileTranslationSubstatus(Enum):
     BAD_FILE = "BadFileError"
     UNKNOWN_FILE_TYPE = "UnknownFileTypeError"
     TRACK_CHANGES_ENABLED = "TrackChangesEnabledError"
-    NO_TEXT_EXTRACTED = "NoTextExtractedError"
\ No newline at end of file
+    NO_TEXT_EXTRACTED = "NoTextExtractedError"
+    DEADLINE_EXCEEDED = "DeadlineExceededError"
\ No newline at end of file
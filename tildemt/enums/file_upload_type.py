@@ -7,3 +7,4 @@ class FileUploadType(Enum):
     TRANSLATED = "Translated"
     TRANSLATED_CONVERTED = "TranslatedConverted"
     UNKNOWN_WORD_FILE = "UnknownWordFile"
+    TRANSLATION_MEMORY = "TranslationMemory"
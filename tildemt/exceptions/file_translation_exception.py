@@ -6,4 +6,8 @@ class FileTranslationException(Exception):
         super().__init__(message)
 
         self.error_type = error_type
-        self.message = message
\ No newline at end of file
+        self.message = message
+
+    def __reduce__(self):
+        # Keep error type when exception is passed between processes
+        return self.__class__, (self.error_type, self.message)
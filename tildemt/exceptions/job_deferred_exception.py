@@ -0,0 +1,2 @@
+class JobDeferredException(Exception):
+    """Translation job can't be started now because the worker lacks resources and has to be retried later"""
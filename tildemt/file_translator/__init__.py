@@ -1,13 +1,45 @@
-from tildemt.file_translator.types.tmx import TMXTranslator
-from tildemt.file_translator.types.txt import TXTTranslator
-from tildemt.file_translator.types.odf import ODFTranslator
-from tildemt.file_translator.types.docx import DOCXTranslator
+"""File translators of the supported file extensions. Modules of the file translators are imported on first use,
+so that the worker starts without loading the libraries of all document formats"""
 
+import importlib
+import logging
+import threading
+import time
+
+from tildemt.utils import metrics
+
+# Module and class name of the file translator of each extension
 FILE_TYPES = {
-    'tmx': TMXTranslator,
-    'txt': TXTTranslator,
-    'docx': DOCXTranslator,
-    'xlsx': DOCXTranslator,
-    'pptx': DOCXTranslator,
-    'odt': ODFTranslator
+    'tmx': ('tildemt.file_translator.types.tmx', 'TMXTranslator'),
+    'txt': ('tildemt.file_translator.types.txt', 'TXTTranslator'),
+    'docx': ('tildemt.file_translator.types.docx', 'DOCXTranslator'),
+    'xlsx': ('tildemt.file_translator.types.xlsx', 'XLSXTranslator'),
+    'pptx': ('tildemt.file_translator.types.docx', 'DOCXTranslator'),
+    'odt': ('tildemt.file_translator.types.odf', 'ODFTranslator')
 }
+
+_file_translators = {}
+_file_translators_lock = threading.Lock()
+
+
+def get_file_translator(extension):
+    """Returns file translator class of the extension or None if the extension is not supported.
+    Module of the file translator is imported on the first call"""
+    file_type = FILE_TYPES.get(extension)
+    if file_type is None:
+        return None
+
+    with _file_translators_lock:
+        if file_type not in _file_translators:
+            module_name, class_name = file_type
+
+            start_time = time.perf_counter()
+            module = importlib.import_module(module_name)
+            import_seconds = time.perf_counter() - start_time
+
+            metrics.MODULE_IMPORT_SECONDS.labels(module_name).set(import_seconds)
+            logging.getLogger('FileTranslator').info("Imported %s in %.3f s", module_name, import_seconds)
+
+            _file_translators[file_type] = getattr(module, class_name)
+
+        return _file_translators[file_type]
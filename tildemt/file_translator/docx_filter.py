@@ -0,0 +1,251 @@
+"""Filtering of DOCX document parts that removes the tags conflicting with Okapi Tikal extraction.
+Functions are defined on module level, so that document parts can be filtered in worker processes"""
+
+import functools
+import io
+import logging
+import re
+import time
+from lxml import etree
+from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
+from tildemt.exceptions.file_translation_exception import FileTranslationException
+
+
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+W_P = f'{W_NS}p'
+W_R = f'{W_NS}r'
+W_T = f'{W_NS}t'
+W_RPR = f'{W_NS}rPr'
+W_VERT_ALIGN = f'{W_NS}vertAlign'
+W_VAL = f'{W_NS}val'
+
+# Field elements and content controls, tags are removed but content is kept
+STRIPPED_TAGS = (f'{W_NS}fldSimple', f'{W_NS}sdt', f'{W_NS}sdtContent', f'{W_NS}softHyphen') # remove softHyphen (¬)
+# Properties of content controls and fields, removed together with content
+STRIPPED_ELEMENTS = (f'{W_NS}sdtPr', f'{W_NS}sdtEndPr', f'{W_NS}instrText', f'{W_NS}fldChar')
+# Run elements that break a word
+WORD_BREAKS = frozenset((f'{W_NS}tab', f'{W_NS}br', f'{W_NS}cr', f'{W_NS}noBreakHyphen'))
+# Spellcheck information, comments and drawing text shapes
+REMOVABLE_TAGS = (
+    '{*}proofErr',
+    '{http://schemas.openxmlformats.org/drawingml/2006/main}txSp',
+    '{*}commentRangeStart',
+    '{*}commentRangeEnd'
+)
+# Elements walked by the document normalizer
+NORMALIZER_TAGS = (W_P, W_T, W_RPR, *WORD_BREAKS, *REMOVABLE_TAGS)
+
+
+def needs_filtering(filename):
+    "Check if XML file contains tags that have to be removed before extraction"
+    return (
+        filename.endswith('document.xml') or filename.endswith('comments.xml')
+        or re.match(r'.*(header|footer)\d+\.xml$', filename) is not None
+    )
+
+
+def filter_xml_buffer(filename, buffer):
+    """Remove unallowed tags from XML file buffer string in a worker process,
+    returns filtered XML file buffer string and CPU time used by the worker process"""
+    start_time = time.process_time()
+    filtered = filter_xml_file(filename, io.BytesIO(buffer))
+    return filtered, time.process_time() - start_time
+
+
+def filter_xml_file(filename, stream):
+    "Remove unallowed tags from XML file stream, returns filtered XML file buffer string"
+    marginals = re.match(r'.*(header|footer)\d+\.xml$', filename)
+    buffer = None
+
+    if filename.endswith('document.xml'):
+        xml_doc = etree.parse(stream, etree.XMLParser(recover=False)).getroot()
+
+        # remove field element tags and properties, keep content
+        etree.strip_tags(xml_doc, *STRIPPED_TAGS)
+        etree.strip_elements(xml_doc, *STRIPPED_ELEMENTS)
+
+        deletable, removable = normalize_document(xml_doc)
+
+        remove_tags(deletable)
+        deletable = []
+        # Elements could have been removed together with their only child
+        remove_tags(tag for tag in removable if tag.getroottree().getroot() is xml_doc)
+        removable = []
+
+        buffer = etree.tostring(xml_doc)
+
+    elif filename.endswith('comments.xml'):
+        deletable = []
+        xml_doc = etree.parse(stream, etree.XMLParser(recover=False)).getroot()
+
+        for tag in xml_doc.iter():
+            tag_name = tag.tag
+            if 'proofErr' in tag_name:
+                deletable.append(tag)
+
+        remove_tags(deletable)
+        buffer = etree.tostring(xml_doc)
+
+    elif marginals:
+        deletable = []
+        xml_doc = etree.parse(stream, etree.XMLParser(recover=False)).getroot()
+
+        for tag in xml_doc.iter():
+            tag_name = tag.tag
+            if (
+                'proofErr' in tag_name or
+                #let those posers live
+                #'AlternateContent' in tag_name or
+                'commentRangeStart' in tag_name or 'commentRangeEnd' in tag_name or
+                (tag_name == 'w:r' and not tag.getchildren())
+            ):
+                deletable.append(tag)
+
+        if tag_name.endswith('ins'):
+            # Track Changes detected within the document - further processing with Tikal is not possible
+            raise FileTranslationException(FileTranslationSubstatus.TRACK_CHANGES_ENABLED)
+
+        remove_tags(deletable)
+        buffer = etree.tostring(xml_doc)
+
+    return buffer
+
+
+def remove_tags(tags):
+    "Remove tags from document"
+    for tag in tags:
+        try:
+            remove_tag_hierarchy(tag)
+        except Exception:
+            logging.getLogger('DOCXTranslator').exception("Cannot remove tag from document")
+
+
+def remove_tag_hierarchy(tag):
+    """Removes a tag and it's parents if the tag is the only child from a document"""
+    parent = tag.getparent()
+    while len(parent) == 1:
+        tag = parent
+        parent = parent.getparent()
+
+    parent.remove(tag)
+
+
+def normalize_document(xml_doc):
+    """Walks document once and merges words that are split into several text elements
+    (partially formatted words). Returns text elements left empty by merging and
+    elements that have to be removed from the document"""
+
+    deletable = []
+    removable = []
+    # Chain of the paragraphs enclosing current element (paragraphs are nested in text boxes):
+    # [paragraph, children of direct runs, count of text elements, last text element, deletable]
+    paragraphs = []
+
+    def close_paragraphs(paragraph):
+        """Merges words in the open paragraphs that are not 'paragraph' or it's ancestors"""
+        while paragraphs and paragraphs[-1][0] is not paragraph:
+            _, run_elements, text_count, last_text, paragraph_deletable = paragraphs.pop()
+            if text_count >= 2:
+                merge_words(run_elements, last_text, paragraph_deletable)
+
+    for element in xml_doc.iter(NORMALIZER_TAGS):
+        tag = element.tag
+
+        if tag == W_P:
+            if element is not xml_doc:
+                close_paragraphs(next(element.iterancestors(W_P), None))
+                paragraph_deletable = []
+                deletable.append(paragraph_deletable)
+                paragraphs.append([element, [], 0, None, paragraph_deletable])
+            continue
+
+        if tag != W_T and tag != W_RPR and tag not in WORD_BREAKS:
+            removable.append(element)
+            continue
+
+        parent = element.getparent()
+        paragraph = parent.getparent() if parent.tag == W_R else None
+        is_run_element = paragraph is not None and paragraph.tag == W_P
+
+        if tag == W_T:
+            if not is_run_element:
+                paragraph = next(element.iterancestors(W_P), None)
+        elif not is_run_element:
+            continue
+
+        if paragraphs and paragraphs[-1][0] is not paragraph:
+            close_paragraphs(paragraph)
+
+        if tag == W_T:
+            for state in paragraphs:
+                state[2] += 1
+                state[3] = element
+
+        if is_run_element:
+            paragraphs[-1][1].append(element)
+
+    close_paragraphs(None)
+
+    return [tag for paragraph_deletable in deletable for tag in paragraph_deletable], removable
+
+
+def merge_words(run_elements, last_text, deletable):
+    """Merges broken words of the paragraph into the first text element of the word"""
+    merged_word = ''
+    word_start = None
+    word_parts = 0
+
+    for element in run_elements:
+        tag = element.tag
+
+        if tag in WORD_BREAKS or (tag == W_RPR and is_vertically_aligned(element)):
+            if word_parts > 1:
+                word_start.text = merged_word
+            merged_word = ''
+            word_parts = 0
+            word_start = None
+        elif tag == W_T and element.text:
+            text = element.text
+            # if text element starts with space or a non word chararcter
+            if is_text_break(text[0]):
+                if word_parts > 1:
+                    word_start.text = merged_word
+                merged_word = ''
+                word_parts = 0
+                word_start = None
+                # if broken word starts with space
+                if not is_text_break(text[-1]):
+                    merged_word += text
+                    word_parts += 1
+                    word_start = element
+            # if text element ends with space or a non word chararcter or it is last in paragraph
+            elif is_text_break(text[-1]) or element is last_text:
+                if word_parts >= 1:
+                    merged_word += text
+                    word_start.text = merged_word
+                    deletable.append(element)
+                merged_word = ''
+                word_parts = 0
+                word_start = None
+            else:
+                merged_word += text
+                if word_parts > 0:
+                    deletable.append(element)
+                word_parts += 1
+                if word_start is None:
+                    word_start = element
+
+
+def is_vertically_aligned(run_properties):
+    """Check if text has superscript or subscript formatting"""
+    for run_property in run_properties.iterchildren(W_VERT_ALIGN):
+        if run_property.get(W_VAL) in ('superscript', 'subscript'):
+            return True
+    return False
+
+
+@functools.lru_cache(maxsize=None)
+def is_text_break(character):
+    """Check if character is a whitespace or a non word character (same as regex '\\s|\\W')"""
+    return character.isspace() or not (character.isalnum() or character == '_')
@@ -0,0 +1,87 @@
+"""Helpers for the XLF-Inline (Moses InlineText) segment markup produced by Okapi Tikal.
+
+Translatable text is XML escaped, formatted spans are wrapped in <g id="N">...</g>
+and non-translatable inline objects are represented by <x id="N"/> placeholders."""
+
+import html
+import re
+
+INLINE_TAG = re.compile(r'<g\s+id=["\'](\d+)["\']\s*>|</g\s*>|<x\s+id=["\'](\d+)["\']\s*/>')
+
+
+def escape(text):
+    """Escapes plain text for use in an inline segment. Line breaks are kept as character references,
+    because segments are separated by newlines"""
+    return (
+        text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\n', '&#10;').replace('\r', '&#13;')
+    )
+
+
+def unescape(text):
+    return html.unescape(text)
+
+
+def start_tag(tag_id):
+    return f'<g id="{tag_id}">'
+
+
+def end_tag():
+    return '</g>'
+
+
+def placeholder(tag_id):
+    return f'<x id="{tag_id}"/>'
+
+
+def events(segment):
+    """Splits inline segment into a list of events in document order:
+        ('text', <unescaped text>, None)
+        ('start', None, <id of the opened <g> tag>)
+        ('end', None, <id of the closed <g> tag>)
+        ('x', None, <placeholder id>)
+    Unbalanced closing tags are ignored"""
+
+    tokens = []
+    open_tags = []
+    position = 0
+
+    for match in INLINE_TAG.finditer(segment):
+        if match.start() > position:
+            tokens.append(('text', unescape(segment[position:match.start()]), None))
+
+        if match.group(1) is not None:
+            open_tags.append(int(match.group(1)))
+            tokens.append(('start', None, open_tags[-1]))
+        elif match.group(2) is not None:
+            tokens.append(('x', None, int(match.group(2))))
+        elif open_tags:
+            tokens.append(('end', None, open_tags.pop()))
+
+        position = match.end()
+
+    if position < len(segment):
+        tokens.append(('text', unescape(segment[position:]), None))
+
+    return tokens
+
+
+def parse(segment):
+    """Splits inline segment into a list of tokens:
+        ('text', <unescaped text>, <id of the innermost enclosing <g> tag or None>)
+        ('x', None, <placeholder id>)
+    Unbalanced closing tags are ignored"""
+
+    tokens = []
+    open_tags = []
+
+    for kind, text, tag_id in events(segment):
+        if kind == 'text':
+            tokens.append(('text', text, open_tags[-1] if open_tags else None))
+        elif kind == 'start':
+            open_tags.append(tag_id)
+        elif kind == 'end':
+            open_tags.pop()
+        else:
+            tokens.append((kind, text, tag_id))
+
+    return tokens
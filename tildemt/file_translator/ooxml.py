@@ -0,0 +1,437 @@
+"""In-process extraction and merge of translatable text in Office Open XML (DOCX, XLSX, PPTX) documents.
+
+Paragraph text is extracted straight from the document parts as XLF-Inline segments and translations are
+written back into the same parts, so the common documents can be translated without Okapi Tikal.
+Documents containing constructs that are not supported here raise OOXMLUnsupportedError and must be
+handled by Tikal instead."""
+
+import copy
+import logging
+import re
+import zipfile
+from collections import namedtuple
+from lxml import etree
+from tildemt.file_translator import inline_markup
+from tildemt.file_translator.docx_filter import is_text_break
+from tildemt.utils.zip_archive import copy_member
+
+WORDPROCESSING_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+DRAWING_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+SPREADSHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+# Tag names of a single OOXML markup language:
+# 'paragraph' - segment container, 'run' - formatted text run, 'run_properties' - formatting of the run,
+# 'text' - text element, 'skipped' - containers with text that must not be translated (fields, phonetic hints),
+# 'containers' - elements wrapping runs of a paragraph (hyperlinks, tracked insertions, content controls),
+# 'moved' - range markers moved out of the segment to the start or end of the paragraph,
+# 'ignored' - spellcheck and layout hints dropped from translated paragraphs
+Dialect = namedtuple(
+    'Dialect',
+    ['paragraph', 'run', 'run_properties', 'text', 'skipped', 'containers', 'moved', 'ignored', 'preserve_space'],
+    defaults=((), (), (), True)
+)
+
+WORDPROCESSING = Dialect(
+    paragraph=f'{{{WORDPROCESSING_NS}}}p',
+    run=f'{{{WORDPROCESSING_NS}}}r',
+    run_properties=f'{{{WORDPROCESSING_NS}}}rPr',
+    text=f'{{{WORDPROCESSING_NS}}}t',
+    skipped=(),
+    containers=frozenset(
+        f'{{{WORDPROCESSING_NS}}}{tag}'
+        for tag in (
+            'hyperlink', 'ins', 'moveTo', 'smartTag', 'sdt', 'sdtContent', 'fldSimple', 'customXml', 'dir', 'bdo'
+        )
+    ),
+    moved=frozenset(
+        f'{{{WORDPROCESSING_NS}}}{tag}'
+        for tag in ('bookmarkStart', 'bookmarkEnd', 'commentRangeStart', 'commentRangeEnd', 'permStart', 'permEnd')
+    ),
+    ignored=frozenset(
+        f'{{{WORDPROCESSING_NS}}}{tag}' for tag in ('proofErr', 'lastRenderedPageBreak', 'softHyphen')
+    ),
+    preserve_space=True
+)
+
+DRAWING = Dialect(
+    paragraph=f'{{{DRAWING_NS}}}p',
+    run=f'{{{DRAWING_NS}}}r',
+    run_properties=f'{{{DRAWING_NS}}}rPr',
+    text=f'{{{DRAWING_NS}}}t',
+    skipped=(f'{{{DRAWING_NS}}}fld', ),
+    preserve_space=False
+)
+
+SPREADSHEET = Dialect(
+    paragraph=f'{{{SPREADSHEET_NS}}}si',
+    run=f'{{{SPREADSHEET_NS}}}r',
+    run_properties=f'{{{SPREADSHEET_NS}}}rPr',
+    text=f'{{{SPREADSHEET_NS}}}t',
+    skipped=(f'{{{SPREADSHEET_NS}}}rPh', ),
+    preserve_space=True
+)
+
+# Translatable parts of the documents
+PARTS = {
+    'docx':
+        [
+            (
+                re.compile(r'^word/(glossary/)?(document|comments|footnotes|endnotes|header\d*|footer\d*)\.xml$'),
+                WORDPROCESSING
+            ),
+            (re.compile(r'^word/(diagrams/(data|drawing)|charts/chart)\d+\.xml$'), DRAWING),
+        ],
+    'pptx':
+        [
+            (re.compile(r'^ppt/(slides/slide|notesSlides/notesSlide)\d+\.xml$'), DRAWING),
+            (re.compile(r'^ppt/(diagrams/(data|drawing)|charts/chart)\d+\.xml$'), DRAWING),
+        ],
+    'xlsx':
+        [
+            (re.compile(r'^xl/sharedStrings\.xml$'), SPREADSHEET),
+            (re.compile(r'^xl/(drawings/drawing|charts/chart)\d+\.xml$'), DRAWING),
+        ],
+}
+
+# Parts that hold translatable text this engine does not extract
+UNSUPPORTED_PARTS = {
+    'xlsx': [(re.compile(r'^xl/worksheets/sheet\d+\.xml$'), b'inlineStr')],
+}
+
+# Each paragraph is split into atoms - text elements and inline objects, together with the run they belong to
+# and the containers (outermost first) that wrap the run in the paragraph
+Atom = namedtuple('Atom', ['is_text', 'element', 'run', 'format_key', 'containers', 'vertical_align'])
+
+Paragraph = namedtuple('Paragraph', ['element', 'dialect', 'prefix', 'suffix', 'tags', 'base_atom', 'lead', 'trail'])
+
+
+class OOXMLUnsupportedError(Exception):
+    """Document contains constructs that can't be processed in-process"""
+
+
+class OOXMLDocument():
+    """Extracts translatable paragraphs from OOXML document parts and merges translations back"""
+    def __init__(self, file_path, extension):
+        self.__logger = logging.getLogger('OOXMLDocument')
+
+        self.file_path = file_path
+        self.extension = extension
+
+        self.__parts = {}
+        self.__paragraphs = []
+
+    def extract(self):
+        """Returns a list of XLF-Inline segments, one for every translatable paragraph of the document"""
+        part_rules = PARTS.get(self.extension)
+        if part_rules is None:
+            raise OOXMLUnsupportedError(f"Unsupported document type: {self.extension}")
+
+        segments = []
+
+        with zipfile.ZipFile(self.file_path, 'r') as archive:
+            for item in archive.infolist():
+                self.__check_supported(archive, item)
+
+                dialect = next((dialect for pattern, dialect in part_rules if pattern.match(item.filename)), None)
+                if dialect is None:
+                    continue
+
+                with archive.open(item) as part:
+                    tree = etree.parse(part, etree.XMLParser(recover=False))
+
+                self.__parts[item.filename] = tree
+
+                for paragraph in tree.iter(dialect.paragraph):
+                    segment = self.__extract_paragraph(paragraph, dialect)
+                    if segment is not None:
+                        segments.append(segment)
+
+        self.__logger.info("Extracted %d segments from %d document parts", len(segments), len(self.__parts))
+        return segments
+
+    def merge(self, translations):
+        """Writes translations of the extracted segments back to the document parts"""
+        if len(translations) != len(self.__paragraphs):
+            raise ValueError(f"Expected {len(self.__paragraphs)} translations, got {len(translations)}")
+
+        for paragraph, translation in zip(self.__paragraphs, translations):
+            self.__merge_paragraph(paragraph, f'{paragraph.lead}{translation.strip()}{paragraph.trail}')
+
+    def save(self, target_file):
+        """Writes the document with translated parts to 'target_file'"""
+        with zipfile.ZipFile(self.file_path, 'r') as source:
+            with zipfile.ZipFile(target_file, 'w') as target:
+                for item in source.infolist():
+                    tree = self.__parts.get(item.filename)
+                    if tree is None:
+                        copy_member(source, target, item)
+                    else:
+                        buffer = etree.tostring(
+                            tree,
+                            xml_declaration=True,
+                            encoding=tree.docinfo.encoding,
+                            standalone=tree.docinfo.standalone
+                        )
+                        target.writestr(item, buffer)
+
+    def __check_supported(self, archive, item):
+        """Raises OOXMLUnsupportedError if the archive member contains translatable text this engine can't extract"""
+        for pattern, marker in UNSUPPORTED_PARTS.get(self.extension, []):
+            if not pattern.match(item.filename):
+                continue
+
+            overlap = b''
+            with archive.open(item) as part:
+                for chunk in iter(lambda: part.read(1024 * 1024), b''):
+                    if marker in overlap + chunk:
+                        raise OOXMLUnsupportedError(f"Unsupported content in {item.filename}")
+                    overlap = chunk[-len(marker):]
+
+    def __extract_paragraph(self, paragraph, dialect):
+        """Converts paragraph to XLF-Inline segment. Returns None if paragraph has no translatable text"""
+        atoms = []
+        moved = []
+        self.__collect_atoms(paragraph, dialect, (), atoms, moved)
+
+        text_atoms = [i for i, atom in enumerate(atoms) if atom.is_text]
+
+        # Text nested in other elements (text in unknown containers, etc.) would be lost by this engine
+        own_text_elements = sum(
+            1 for text in paragraph.iter(dialect.text)
+            if next(text.iterancestors(dialect.paragraph, *dialect.skipped), None) is paragraph
+        )
+        if own_text_elements != len(text_atoms):
+            raise OOXMLUnsupportedError(f"Text outside of simple runs in {paragraph.tag}")
+
+        if not ''.join(atoms[i].element.text or '' for i in text_atoms).strip():
+            return None
+
+        first, last = text_atoms[0], text_atoms[-1]
+        base_key = self.__get_format(atoms[first])
+
+        # Merge neighbour text atoms with equal formatting and words split in runs of different formatting,
+        # as the DOCX preprocessing does, and convert formatting changes to inline tags
+        groups = []
+        for atom in atoms[first:last + 1]:
+            key = self.__get_format(atom) if atom.is_text else None
+            text = atom.element.text or ''
+
+            if key is not None and groups and groups[-1][0] is not None and (
+                groups[-1][0] == key or self.__continues_word(groups[-1][1], groups[-1][2], atom)
+            ):
+                groups[-1][2].append(text)
+            else:
+                groups.append((key, atom, [text] if atom.is_text else None))
+
+        tags = {}
+        segment = []
+        for key, atom, texts in groups:
+            if key is None:
+                tags[len(tags) + 1] = ('x', atom)
+                segment.append(inline_markup.placeholder(len(tags)))
+            elif key == base_key:
+                segment.append(inline_markup.escape(''.join(texts)))
+            else:
+                tags[len(tags) + 1] = ('g', atom)
+                segment.append(inline_markup.start_tag(len(tags)))
+                segment.append(inline_markup.escape(''.join(texts)))
+                segment.append(inline_markup.end_tag())
+
+        segment = ''.join(segment)
+        stripped = segment.strip()
+
+        # Range markers are kept at the edges of the translated text, after the paragraph properties
+        range_starts = [atom for atom in moved if atom.element.tag.endswith('Start')]
+        range_ends = [atom for atom in moved if not atom.element.tag.endswith('Start')]
+
+        self.__paragraphs.append(
+            Paragraph(
+                element=paragraph,
+                dialect=dialect,
+                prefix=atoms[:first] + range_starts,
+                suffix=range_ends + atoms[last + 1:],
+                tags=tags,
+                base_atom=atoms[first],
+                lead=segment[:len(segment) - len(segment.lstrip())],
+                trail=segment[len(segment.rstrip()):]
+            )
+        )
+
+        return stripped
+
+    def __collect_atoms(self, element, dialect, containers, atoms, moved):
+        """Splits children of the paragraph or a container of runs into atoms"""
+        for child in element:
+            if child.tag in dialect.ignored:
+                continue
+
+            if child.tag in dialect.moved:
+                moved.append(Atom(False, child, None, None, (), False))
+
+            elif child.tag == dialect.run:
+                properties = child.find(dialect.run_properties)
+                format_key = etree.tostring(properties, with_tail=False) if properties is not None else b''
+                vertical_align = self.__is_vertically_aligned(properties)
+
+                # Runs left without content are dropped
+                for run_element in child:
+                    if run_element is properties or run_element.tag in dialect.ignored:
+                        continue
+
+                    if run_element.tag in dialect.moved:
+                        moved.append(Atom(False, run_element, None, None, (), False))
+                    else:
+                        atoms.append(
+                            Atom(
+                                run_element.tag == dialect.text,
+                                run_element,
+                                child,
+                                format_key,
+                                containers,
+                                vertical_align
+                            )
+                        )
+
+            elif child.tag in dialect.containers:
+                self.__collect_atoms(child, dialect, containers + (child, ), atoms, moved)
+
+            elif containers and self.__is_container_properties(child):
+                # Properties are copied together with the container
+                continue
+
+            else:
+                atoms.append(Atom(child.tag == dialect.text, child, None, b'', containers, False))
+
+    @staticmethod
+    def __get_format(atom):
+        return (atom.run is None, atom.containers, atom.format_key)
+
+    @staticmethod
+    def __continues_word(group_atom, group_texts, atom):
+        """Checks if the text atom continues a word of the previous text group in a run of other formatting.
+        Words are not merged across containers or with superscript and subscript text"""
+        text = atom.element.text or ''
+        previous_text = group_texts[-1] if group_texts else ''
+
+        return (
+            bool(text) and bool(previous_text) and group_atom.containers == atom.containers
+            and not group_atom.vertical_align and not atom.vertical_align
+            and not is_text_break(previous_text[-1]) and not is_text_break(text[0])
+        )
+
+    @staticmethod
+    def __is_vertically_aligned(properties):
+        """Check if run has superscript or subscript formatting"""
+        if properties is None:
+            return False
+
+        # DrawingML baseline offset in thousandths of a percent
+        if properties.get('baseline') not in (None, '0'):
+            return True
+
+        # WordprocessingML and SpreadsheetML vertical alignment
+        for child in properties:
+            if isinstance(child.tag, str) and etree.QName(child).localname == 'vertAlign':
+                if (child.get(f'{{{WORDPROCESSING_NS}}}val') or child.get('val')) in ('superscript', 'subscript'):
+                    return True
+
+        return False
+
+    @staticmethod
+    def __is_container_properties(element):
+        return isinstance(element.tag, str) and etree.QName(element).localname.endswith(('Pr', 'fldData'))
+
+    def __merge_paragraph(self, paragraph, translation):
+        """Replaces paragraph content with translated runs, keeping inline objects"""
+        pieces = [(atom, atom.element) for atom in paragraph.prefix]
+
+        used_tags = set()
+        for kind, text, tag_id in inline_markup.parse(translation):
+            tag = paragraph.tags.get(tag_id)
+
+            if kind == 'x':
+                if tag is not None and tag[0] == 'x' and tag_id not in used_tags:
+                    used_tags.add(tag_id)
+                    pieces.append((tag[1], tag[1].element))
+            elif text:
+                atom = tag[1] if tag is not None and tag[0] == 'g' else paragraph.base_atom
+                pieces.append((atom, text))
+
+        # Keep inline objects that were dropped from the translation
+        for tag_id, (kind, atom) in sorted(paragraph.tags.items()):
+            if kind == 'x' and tag_id not in used_tags:
+                pieces.append((atom, atom.element))
+
+        pieces.extend((atom, atom.element) for atom in paragraph.suffix)
+
+        merged_pieces = []
+        for atom, piece in pieces:
+            if (
+                isinstance(piece, str) and merged_pieces and isinstance(merged_pieces[-1][1], str)
+                and merged_pieces[-1][0].run is atom.run and merged_pieces[-1][0].containers == atom.containers
+            ):
+                merged_pieces[-1] = (merged_pieces[-1][0], merged_pieces[-1][1] + piece)
+            else:
+                merged_pieces.append((atom, piece))
+
+        content = paragraph.element.makeelement(paragraph.element.tag)
+        # Copies of the containers of the current piece, outermost first, as (container, copy)
+        open_containers = []
+        current_run = wrapper = None
+        for atom, piece in merged_pieces:
+            if isinstance(piece, str):
+                piece = self.__text_element(paragraph, piece)
+
+            shared = 0
+            while (
+                shared < len(open_containers) and shared < len(atom.containers)
+                and open_containers[shared][0] is atom.containers[shared]
+            ):
+                shared += 1
+
+            if shared < len(open_containers) or shared < len(atom.containers):
+                del open_containers[shared:]
+                current_run = wrapper = None
+
+                for container in atom.containers[shared:]:
+                    container_copy = self.__copy_container(container)
+                    (open_containers[-1][1] if open_containers else content).append(container_copy)
+                    open_containers.append((container, container_copy))
+
+            parent = open_containers[-1][1] if open_containers else content
+
+            if atom.run is None:
+                parent.append(piece)
+                current_run = wrapper = None
+                continue
+
+            if atom.run is not current_run:
+                wrapper = paragraph.element.makeelement(atom.run.tag, atom.run.attrib)
+                properties = atom.run.find(paragraph.dialect.run_properties)
+                if properties is not None:
+                    wrapper.append(copy.deepcopy(properties))
+                parent.append(wrapper)
+                current_run = atom.run
+
+            wrapper.append(piece)
+
+        for child in list(paragraph.element):
+            paragraph.element.remove(child)
+        paragraph.element.extend(list(content))
+
+    def __copy_container(self, container):
+        """Returns an empty copy of the container with its properties"""
+        container_copy = container.makeelement(container.tag, container.attrib)
+        for child in container:
+            if self.__is_container_properties(child):
+                container_copy.append(copy.deepcopy(child))
+        return container_copy
+
+    @staticmethod
+    def __text_element(paragraph, text):
+        element = paragraph.element.makeelement(paragraph.dialect.text)
+        element.text = text
+        if paragraph.dialect.preserve_space and text != text.strip():
+            element.set(XML_SPACE, 'preserve')
+        return element
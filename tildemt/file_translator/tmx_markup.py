@@ -0,0 +1,136 @@
+"""Conversion between TMX segment content and XLF-Inline segments.
+
+Paired native codes (<bpt>/<ept>) and highlighted text (<hi>) are represented by <g> tags,
+other inline codes (<ph>, <it>, <ut> and unpaired <bpt>/<ept>) by <x/> placeholders."""
+
+import copy
+from collections import namedtuple
+from tildemt.file_translator import inline_markup
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+# Inline tag of a segment. 'kind' - 'g' or 'x', 'elements' - (<bpt>, <ept>) of a paired code,
+# (<hi>, ) of highlighted text or (<code>, ) of a placeholder
+Code = namedtuple('Code', ['kind', 'elements'])
+
+
+def get_language(tuv):
+    """Returns language code of the translation unit variant, TMX 1.1 documents use 'lang' attribute"""
+    return tuv.get(XML_LANG) or tuv.get('lang')
+
+
+def to_inline(seg):
+    """Converts content of <seg> element to XLF-Inline segment. Returns the segment and inline codes by tag id"""
+    codes = {}
+    parts = []
+    _convert_content(seg, parts, codes)
+    return ''.join(parts), codes
+
+
+def from_inline(seg, segment, codes):
+    """Replaces content of <seg> element with XLF-Inline segment, restoring inline codes of the source segment"""
+    for child in list(seg):
+        seg.remove(child)
+    seg.text = None
+
+    # Open <g> tags: container of the content, closing code of a paired code
+    open_tags = [(seg, None)]
+    used_placeholders = set()
+
+    for kind, text, tag_id in inline_markup.events(segment):
+        container = open_tags[-1][0]
+        code = codes.get(tag_id)
+
+        if kind == 'text':
+            _append_text(container, text)
+        elif kind == 'start':
+            if code is None or code.kind != 'g':
+                open_tags.append((container, None))
+            elif len(code.elements) == 2:
+                _append_copy(container, code.elements[0])
+                open_tags.append((container, code.elements[1]))
+            else:
+                highlight = code.elements[0]
+                open_tags.append((seg.makeelement(highlight.tag, highlight.attrib), None))
+                container.append(open_tags[-1][0])
+        elif kind == 'end':
+            if len(open_tags) > 1:
+                _close_tag(open_tags.pop())
+        elif code is not None and code.kind == 'x' and tag_id not in used_placeholders:
+            used_placeholders.add(tag_id)
+            _append_copy(container, code.elements[0])
+
+    while len(open_tags) > 1:
+        _close_tag(open_tags.pop())
+
+    # Keep inline codes that were dropped from the translation
+    for tag_id, code in sorted(codes.items()):
+        if code.kind == 'x' and tag_id not in used_placeholders:
+            _append_copy(seg, code.elements[0])
+
+
+def _convert_content(container, parts, codes):
+    """Appends XLF-Inline representation of the element content to 'parts'"""
+    children = list(container)
+    pairs = _get_pairs(children)
+    closing = {}
+
+    if container.text:
+        parts.append(inline_markup.escape(container.text))
+
+    for index, child in enumerate(children):
+        if index in pairs:
+            codes[len(codes) + 1] = Code('g', (child, children[pairs[index]]))
+            closing[pairs[index]] = len(codes)
+            parts.append(inline_markup.start_tag(len(codes)))
+        elif index in closing:
+            parts.append(inline_markup.end_tag())
+        elif child.tag == 'hi':
+            codes[len(codes) + 1] = Code('g', (child, ))
+            parts.append(inline_markup.start_tag(len(codes)))
+            _convert_content(child, parts, codes)
+            parts.append(inline_markup.end_tag())
+        else:
+            codes[len(codes) + 1] = Code('x', (child, ))
+            parts.append(inline_markup.placeholder(len(codes)))
+
+        if child.tail:
+            parts.append(inline_markup.escape(child.tail))
+
+
+def _get_pairs(children):
+    """Returns indices of properly nested <bpt> elements mapped to indices of their <ept> elements"""
+    pairs = {}
+    open_codes = []
+
+    for index, child in enumerate(children):
+        if child.tag == 'bpt':
+            open_codes.append((child.get('i'), index))
+        elif child.tag == 'ept':
+            for position in range(len(open_codes) - 1, -1, -1):
+                if open_codes[position][0] == child.get('i'):
+                    # Codes opened after the matching one are not closed in order and stay unpaired
+                    pairs[open_codes[position][1]] = index
+                    del open_codes[position:]
+                    break
+
+    return pairs
+
+
+def _close_tag(open_tag):
+    container, closing_code = open_tag
+    if closing_code is not None:
+        _append_copy(container, closing_code)
+
+
+def _append_copy(container, element):
+    element = copy.deepcopy(element)
+    element.tail = None
+    container.append(element)
+
+
+def _append_text(container, text):
+    if len(container):
+        container[-1].tail = (container[-1].tail or '') + text
+    else:
+        container.text = (container.text or '') + text
@@ -0,0 +1,123 @@
+"""Translation memory of previous translations loaded from a TMX document, for pre-translation of segments
+before they are sent to machine translation. Only segments without inline tags are matched, as inline tags
+of the memory and the document can't be aligned"""
+
+import difflib
+import logging
+from collections import Counter, defaultdict
+
+from lxml import etree
+from tildemt.file_translator import inline_markup, tmx_markup
+
+# Fuzzy matches are scored for the memory segments sharing most words with the segment
+FUZZY_CANDIDATES = 10
+
+
+def normalize(segment):
+    """Returns the segment with whitespace collapsed, as whitespace differences don't affect the translation"""
+    return ' '.join(segment.split())
+
+
+def is_tag_free(segment):
+    return inline_markup.INLINE_TAG.search(segment) is None
+
+
+class TranslationMemory():
+    """Index of tag-free translation units of a TMX document by source segment.
+    'fuzzy_threshold' - minimal similarity (0-1) of a fuzzy match, only exact matches are used if 1"""
+    def __init__(self, fuzzy_threshold=1):
+        self.__logger = logging.getLogger('TranslationMemory')
+        self.fuzzy_threshold = fuzzy_threshold
+
+        self.__translations = {}
+
+        # Sources of the translations and ids of the sources by word, for fuzzy matching
+        self.__sources = []
+        self.__words = defaultdict(list)
+
+    def __len__(self):
+        return len(self.__translations)
+
+    def load(self, tmx_path, source_lang, target_lang):
+        """Adds translation units of the TMX document with variants of the languages"""
+        units = 0
+        for _, tu in etree.iterparse(tmx_path, tag='tu', huge_tree=True, resolve_entities=False):
+            units += 1
+            source = self.__get_segment(tu, source_lang)
+            target = self.__get_segment(tu, target_lang) if source else None
+
+            if target:
+                self.__add(source, target)
+
+            # Units are not kept in the parsed tree
+            tu.clear()
+            while tu.getprevious() is not None:
+                del tu.getparent()[0]
+
+        self.__logger.info("Loaded %d of %d translation units from %s", len(self), units, tmx_path)
+
+    def lookup(self, segment):
+        """Returns translation of the segment or None if the memory has no match for it"""
+        if not is_tag_free(segment):
+            return None
+
+        key = normalize(segment)
+        translation = self.__translations.get(key)
+
+        if translation is None and self.fuzzy_threshold < 1 and key:
+            translation = self.__lookup_fuzzy(key)
+
+        return translation
+
+    def __lookup_fuzzy(self, key):
+        words = set(key.lower().split())
+
+        shared_words = Counter()
+        for word in words:
+            shared_words.update(self.__words.get(word, ()))
+
+        best_translation = None
+        best_score = self.fuzzy_threshold
+        for source_id, _ in shared_words.most_common(FUZZY_CANDIDATES):
+            source = self.__sources[source_id]
+
+            matcher = difflib.SequenceMatcher(None, key, source, autojunk=False)
+            # Upper bounds are cheaper than the similarity itself
+            if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+                continue
+
+            score = matcher.ratio()
+            if score >= best_score:
+                best_translation, best_score = self.__translations[source], score
+
+        return best_translation
+
+    def __add(self, source, target):
+        key = normalize(source)
+        if key in self.__translations:
+            # Later units of the memory replace earlier ones
+            self.__translations[key] = target
+            return
+
+        self.__translations[key] = target
+
+        if self.fuzzy_threshold < 1:
+            for word in set(key.lower().split()):
+                self.__words[word].append(len(self.__sources))
+            self.__sources.append(key)
+
+    @staticmethod
+    def __get_segment(tu, language):
+        """Returns tag-free inline segment of the unit variant of the language or None"""
+        language = language.lower()
+        for prefix in dict.fromkeys((language, language[:2])):
+            for tuv in tu.iterfind('tuv'):
+                if (tmx_markup.get_language(tuv) or '').lower().startswith(prefix):
+                    seg = tuv.find('seg')
+                    if seg is None:
+                        return None
+
+                    segment, codes = tmx_markup.to_inline(seg)
+                    return segment.strip() if not codes else None
+
+        return None
@@ -1,16 +1,51 @@
+import io
 import os
-import re
 import zipfile
 import logging
-from lxml import etree
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
 from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.file_translator import docx_filter
+from tildemt.file_translator.ooxml import OOXMLDocument, OOXMLUnsupportedError
 from tildemt.file_translator.types.tikal import TikalTranslator
+from tildemt.utils import accounting, metrics, tracing
+from tildemt.utils.zip_archive import copy_member
 
 MAX_FILE_SIZE = 100 * 1024 * 1024
 
+# Translate common documents in-process, Okapi Tikal is used only for unsupported documents
+NATIVE_OOXML = os.environ.get("NATIVE_OOXML", "true").lower() == "true"
+
+# Worker processes for filtering document parts, parts are filtered in the current process if set to 1.
+# Worker processes are opt-in, as CPU cores seen in a container are not its CPU quota
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", "1"))
+
+
+def check_archive_size(archive):
+    """Raises FileTranslationException if uncompressed size of the archive exceeds the limit"""
+    logger = logging.getLogger('DOCXTranslator')
+
+    archive_size = sum(e.file_size for e in archive.infolist())
+    logger.info('Archive size: %s MB, limit: %s MB', archive_size / 1024 / 2024, MAX_FILE_SIZE / 1024 / 1024)
+
+    if(archive_size > MAX_FILE_SIZE):
+        logger.error('Archive size limit reached: %s', archive_size)
+        raise FileTranslationException(FileTranslationSubstatus.BAD_FILE, f"Archive size limit reached")
+
+
 class DOCXTranslator(TikalTranslator):
     """Handles the DOCX file translation"""
+
+    # Translate identical segments of the document once, when translated in-process
+    deduplicate_segments = False
+
+    # Process pool shared by all translations for filtering document parts
+    __preprocess_executor = None
+    __preprocess_executor_lock = threading.Lock()
+
     def __init__(self, metadata):
         self.__logger = logging.getLogger('DOCXTranslator')
         self.__logger.info("Initializing DOCX Translator")
@@ -30,17 +65,14 @@ class DOCXTranslator(TikalTranslator):
         try:
             with zipfile.ZipFile(source_file, 'r') as source:
                 with zipfile.ZipFile(tmp_file, 'w') as target:
-                    archive_size = sum(e.file_size for e in source.infolist())
-                    self.__logger.info('Archive size: %s MB, limit: %s MB', archive_size / 1024 / 2024, MAX_FILE_SIZE / 1024 / 1024)
+                    check_archive_size(source)
 
-                    if(archive_size > MAX_FILE_SIZE):
-                        self.__logger.error('Archive size limit reached: %s', archive_size)
-                        raise FileTranslationException(FileTranslationSubstatus.BAD_FILE, f"Archive size limit reached")
-
-                    for item in source.infolist():
-                        buffer = source.read(item.filename)
-                        buffer = self.__filter_xml_file(item.filename, buffer)
-                        target.writestr(item, buffer)
+                    for item, buffer in self.__filter_xml_files(source):
+                        if buffer is None:
+                            # Media and other parts are copied without decompressing
+                            copy_member(source, target, item)
+                        else:
+                            target.writestr(item, buffer)
 
         except FileTranslationException:
             raise
@@ -55,187 +87,126 @@ class DOCXTranslator(TikalTranslator):
         os.rename(tmp_file, source_file)
         return source_file
 
-    @staticmethod
-    def __filter_xml_file(filename, buffer):
-        "Remove unallowed tags from XML file buffer string"
-        marginals = re.match(r'.*(header|footer)\d+\.xml$', filename)
-
-        if filename.endswith('document.xml'):
-            xml_doc = etree.fromstring(buffer, etree.XMLParser(recover=False))
-
-            # remove field element tags and properties, keep content
-            etree.strip_tags(
-                xml_doc,
-                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}fldSimple',
-                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sdt',
-                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sdtContent',
-                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}softHyphen' # remove softHyphen (¬)
-            )
-
-            etree.strip_elements(
-                xml_doc,
-                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sdtPr',
-                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}sdtEndPr',
-                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}instrText',
-                '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}fldChar'
-            )
-
-            deletable = []
-
-            # merge broken words (partially formatted words are split into several text elements)
-            # paragraphs:
-            text_break = r'\s|\W'
-
-            for paragraph in xml_doc.iterfind('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p'):
-                paragraph_elements = paragraph.findall(
-                    './{http://schemas.openxmlformats.org/wordprocessingml/2006/main}r/*'
-                )
-                txt_elements = paragraph.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t')
-                if len(txt_elements) < 2:
+    def __filter_xml_files(self, source):
+        """Yields archive members in the original order together with filtered XML file buffer,
+        or None if member does not need filtering. Document parts are filtered concurrently in worker processes"""
+
+        items = source.infolist()
+        filtered_items = [item for item in items if docx_filter.needs_filtering(item.filename)]
+
+        if PREPROCESS_WORKERS < 2 or len(filtered_items) < 2:
+            for item in items:
+                if docx_filter.needs_filtering(item.filename):
+                    with source.open(item) as part:
+                        yield item, docx_filter.filter_xml_file(item.filename, part)
+                else:
+                    yield item, None
+            return
+
+        self.__logger.info("Filtering %d document parts in worker processes", len(filtered_items))
+
+        executor = self.__get_preprocess_executor()
+        # Limit the parts read ahead, so that the whole document is not held in memory
+        max_pending = PREPROCESS_WORKERS * 2
+        pending = deque()
+        submitted = 0
+
+        try:
+            for item in items:
+                if not docx_filter.needs_filtering(item.filename):
+                    yield item, None
                     continue
-                last_txt_elem = txt_elements[-1]
-                merged_word = ''
-                word_start = None
-                word_parts = 0
-
-                for element in paragraph_elements:
-                    if (
-                        element.tag in (
-                            '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}tab',
-                            '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}br',
-                            '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}cr',
-                            '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}noBreakHyphen'
+
+                while submitted < len(filtered_items) and len(pending) < max_pending:
+                    pending_item = filtered_items[submitted]
+                    pending.append(
+                        executor.submit(
+                            docx_filter.filter_xml_buffer,
+                            pending_item.filename,
+                            source.read(pending_item)
                         )
-                    ):
-                        if word_parts > 1:
-                            word_start.text = merged_word
-                        merged_word = ''
-                        word_parts = 0
-                        word_start = None
-                    elif element.tag == '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rPr':
-                        # check if text has superscript or subscript formatting
-                        # iterates over elements properties and checks for vertAlign
-                        for run_props in element:
-                            if (
-                                (
-                                    run_props.tag
-                                    == '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}vertAlign'
-                                ) and (
-                                    run_props.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val')
-                                    == 'superscript' or
-                                    run_props.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val')
-                                    == 'subscript'
-                                )
-                            ):
-                                if word_parts > 1:
-                                    word_start.text = merged_word
-                                merged_word = ''
-                                word_parts = 0
-                                word_start = None
-                    elif element.tag == '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t' and element.text:
-                        # if text element starts with space or a non word chararcter
-                        if re.match(text_break, element.text[0]):
-                            if word_parts > 1:
-                                word_start.text = merged_word
-                            merged_word = ''
-                            word_parts = 0
-                            word_start = None
-                            # if broken word starts with space
-                            if not re.match(text_break, element.text[-1]):
-                                merged_word += element.text
-                                word_parts += 1
-                                word_start = element
-                        # if text element ends with space or a non word chararcter or it is last in paragraph
-                        elif re.match(text_break, element.text[-1]) or element == last_txt_elem:
-                            if word_parts >= 1:
-                                merged_word += element.text
-                                word_start.text = merged_word
-                                deletable.append(element)
-                            merged_word = ''
-                            word_parts = 0
-                            word_start = None
-                        else:
-                            merged_word += element.text
-                            if word_parts > 0:
-                                deletable.append(element)
-                            word_parts += 1
-                            if word_start is None:
-                                word_start = element
-
-            DOCXTranslator.__remove_tags(deletable)
-            deletable = []
-
-            for tag in xml_doc.iter():
-                tag_name = tag.tag
-
-                #seems to be fixed in latest tikal
-                #if tag_name.endswith('ins'):
-                # Track Changes detected within the document - further processing with Tikal is not possible
-                #    raise FileTranslationException(FileTranslationErrorType.TRACK_CHANGES_ENABLED)
-
-                if (
-                    'proofErr' in tag_name # Spellcheck information
-                    or '{http://schemas.openxmlformats.org/drawingml/2006/main}txSp' in tag_name or
-                    'commentRangeStart' in tag_name # Comments
-                    or 'commentRangeEnd' in tag_name # Empty text runs
-                    or (tag_name == 'w:r' and not tag.getchildren())
-                ):
-                    deletable.append(tag)
-
-            DOCXTranslator.__remove_tags(deletable)
-            buffer = etree.tostring(xml_doc)
-
-        elif filename.endswith('comments.xml'):
-            deletable = []
-            xml_doc = etree.fromstring(buffer, etree.XMLParser(recover=False))
-
-            for tag in xml_doc.iter():
-                tag_name = tag.tag
-                if 'proofErr' in tag_name:
-                    deletable.append(tag)
-
-            DOCXTranslator.__remove_tags(deletable)
-            buffer = etree.tostring(xml_doc)
-
-        elif marginals:
-            deletable = []
-            xml_doc = etree.fromstring(buffer, etree.XMLParser(recover=False))
-
-            for tag in xml_doc.iter():
-                tag_name = tag.tag
-                if (
-                    'proofErr' in tag_name or
-                    #let those posers live
-                    #'AlternateContent' in tag_name or
-                    'commentRangeStart' in tag_name or 'commentRangeEnd' in tag_name or
-                    (tag_name == 'w:r' and not tag.getchildren())
-                ):
-                    deletable.append(tag)
-
-            if tag_name.endswith('ins'):
-                # Track Changes detected within the document - further processing with Tikal is not possible
-                raise FileTranslationException(FileTranslationSubstatus.TRACK_CHANGES_ENABLED)
-
-            DOCXTranslator.__remove_tags(deletable)
-            buffer = etree.tostring(xml_doc)
-
-        return buffer
-
-    @staticmethod
-    def __remove_tags(tags):
-        "Remove tags from document"
-        for tag in tags:
+                    )
+                    submitted += 1
+
+                filtered, cpu_seconds = pending.popleft().result()
+                # Worker processes are not children finished while the job is running, so they are counted here
+                accounting.count('childCpuSeconds', cpu_seconds)
+                yield item, filtered
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @classmethod
+    def start_preprocess_workers(cls):
+        """Starts the worker processes filtering document parts"""
+        if PREPROCESS_WORKERS > 1:
+            executor = cls.__get_preprocess_executor()
+            for future in [executor.submit(os.getpid) for _ in range(PREPROCESS_WORKERS)]:
+                future.result()
+
+    @classmethod
+    def __get_preprocess_executor(cls):
+        with cls.__preprocess_executor_lock:
+            if cls.__preprocess_executor is None:
+                # Worker processes are spawned, as forking a process with running threads is unsafe
+                cls.__preprocess_executor = ProcessPoolExecutor(
+                    max_workers=PREPROCESS_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+
+        return cls.__preprocess_executor
+
+    def translate_native(self, source_file, target_file):
+        """Translates the document in-process, returns False if the document has to be translated using Tikal"""
+        if not NATIVE_OOXML:
+            return False
+
+        extension = os.path.splitext(source_file)[1][1:].lower()
+        document = OOXMLDocument(source_file, extension)
+
+        with metrics.stage('extract'), \
+                tracing.span('ooxml.extract', bytes=os.path.getsize(source_file)) as extract_span:
+            try:
+                segments = document.extract()
+            except OOXMLUnsupportedError as ex:
+                self.__logger.info("Document can't be translated in-process, using Okapi Tikal: %s", ex)
+                extract_span.set_attributes(unsupported=str(ex))
+                return False
+            except Exception as ex:
+                self.__logger.exception("Error while extracting text from the input document")
+                raise FileTranslationException(FileTranslationSubstatus.BAD_FILE) from ex
+
+            extract_span.set_attributes(segments=len(segments))
+
+        if not segments:
+            # Text might be stored in the parts that are extracted only by Tikal
+            self.__logger.info("No text extracted in-process, using Okapi Tikal")
+            return False
+
+        # Identical segments are translated once
+        unique_segments = list(dict.fromkeys(segments)) if self.deduplicate_segments else segments
+        if len(unique_segments) < len(segments):
+            self.__logger.info("Translating %d unique segments of %d", len(unique_segments), len(segments))
+
+        self.translate_file(io.StringIO(''.join(f'{segment}\n' for segment in unique_segments)))
+
+        self.__logger.info("Writing translated segments to %s", target_file)
+        self.on_temp_file.fire(target_file)
+
+        translations = [self.postprocess_segment(segment).rstrip('\r\n') for segment in self.target_segments]
+        if unique_segments is not segments:
+            translations = dict(zip(unique_segments, translations))
+            translations = [translations[segment] for segment in segments]
+
+        with metrics.stage('merge'), tracing.span('ooxml.merge', segments=len(translations)) as merge_span:
             try:
-                DOCXTranslator.__remove_tag_hierarchy(tag)
-            except Exception:
-                logging.getLogger('DOCXTranslator').exception("Cannot remove tag from document")
-
-    @staticmethod
-    def __remove_tag_hierarchy(tag):
-        """Removes a tag and it's parents if the tag is the only child from a document"""
-        parent = tag.getparent()
-        while len(parent.getchildren()) == 1:
-            tag = parent
-            parent = parent.getparent()
-
-        parent.remove(tag)
+                document.merge(translations)
+                document.save(target_file)
+            except Exception as ex:
+                self.__logger.exception("Error while writing translations to the document")
+                raise FileTranslationException(FileTranslationSubstatus.BAD_FILE) from ex
+
+            merge_span.set_attributes(bytes=os.path.getsize(target_file))
+
+        return True
+
@@ -6,10 +6,19 @@ import io
 import logging
 import os.path
 import subprocess
+import threading
+import time
 
 from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
 from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.__about__ import __version__
 from tildemt.file_translator.xlf_inline import XLFInlineTranslator
+from tildemt.utils import accounting, deadlines, metrics, tracing
+from tildemt.utils.artifact_cache import ArtifactCache
+from tildemt.utils.file_hash import get_file_hash
+
+# Preprocessed source files and extracted XLF-Inline files of previously translated documents
+EXTRACTION_CACHE = ArtifactCache.from_environment("EXTRACTION_CACHE_DIR", "EXTRACTION_CACHE_SIZE")
 
 
 class TikalTranslator(XLFInlineTranslator):
@@ -17,6 +26,8 @@ class TikalTranslator(XLFInlineTranslator):
 
     # Tikal path
     __TIKAL_PATH = '/usr/local/lib/okapi_tikal/tikal.sh'
+    # Interval for checking new content in the XLF-Inline file written by Tikal (In seconds)
+    __TAIL_INTERVAL = 0.1
 
     # Don't generate source MXLF file if it's created already by preprocess method for example
     reuse_mxlf = False
@@ -31,6 +42,9 @@ class TikalTranslator(XLFInlineTranslator):
         # Tikal option - Identifier of the filter configuration to use for the extraction
         self.tikal_filter = tikal_filter
 
+        # Path of the XLF-Inline file extracted by Tikal in this translation
+        self.__extracted_filepath = None
+
         super().__init__(metadata)
 
     def translate(self, source_file, target_file):
@@ -40,16 +54,38 @@ class TikalTranslator(XLFInlineTranslator):
 
         self.__logger.info("Translating document from %s to %s", source_file, target_file)
 
-        # call pre processing of the source file
-        source_file = self.preprocess(source_file)
+        cache_key = self.__get_cache_key(source_file)
 
-        # Extract inline contents of the source file
-        inline_source_filepath = self.__to_inline(source_file)
+        if cache_key and EXTRACTION_CACHE.get(cache_key, 'source', source_file):
+            self.__logger.info("Using cached preprocessed source file")
+            accounting.count_cache_hit('preprocessed')
+        else:
+            deadlines.check('preprocess')
 
-        # Call the XLFInlineTranslator's translation method with inline stream
-        # and document format appropriate parameters
-        with io.open(inline_source_filepath, 'r', encoding='utf-8', newline='') as inline_source_file:
-            super().translate_file(inline_source_file)
+            # call pre processing of the source file
+            with metrics.stage('preprocess'), tracing.span('preprocess'):
+                source_file = self.preprocess(source_file)
+
+            deadlines.check('preprocess')
+
+            if cache_key:
+                EXTRACTION_CACHE.put(cache_key, 'source', source_file)
+
+        if not self.translate_native(source_file, target_file):
+            self.__translate_with_tikal(source_file, target_file, cache_key)
+
+        # call post processing of the target file
+        self.postprocess(target_file)
+
+    def __translate_with_tikal(self, source_file, target_file, cache_key=None):
+        """Translates preprocessed 'source_file' through XLF-Inline extracted by Okapi Tikal"""
+
+        # Call the XLFInlineTranslator's translation method with inline contents of the source file.
+        # Segments are streamed to translation while Tikal is still extracting the rest of the document
+        super().translate_file(self.__to_inline(source_file, cache_key))
+
+        if cache_key and self.__extracted_filepath:
+            EXTRACTION_CACHE.put(cache_key, 'mxlf', self.__extracted_filepath)
 
         inline_target_filepath = f'{target_file}.mxlf.{self.target_lang.lower()}'
         self.__logger.info("Writing translated segments to %s", inline_target_filepath)
@@ -64,14 +100,26 @@ class TikalTranslator(XLFInlineTranslator):
         # Create the final translation document
         self.__from_inline(inline_target_filepath, source_file, target_file)
 
-        # call post processing of the target file
-        self.postprocess(target_file)
+    @classmethod
+    def start_tikal(cls):
+        """Runs Tikal listing its filter configurations, so that the JVM and Okapi libraries are read from disk
+        before the first document"""
+        if not os.path.isfile(cls.__TIKAL_PATH):
+            logging.getLogger('TikalTranslator').warning("Okapi Tikal is not installed at %s", cls.__TIKAL_PATH)
+            return
+
+        subprocess.run([cls.__TIKAL_PATH, '-lfc'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
 
     @staticmethod
     def preprocess(source_file):
         """Pre processing of the target file and return preprocessed file path"""
         return source_file
 
+    def translate_native(self, source_file, target_file):
+        """Translates preprocessed 'source_file' to 'target_file' without Okapi Tikal.
+        Returns False if the document has to be translated using Tikal"""
+        return False
+
     def postprocess(self, target_file):
         """Post processing of the target file"""
 
@@ -80,16 +128,49 @@ class TikalTranslator(XLFInlineTranslator):
         """Post processing of the translation of the segment"""
         return segment
 
-    def __to_inline(self, source_file):
-        """Extracts XLF-Inline content from the provided source file using Okapi Tikal"""
+    def __get_cache_key(self, source_file):
+        """Returns extraction cache key of the source file or None if extraction cache is disabled"""
+        if not EXTRACTION_CACHE:
+            return None
+
+        return ArtifactCache.get_key(
+            __version__,
+            self.metadata.get('sourceHash') or get_file_hash(source_file),
+            type(self).__name__,
+            self.tikal_filter,
+            self.source_lang.lower()
+        )
+
+    def __to_inline(self, source_file, cache_key=None):
+        """Extracts XLF-Inline content from the provided source file using Okapi Tikal.
+        Yields lines of the XLF-Inline file as soon as Tikal has written them"""
 
-        exit_code = -1
         target = f"{source_file}.mxlf.{self.source_lang.lower()}"
 
+        if cache_key and EXTRACTION_CACHE.get(cache_key, 'mxlf', target):
+            self.__logger.info("Using cached XLF-Inline file. Skip convertion.")
+            accounting.count_cache_hit('extracted')
+            self.on_temp_file.fire(target)
+            with io.open(target, 'r', encoding='utf-8', newline='') as inline_source_file:
+                yield from inline_source_file
+            return
+
         if self.reuse_mxlf and os.path.exists(target):
             self.__logger.info("XLF-Inline file exists already. Skip convertion.")
-            return target
+            self.on_temp_file.fire(target)
+            with io.open(target, 'r', encoding='utf-8', newline='') as inline_source_file:
+                yield from inline_source_file
+            return
+
+        deadlines.check('extract')
 
+        exit_code = -1
+        # Span is not made current, as the extraction is interleaved with translation of the segments
+        extract_span = tracing.start_span(
+            'tikal.extract',
+            filter=self.tikal_filter or '',
+            bytes=os.path.getsize(source_file)
+        )
         try:
             arguments = [self.__TIKAL_PATH, '-xm', source_file, '-sl', self.source_lang.lower(), '-to', target]
             # add format specific extraction filter if specified
@@ -100,22 +181,20 @@ class TikalTranslator(XLFInlineTranslator):
             self.__logger.debug('Tikal parameters: %s', arguments)
 
             with subprocess.Popen(arguments, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=None) as process:
-                for line in process.stdout.readlines():
-                    self.__logger.info(line.decode('utf-8'))
+                # Tikal output has to be drained while the extracted file is read, otherwise Tikal may block on it
+                output_reader = threading.Thread(target=self.__log_output, args=(process.stdout, ), daemon=True)
+                output_reader.start()
+
+                try:
+                    yield from self.__tail_inline(process, target)
+                except BaseException:
+                    # Translation has been stopped or the deadline has passed, there is no need to finish
+                    # the extraction
+                    process.kill()
+                    raise
 
                 exit_code = process.wait()
-
-            # Sometimes mxliff target file name is appended with source language code by tikal,
-            # so check if target file exists, and return first file with extention if it does not
-            if not os.path.isfile(target):
-                self.__logger.warning(
-                    "XLF-Inline output file %s does not exist. Looking for file with extension",
-                    target
-                )
-                candidates = glob.glob(target + '*')
-                if candidates:
-                    target = candidates[0]
-                    self.__logger.info("XLF-Inline output file changed to %s", target)
+                output_reader.join()
 
         except (subprocess.SubprocessError, ValueError, OSError) as ex:
             self.__logger.exception("Error extracting inline contents from the source document")
@@ -124,16 +203,77 @@ class TikalTranslator(XLFInlineTranslator):
         finally:
             self.on_temp_file.fire(target)
 
+            extract_span.set_attributes(exitCode=exit_code)
+            extract_span.end()
+
         if exit_code != 0:
             self.__logger.error("Okapi Tikal quit with status code %d", exit_code)
             raise FileTranslationException(FileTranslationSubstatus.BAD_FILE)
 
-        return target
+    def __tail_inline(self, process, target):
+        """Reads the XLF-Inline file while Tikal is writing it and yields complete lines"""
+
+        inline_source_filepath = None
+        while inline_source_filepath is None:
+            finished = process.poll() is not None
+            inline_source_filepath = self.__find_inline_file(target)
+
+            if inline_source_filepath is None:
+                if finished:
+                    self.__logger.warning("XLF-Inline output file %s has not been created", target)
+                    return
+                deadlines.check('extract')
+                time.sleep(self.__TAIL_INTERVAL)
+
+        if inline_source_filepath != target:
+            self.on_temp_file.fire(inline_source_filepath)
+
+        self.__extracted_filepath = inline_source_filepath
+
+        with io.open(inline_source_filepath, 'r', encoding='utf-8', newline='') as inline_source_file:
+            buffer = ''
+            while True:
+                finished = process.poll() is not None
+                chunk = inline_source_file.read()
+
+                if chunk:
+                    lines = io.StringIO(buffer + chunk, newline='').readlines()
+                    # Last line might still be written by Tikal
+                    buffer = lines.pop() if not finished and not lines[-1].endswith('\n') else ''
+                    yield from lines
+                elif finished:
+                    break
+                else:
+                    deadlines.check('extract')
+                    time.sleep(self.__TAIL_INTERVAL)
+
+            if buffer:
+                yield buffer
+
+    def __find_inline_file(self, target):
+        """Returns path of the XLF-Inline file created by Tikal or None if it does not exist yet"""
+        if os.path.isfile(target):
+            return target
+
+        # Sometimes mxliff target file name is appended with source language code by tikal,
+        # so return first file with extention if target file does not exist
+        candidates = glob.glob(target + '*')
+        if candidates:
+            self.__logger.info("XLF-Inline output file changed to %s", candidates[0])
+            return candidates[0]
+
+        return None
+
+    def __log_output(self, stream):
+        for line in stream:
+            self.__logger.info(line.decode('utf-8'))
 
     def __from_inline(self, inline_source_file, source_file, target_file):
         """Merges XLF-Inline document back to original document format
         using original document as a template"""
 
+        deadlines.check('merge')
+
         exit_code = -1
         try:
             arguments = [
@@ -162,11 +302,24 @@ class TikalTranslator(XLFInlineTranslator):
             self.__logger.info("Merging XLF-Inline back to the document")
             self.__logger.debug('Tikal parameters: %s', arguments)
 
-            with subprocess.Popen(arguments, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=None) as process:
-                for line in process.stdout.readlines():
-                    self.__logger.info(line.decode('utf-8'))
+            with tracing.span('tikal.merge', filter=self.tikal_filter or '') as merge_span:
+                merge_span.set_attributes(bytes=os.path.getsize(inline_source_file))
 
-                exit_code = process.wait()
+                with subprocess.Popen(arguments, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=None) as process:
+                    try:
+                        # Merge does not outlast the deadline of the job
+                        output, _ = process.communicate(timeout=deadlines.remaining())
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+                        process.communicate()
+                        deadlines.exceeded('merge')
+
+                    for line in output.splitlines(keepends=True):
+                        self.__logger.info(line.decode('utf-8'))
+
+                    exit_code = process.returncode
+
+                merge_span.set_attributes(exitCode=exit_code)
 
         except (subprocess.SubprocessError, ValueError, OSError) as ex:
             self.__logger.exception("Error converting translated content to the original document format")
@@ -1,80 +1,259 @@
-#!/usr/bin/python
-
 import logging
-import subprocess
-from tildemt.file_translator.types.tikal import TikalTranslator
+from collections import deque, namedtuple
+from lxml import etree
+from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
+from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.file_translator import tmx_markup
+from tildemt.file_translator.xlf_inline import XLFInlineTranslator
+from tildemt.utils import tracing
+
+# Translation unit waiting for translation. 'seg' - target segment element to be filled with translation,
+# 'lead' and 'trail' - whitespace of the source segment that is not sent to translation
+Unit = namedtuple('Unit', ['segment', 'codes', 'seg', 'lead', 'trail'])
 
 
-class TMXTranslator(TikalTranslator):
-    """Handles the TMX file translation"""
+class TMXTranslator(XLFInlineTranslator):
+    """Handles the TMX file translation. Translation units are read and written incrementally,
+    so that translation memories of any size are translated in constant memory"""
     def __init__(self, metadata):
         self.__logger = logging.getLogger('TMXTranslator')
         self.__logger.info("Initializing TMX Translator")
-        super().__init__(metadata, translation_options=['inline'], overwrite_translation=True)
+        super().__init__(metadata)
+
+        # Language codes used in the document, detected from the first matching translation unit variants
+        self.__source_code = None
+        self.__target_code = None
 
-        # check if set to keep existing primary tanslations, only append new one to <alt-trans /> node
-        if not self.replace_target:
-            self.overwrite_translation = False
+        # Count of translation units that already have a translation
+        self.__skipped_units = 0
 
     def translate(self, source_file, target_file):
         """ Translates the 'source_file' to 'target_file'
         'source_file' - path to an existing local file
         'target_file' - path to local translated file to be created in the translation process"""
 
-        # When working with TMX files, language codes provided in metadata and actual XML node attributes might differ
-        # Okapi Tikal needs to know the which are the real source and target language codes (found in TMX file)
-        self.source_lang = self.get_tmx_lang(source_file, self.source_lang)
-        self.__logger.info("Using %s as TMX source language", self.source_lang)
-        self.target_lang = self.get_tmx_lang(source_file, self.target_lang)
+        self.__logger.info("Translating TMX document from %s to %s", source_file, target_file)
+        self.on_temp_file.fire(target_file)
+
+        try:
+            with etree.xmlfile(target_file, encoding='utf-8') as output:
+                output.write_declaration()
+                self.__translate_document(source_file, output)
+
+        except FileTranslationException:
+            raise
+
+        except etree.XMLSyntaxError as ex:
+            self.__logger.exception("Error while reading the input document")
+            raise FileTranslationException(FileTranslationSubstatus.BAD_FILE) from ex
+
+        if self.__skipped_units:
+            self.__logger.info("Kept %d translation units with existing translations", self.__skipped_units)
+
+    def __translate_document(self, source_file, output):
+        """Copies the document to 'output', translating units of the body"""
+        events = etree.iterparse(
+            source_file,
+            events=('start', 'end', 'comment', 'pi'),
+            huge_tree=True,
+            resolve_entities=False
+        )
+
+        # Comments and processing instructions before the root element
+        prolog = []
+        event, root = next(events)
+        while event != 'start':
+            prolog.append(root)
+            event, root = next(events)
+
+        if root.tag != 'tmx':
+            raise FileTranslationException(FileTranslationSubstatus.BAD_FILE, "Document is not a TMX document")
+
+        # Document type declaration is known only when the root element starts
+        doctype = root.getroottree().docinfo.doctype
+        if doctype:
+            output.write_doctype(doctype)
+
+        for node in prolog:
+            output.write(node, with_tail=False)
+
+        with output.element(root.tag, dict(root.attrib)):
+            for event, element in events:
+                if element.getparent() is not root or event == 'end':
+                    continue
+
+                # Text before the element is known as soon as the element starts, text after it only later
+                previous = element.getprevious()
+                output.write((root.text if previous is None else previous.tail) or '')
+
+                if element.tag == 'body':
+                    with output.element(element.tag, dict(element.attrib)):
+                        self.__translate_body(events, element, output)
+                elif event == 'start':
+                    output.write(self.__read_element(events, element), with_tail=False)
+                else:
+                    output.write(element, with_tail=False)
+
+            if len(root):
+                output.write(root[-1].tail or '')
+
+    @staticmethod
+    def __read_element(events, element):
+        """Reads events until the end of the element, returns the complete element"""
+        for event, current in events:
+            if event == 'end' and current is element:
+                break
+
+        return element
+
+    def __translate_body(self, events, body, output):
+        """Translates units of the body while they are read. Units waiting for translation and units
+        that don't need translation, but follow them, are kept until the translation is received.
+        Time of reading and writing units is measured by the extract and merge stages of the translation"""
+        # Unit element, unit prepared for translation or None
+        pending = deque()
+
+        # Spans are not made current, as reading and writing of units are interleaved with their translation
+        extract_span = tracing.start_span('tmx.extract')
+        merge_span = tracing.start_span('tmx.merge')
+        read_units_count = 0
+        written_units_count = 0
+
+        def read_element(element):
+            nonlocal read_units_count
+
+            # Detach the element, so that the parsed document does not grow
+            body.remove(element)
+            if element.tag == 'tu':
+                read_units_count += 1
 
-        self.__logger.info("Using %s as TMX target language", self.target_lang)
+            unit = self.__prepare_unit(element) if element.tag == 'tu' else None
 
-        super().translate(source_file, target_file)
+            if unit is None and not pending:
+                output.write(element)
+                return
 
-    def get_tmx_lang(self, filepath, lang_code):
-        """Calls a Perl script that tries to get the real language provided in TMX document based on attribute values
-        'filepath' - path to tmx file to process
-        'lang_code' - language code to look for in the document"""
+            pending.append((element, unit))
+            if unit is not None:
+                yield unit.segment
+
+        def read_units():
+            try:
+                for event, element in events:
+                    if element is body:
+                        break
+
+                    if event == 'end' or element.getparent() is not body:
+                        continue
+
+                    # Parser reads ahead, the previous element and the text after it are complete only
+                    # when the next element starts
+                    previous = element.getprevious()
+                    if previous is None:
+                        output.write(body.text or '')
+                    else:
+                        yield from read_element(previous)
+
+                if len(body):
+                    yield from read_element(body[-1])
+                else:
+                    output.write(body.text or '')
+            finally:
+                extract_span.set_attributes(units=read_units_count)
+                extract_span.end()
 
-        exit_code = -1
-        temp_lang = ''
         try:
-            arguments = ['perl', self.tools_dir + '/scripts/guessLang.pl', filepath, lang_code]
-            self.__logger.info("Trying to guess TMX provided language for %s", lang_code)
-            self.__logger.debug('Lang gueser parameters: %s', arguments)
-
-            with subprocess.Popen(arguments, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=None) as process:
-                for line in process.stdout.readlines():
-                    line = line.strip().decode('utf-8')
-                    self.__logger.info(line)
-                    if line:
-                        temp_lang = line
-
-                exit_code = process.wait()
-
-        except Exception:
-            self.__logger.exception(
-                "An exception occurred while trying to get the language code from TMX file! Falling back to default"
-            )
-            return lang_code
-
-        if exit_code != 0:
-            self.__logger.warning("guesLang.pl quit with status code %d. See debug log for more information", exit_code)
-            return lang_code
-
-        if temp_lang == 'ERR':
-            if len(lang_code) > 2:
-                # If non ISO 639-1 language code is provided, shorten it and search again
-                # For example, 'en' matches 'en', 'eng', 'en-US', 'en-GB' etc.
-                self.__logger.info(
-                    "Trying to get the real TMX language again using ISO 639-1 language code %s",
-                    lang_code[:2]
-                )
-                return self.get_tmx_lang(filepath, lang_code[:2])
-            else:
-                self.__logger.warning(
-                    "Error while trying to get the language code from TMX file! Falling back to default"
-                )
-                return lang_code
-
-        return temp_lang
+            for translation in self.translate_segments(read_units()):
+                element, unit = pending.popleft()
+                while unit is None:
+                    output.write(element)
+                    element, unit = pending.popleft()
+
+                tmx_markup.from_inline(unit.seg, f'{unit.lead}{translation.strip()}{unit.trail}', unit.codes)
+                output.write(element)
+                written_units_count += 1
+
+        except FileTranslationException as ex:
+            # Document is valid if all units have translations already
+            if ex.error_type != FileTranslationSubstatus.NO_TEXT_EXTRACTED or not self.__skipped_units:
+                merge_span.set_error(repr(ex))
+                raise
+        finally:
+            merge_span.set_attributes(translatedUnits=written_units_count)
+            merge_span.end()
+
+        for element, _ in pending:
+            output.write(element)
+
+    def __prepare_unit(self, tu):
+        """Returns translation unit prepared for translation or None if the unit does not need translation"""
+        tuvs = tu.findall('tuv')
+
+        source_tuv, self.__source_code = self.__find_variant(tuvs, self.source_lang, self.__source_code, 'source')
+        if source_tuv is None:
+            return None
+
+        source_seg = source_tuv.find('seg')
+        if source_seg is None:
+            return None
+
+        target_tuvs = [tuv for tuv in tuvs if tuv is not source_tuv]
+        target_tuv, self.__target_code = self.__find_variant(target_tuvs, self.target_lang, self.__target_code, 'target')
+
+        if target_tuv is not None and not self.replace_target:
+            target_seg = target_tuv.find('seg')
+            if target_seg is not None and (target_seg.text or len(target_seg)):
+                self.__skipped_units += 1
+                return None
+
+        segment, codes = tmx_markup.to_inline(source_seg)
+        if not segment.strip():
+            return None
+
+        if target_tuv is None:
+            target_tuv = self.__add_variant(tu, tuvs, source_tuv)
+
+        target_seg = target_tuv.find('seg')
+        if target_seg is None:
+            target_seg = etree.SubElement(target_tuv, 'seg')
+
+        return Unit(
+            segment=segment.strip(),
+            codes=codes,
+            seg=target_seg,
+            lead=segment[:len(segment) - len(segment.lstrip())],
+            trail=segment[len(segment.rstrip()):]
+        )
+
+    def __find_variant(self, tuvs, language, detected_code, name):
+        """Returns translation unit variant of the language and language code used in the document.
+        Language codes in the document might differ from the requested ones, the first variant with
+        code starting with the requested code, or its ISO 639-1 part, determines the code used in the document"""
+        if detected_code is not None:
+            for tuv in tuvs:
+                if (tmx_markup.get_language(tuv) or '').lower() == detected_code.lower():
+                    return tuv, detected_code
+
+        for prefix in dict.fromkeys((language.lower(), language[:2].lower())):
+            for tuv in tuvs:
+                code = tmx_markup.get_language(tuv) or ''
+                if code.lower().startswith(prefix):
+                    if detected_code is None:
+                        self.__logger.info("Using %s as TMX %s language", code, name)
+                        detected_code = code
+                    return tuv, detected_code
+
+        return None, detected_code
+
+    def __add_variant(self, tu, tuvs, source_tuv):
+        """Appends target language variant to the translation unit, formatted as the source variant"""
+        language_attribute = tmx_markup.XML_LANG if source_tuv.get(tmx_markup.XML_LANG) else 'lang'
+
+        target_tuv = etree.SubElement(tu, 'tuv', {language_attribute: self.__target_code or self.target_lang})
+        target_tuv.text = source_tuv.text
+        etree.SubElement(target_tuv, 'seg').tail = source_tuv.find('seg').tail
+
+        target_tuv.tail = tuvs[-1].tail
+        tuvs[-1].tail = tu.text
+
+        return target_tuv
@@ -1,7 +1,5 @@
 import io
-import os
 import logging
-import codecs
 from tildemt.file_translator.xlf_inline import XLFInlineTranslator
 from tildemt.utils.file_encoder import FileEncoder
 
@@ -20,31 +18,17 @@ class TXTTranslator(XLFInlineTranslator):
 
         self.__logger.info("Translating TXT document from %s to %s", source_file, target_file)
 
-        # Detect file encoding and convert to UTF-8 if necessary
-        encoder = FileEncoder()
-        encoding, _ = encoder.get_encoding(source_file, self.metadata['srcLang'])
-        if encoding != 'utf-8':
-            if encoding is None:
-                self.__logger.error("Unable to detect file encoding")
-            else:
-                self.__logger.info("Detected incompatible encoding: %s. Converting to UTF-8...", encoding)
-                utf8_source_file = source_file + '.utf8'
-                self.on_temp_file.fire(utf8_source_file)
-
-                if encoder.convert_to(source_file, encoding, utf8_source_file):
-                    source_file = utf8_source_file
-                else:
-                    self.__logger.error("Error while converting file to UTF-8. Continuing as is...")
-                encoding = 'utf-8'
-        else:
-            with io.open(source_file, 'rb') as file:
-                raw = file.read(min(3, os.path.getsize(source_file)))
-                if raw.startswith(codecs.BOM_UTF8):
-                    encoding = 'utf-8-sig'
-
-        with io.open(source_file, 'r', encoding=encoding, newline='') as txt_source_file:
+        # Detect file encoding, the file is decoded while it is read
+        txt_source_file, encoding = FileEncoder().open(source_file, self.metadata['srcLang'])
+        if encoding not in ('utf-8', 'utf-8-sig'):
+            self.__logger.info("Detected incompatible encoding: %s. Converting to UTF-8...", encoding)
+
+        with txt_source_file:
             super().translate_file(txt_source_file)
 
+        # Translation is written in UTF-8, byte order mark is kept for UTF-8 source files
+        encoding = 'utf-8-sig' if encoding == 'utf-8-sig' else 'utf-8'
+
         self.__logger.info("Writing translated segments to %s", target_file)
 
         with io.open(target_file, 'w', encoding=encoding) as txt_target_file:
@@ -0,0 +1,35 @@
+import logging
+import zipfile
+
+from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
+from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.file_translator.types.docx import DOCXTranslator, check_archive_size
+
+
+class XLSXTranslator(DOCXTranslator):
+    """Handles the XLSX file translation. Cell text is translated in the shared strings table,
+    so that every distinct string is translated once and worksheets are left untouched"""
+
+    deduplicate_segments = True
+
+    def __init__(self, metadata):
+        self.__logger = logging.getLogger('XLSXTranslator')
+        self.__logger.info("Initializing XLSX Translator")
+        super().__init__(metadata)
+
+    def preprocess(self, source_file):
+        """Workbooks don't contain parts that need filtering for Okapi Tikal, only the archive is validated"""
+        self.__logger.info("Checking XLSX document %s", source_file)
+
+        try:
+            with zipfile.ZipFile(source_file, 'r') as source:
+                check_archive_size(source)
+
+        except FileTranslationException:
+            raise
+
+        except Exception as ex:
+            self.__logger.exception("Error while reading the input document")
+            raise FileTranslationException(FileTranslationSubstatus.BAD_FILE) from ex
+
+        return source_file
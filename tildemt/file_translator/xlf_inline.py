@@ -1,11 +1,18 @@
 """This module contain file translation base class that translate XLIFF inline files"""
 
+import itertools
 import logging
 import os
 import time
+from collections import deque
 from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
 from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.file_translator.translation_memory import TranslationMemory
+from tildemt.services.pretranslation_service import TM_FUZZY_THRESHOLD, PretranslationService
+from tildemt.services.shard_translation_service import SHARD_SEGMENTS, ShardTranslationService
 from tildemt.services.text_translation_service import TextTranslationService
+from tildemt.services.translation_fixture import get_fixture_name
+from tildemt.utils import metrics
 from tildemt.utils.event_hook import EventHook
 
 
@@ -21,9 +28,11 @@ class XLFInlineTranslator():
         self.min_progress_report_interval = 1 # seconds
         self.metadata = metadata
 
-        self.source_segments = []
+        # Translations of the segments passed to translate_file, with the newlines of the source lines
         self.target_segments = []
         self.translated_segment_count = 0
+        # Segments read from the document so far
+        self.read_segment_count = 0
 
         # Read the neccessary values from Environment Variables
         self.tools_dir = os.path.normpath(os.environ.get("TOOLS_DIR", "/usr/lib/tildemt/"))
@@ -43,51 +52,75 @@ class XLFInlineTranslator():
         # only put machine translations in empty target segments
         self.replace_target = False
 
-        self.__text_translation_service = TextTranslationService(self.source_lang, self.target_lang, self.domain)
+        self.__text_translation_service = TextTranslationService(
+            self.source_lang,
+            self.target_lang,
+            self.domain,
+            get_fixture_name(self.metadata)
+        )
+
+        # Segments of large documents are translated by other workers as well, see SHARD_SEGMENTS
+        self.__translation_service = self.__text_translation_service
+        if SHARD_SEGMENTS:
+            self.__translation_service = ShardTranslationService(self.__text_translation_service, self.metadata)
+
+        # Segments matched in the translation memory of the job are not sent to machine translation
+        if self.metadata.get('translationMemory'):
+            translation_memory = TranslationMemory(TM_FUZZY_THRESHOLD)
+            translation_memory.load(self.metadata['translationMemory'], self.source_lang, self.target_lang)
+            self.__translation_service = PretranslationService(self.__translation_service, translation_memory)
 
     def translate_file(self, data_stream):
         """
         Initiates the translation process.
-            - 'data_stream' - a stream object of translatable segments separated by lines
+            - 'data_stream' - a stream object (or any other iterable) of translatable segments separated by lines.
+              Segments are sent to translation while the rest of the stream is still being read.
+              Translations are kept in 'target_segments' for writing of the translated document
         """
 
-        self.on_start.fire()
+        # save newlines for later, but remove them in translation process, as many tools use CMDTextProcessor,
+        # where newlines are conflicting with source text newlines. Newlines are kept only for the segments
+        # read ahead of the translations
+        saved_newlines = deque()
 
-        lines = data_stream.readlines()
-        if not lines:
-            raise FileTranslationException(FileTranslationSubstatus.NO_TEXT_EXTRACTED)
+        segments = self.__read_lines(data_stream, saved_newlines)
 
-        # save newlines for later, but remove them in translation process, as many tools use CMDTextProcessor,
-        # where newlines are conflicting with source text newlines
-        saved_newlines = []
-        self.source_segments = []
-        for line in lines:
-            self.source_segments.append(line.rstrip())
+        for translation in self.translate_segments(segments):
+            self.target_segments.append(translation + saved_newlines.popleft())
 
-            if line.endswith('\r\n'):
-                saved_newlines.append('\r\n')
-            elif line.endswith('\n'):
-                saved_newlines.append('\n')
-            else:
-                saved_newlines.append('')
+    def translate_segments(self, segments):
+        """Translates an iterable of single line segments and yields translations in the same order as soon as
+        they are available. Segments are not kept in memory, so that documents of any size can be streamed.
+        Raises FileTranslationException NO_TEXT_EXTRACTED before the translation starts if there are no segments"""
 
-        # Report total count of segments
-        total_segment_count = len(self.source_segments)
-        self.on_progress.fire(domain=self.__text_translation_service.domain, seg_count=total_segment_count)
+        # Time spent reading the segments is measured separately from the time spent waiting for translations
+        segments = metrics.iterate('extract', self.__count_segments(segments))
+
+        first_segment = next(segments, None)
+        if first_segment is None:
+            raise FileTranslationException(FileTranslationSubstatus.NO_TEXT_EXTRACTED)
+
+        self.on_start.fire()
 
         # Start translation thread pool
-        self.__logger.info("Translate all %d segments", total_segment_count)
+        self.__logger.info("Translate segments")
         last_progress_time = time.monotonic()
 
-        for ith, result in enumerate(self.__text_translation_service.translate(self.source_segments)):
-            self.target_segments.append(result['translation'] + saved_newlines[ith])
+        segments_translated = metrics.SEGMENTS_TRANSLATED.labels(self.metadata.get('extension') or '')
+
+        translations = self.__translation_service.translate(itertools.chain([first_segment], segments))
+        for result in metrics.iterate('mt', translations):
+            yield result['translation']
 
             self.translated_segment_count += 1
+            segments_translated.inc()
 
-            # Report progress if time interval has elapsed
+            # Report progress if time interval has elapsed. Segments read so far are reported with the progress
+            # until the total count is known, so that translated segments never exceed the segments
             if time.monotonic() - last_progress_time >= self.min_progress_report_interval:
                 self.on_progress.fire(
                     domain=self.__text_translation_service.domain,
+                    seg_count=self.read_segment_count,
                     seg_translated=self.translated_segment_count
                 )
                 last_progress_time = time.monotonic()
@@ -97,6 +130,36 @@ class XLFInlineTranslator():
         # Fire final progress report
         self.on_progress.fire(
             domain=self.__text_translation_service.domain,
+            seg_count=self.read_segment_count,
             seg_translated=self.translated_segment_count
         )
         self.on_postprocess_start.fire()
+
+    @staticmethod
+    def __read_lines(data_stream, saved_newlines):
+        """Yields lines of the data stream without newlines"""
+
+        for line in data_stream:
+            if line.endswith('\r\n'):
+                saved_newlines.append('\r\n')
+            elif line.endswith('\n'):
+                saved_newlines.append('\n')
+            else:
+                saved_newlines.append('')
+
+            yield line.rstrip()
+
+    def __count_segments(self, segments):
+        """Yields segments and reports total count of segments when the segments are exhausted"""
+
+        for segment in segments:
+            self.read_segment_count += 1
+            yield segment
+
+        if not self.read_segment_count:
+            # Documents without segments are rejected by translate_segments
+            return
+
+        # Report total count of segments
+        self.__logger.info("All %d segments read", self.read_segment_count)
+        self.on_progress.fire(domain=self.__text_translation_service.domain, seg_count=self.read_segment_count)
@@ -3,10 +3,12 @@ import os
 import threading
 
 from waitress import serve
-from flask import Flask
+from flask import Flask, Response
 from flask_healthz import healthz
 from flask_healthz import HealthError
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
+from tildemt import warmup
 from tildemt.rabbitmq import RabbitMQ
 from tildemt.translator import Translator
 
@@ -23,6 +25,10 @@ def readiness():
             raise HealthError("Unhealthy")
 
 
+def metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     logging.basicConfig(
         level=logging.INFO,
@@ -40,12 +46,18 @@ if __name__ == "__main__":
         translator = Translator(os.environ.get("TASK_ID"))
         translator.translate()
     else:
-        # Rabbit will block thread so, start in seperate thread
+        # Rabbit will block thread so, start in seperate thread. Jobs are consumed after the warm-up
         rabbit = RabbitMQ()
-        rabbit_thread = threading.Thread(target=rabbit.listen)
+
+        def consume():
+            warmup.warm_up()
+            rabbit.listen()
+
+        rabbit_thread = threading.Thread(target=consume)
         rabbit_thread.start()
 
         # Serve healthcheck endpoints
+        ready_checks.append(warmup.is_finished)
         ready_checks.append(rabbit.healthy)
 
         app = Flask(__name__)
@@ -54,4 +66,5 @@ if __name__ == "__main__":
             "live": liveness,
             "ready": readiness,
         })
+        app.add_url_rule("/metrics", view_func=metrics)
         serve(app, port=5000)
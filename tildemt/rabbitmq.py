@@ -1,11 +1,18 @@
+import concurrent.futures
+import datetime
 import logging
 import asyncio
 import os
 import json
+import time
+import uuid
+from collections import OrderedDict
 import aio_pika
 
 from aio_pika import ExchangeType
-from tildemt.translator import Translator
+from tildemt.translator import BACKGROUND_UPLOADS, Translator
+from tildemt.services import shard_translation_service
+from tildemt.utils import metrics
 from aiomisc import threaded_separate
 
 # Exchange, type: Direct
@@ -14,8 +21,18 @@ RABBITMQ_EXCHANGE = "file-translation"
 RABBITMQ_QUEUE = RABBITMQ_EXCHANGE
 #
 RABBITMQ_ROUTING_KEY = RABBITMQ_QUEUE
+# Shards of large documents translated by any worker, see SHARD_SEGMENTS
+RABBITMQ_SHARD_QUEUE = f"{RABBITMQ_QUEUE}-shard"
 # User friendly name for RabbitMQ management console
 SERVICE_NAME = "File translation worker"
+# Seconds to wait before consuming next message after a job has been deferred for lack of resources
+JOB_DEFER_DELAY = int(os.environ.get("JOB_DEFER_DELAY", "30"))
+# Times a job can be returned to the queue by the worker, then the job waits in the worker for resources
+JOB_MAX_DEFERRALS = int(os.environ.get("JOB_MAX_DEFERRALS", "10"))
+# Seconds to wait for a shard to be published, the shard is translated locally if it fails
+SHARD_PUBLISH_TIMEOUT = 30
+# Deferred jobs remembered by the worker, jobs redelivered to other workers are forgotten when the limit is reached
+DEFERRALS_TRACKED = 1000
 
 
 class RabbitMQ():
@@ -29,6 +46,17 @@ class RabbitMQ():
 
         self.__event_loop = None
 
+        # Channel and reply queue of shards published by this worker, replies by correlation id
+        self.__channel = None
+        self.__reply_queue = None
+        self.__shard_replies = {}
+
+        # Times jobs have been returned to the queue by this worker, by task
+        self.__deferrals = OrderedDict()
+
+        # Acknowledgements of job messages waiting for the jobs to finish
+        self.__acknowledgements = set()
+
     async def _healthy(self, loop):
         try:
             connection = await aio_pika.connect(
@@ -73,20 +101,111 @@ class RabbitMQ():
             finally:
                 loop.close()
     @threaded_separate
-    def __process_message(self, message):
+    def __process_message(self, message, published_at):
         try:
             message_body = json.loads(message)
 
             self.__logger.info(" =========== RabbitMQ work item received: '%s' ===========", message_body)
 
-            translator = Translator(message_body["task"])
+            task = message_body["task"]
+            deferrals = self.__deferrals.pop(task, 0)
+
+            # Jobs can be profiled on request, see PROFILE_DIR
+            translator = Translator(
+                task,
+                profile=bool(message_body.get("profile")),
+                translation_memory=message_body.get("translationMemory"),
+                deadline=message_body.get("deadline"),
+                published_at=published_at,
+                may_defer=deferrals < JOB_MAX_DEFERRALS
+            )
 
-            translator.translate()
+            processed = translator.translate()
+            if not processed:
+                self.__deferrals[task] = deferrals + 1
+                if len(self.__deferrals) > DEFERRALS_TRACKED:
+                    self.__deferrals.popitem(last=False)
+
+            return processed, translator.finished
         except Exception:
             self.__logger.error("Failed to process task")
 
+        return True, None
+
+    @threaded_separate
+    def __process_shard(self, message):
+        return json.dumps(shard_translation_service.translate_shard(json.loads(message))).encode('utf-8')
+
+    async def __on_shard(self, message):
+        async with message.process():
+            reply = await self.__process_shard(message.body)
+
+            await self.__channel.default_exchange.publish(
+                aio_pika.Message(reply, correlation_id=message.correlation_id),
+                routing_key=message.reply_to
+            )
+
+    async def __on_shard_reply(self, message):
+        future = self.__shard_replies.pop(message.correlation_id, None)
+        if future is not None and future.set_running_or_notify_cancel():
+            future.set_result(json.loads(message.body))
+
+    async def __publish_shard_message(self, body, correlation_id):
+        await self.__channel.default_exchange.publish(
+            aio_pika.Message(
+                body,
+                correlation_id=correlation_id,
+                reply_to=self.__reply_queue.name,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+            ),
+            routing_key=RABBITMQ_SHARD_QUEUE
+        )
+
+    def publish_shard(self, message_body):
+        """Publishes a shard of a document from a translation thread. Returns future of the reply"""
+        correlation_id = str(uuid.uuid4())
+        future = concurrent.futures.Future()
+        self.__shard_replies[correlation_id] = future
+        # Shards translated locally are not waited for
+        future.add_done_callback(lambda _: self.__shard_replies.pop(correlation_id, None))
+
+        published = asyncio.run_coroutine_threadsafe(
+            self.__publish_shard_message(json.dumps(message_body).encode('utf-8'), correlation_id),
+            self.__event_loop
+        )
+        try:
+            # Event loop might be stopped by the closed connection before the message is published
+            published.result(timeout=SHARD_PUBLISH_TIMEOUT)
+        except BaseException:
+            published.cancel()
+            future.cancel()
+            raise
+
+        return future
+
+    def __stop_publishing_shards(self):
+        """Stops sharding documents, replies to the shards in progress are lost with the reply queue,
+        so the shards are translated locally"""
+        shard_translation_service.set_shard_publisher(None)
+        for future in list(self.__shard_replies.values()):
+            future.cancel()
+
+    @staticmethod
+    def __get_published_at(message):
+        """Returns time (time.time) the message was published, None if the publisher has not set the timestamp"""
+        if message.timestamp is None:
+            return None
+
+        timestamp = message.timestamp
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+
+        return timestamp.timestamp()
+
     def on_rabbitmq_close(self, address, error):
         self.__logger.warning('On close || %s |||  %s', address, error)
+        # Loop is stopped, so the main loop does not finish its clean-up
+        self.__stop_publishing_shards()
         self.__event_loop.call_soon_threadsafe(self.__event_loop.stop)
 
     async def __main_loop(self, loop):
@@ -108,16 +227,62 @@ class RabbitMQ():
             channel = await connection.channel()
             await channel.set_qos(prefetch_count=1)
 
-            exchange = await channel.declare_exchange(RABBITMQ_EXCHANGE, ExchangeType.FANOUT, durable=True)
+            # Jobs uploading translated files in background are not acknowledged yet, so the next job
+            # is delivered to the worker meanwhile
+            job_channel = await connection.channel()
+            await job_channel.set_qos(prefetch_count=1 + BACKGROUND_UPLOADS)
+
+            exchange = await job_channel.declare_exchange(RABBITMQ_EXCHANGE, ExchangeType.FANOUT, durable=True)
 
-            queue = await channel.declare_queue(RABBITMQ_QUEUE, auto_delete=False, durable=True)
+            queue = await job_channel.declare_queue(RABBITMQ_QUEUE, auto_delete=False, durable=True)
             await queue.bind(exchange, routing_key=RABBITMQ_ROUTING_KEY)
 
+            # Shards are consumed alongside the jobs, so that a worker translating a large document
+            # can translate shards of other documents as well
+            shard_queue = await channel.declare_queue(RABBITMQ_SHARD_QUEUE, auto_delete=False, durable=True)
+            self.__reply_queue = await channel.declare_queue(exclusive=True)
+            self.__channel = channel
+
+            await self.__reply_queue.consume(self.__on_shard_reply, no_ack=True)
+            await shard_queue.consume(self.__on_shard)
+
             self.__logger.info("RabbitMQ ready for messages")
 
-            async with queue.iterator() as queue_iter:
-                async for message in queue_iter:
-                    async with message.process():
-                        await asyncio.gather(
-                            self.__process_message(message.body)
-                        )
\ No newline at end of file
+            shard_translation_service.set_shard_publisher(self.publish_shard)
+            try:
+                await self.__consume_jobs(queue)
+            finally:
+                self.__stop_publishing_shards()
+
+    async def __consume_jobs(self, queue):
+        async with queue.iterator() as queue_iter:
+            async for message in queue_iter:
+                published_at = self.__get_published_at(message)
+                if published_at is not None:
+                    # Time the message has spent in the queue
+                    metrics.QUEUE_WAIT_SECONDS.observe(max(time.time() - published_at, 0))
+
+                (processed, finished), = await asyncio.gather(
+                    self.__process_message(message.body, published_at)
+                )
+
+                if not processed:
+                    # Return the job to the queue, so that it can be taken by a worker with free resources
+                    await message.nack(requeue=True)
+                    self.__logger.info("Job requeued, waiting %d seconds for resources", JOB_DEFER_DELAY)
+                    await asyncio.sleep(JOB_DEFER_DELAY)
+                    continue
+
+                # Job is redelivered if the worker stops before the translated file has been uploaded
+                acknowledgement = asyncio.ensure_future(self.__acknowledge(message, finished))
+                self.__acknowledgements.add(acknowledgement)
+                acknowledgement.add_done_callback(self.__acknowledgements.discard)
+
+    async def __acknowledge(self, message, finished):
+        """Acknowledges the job message when the job has finished, including the background upload"""
+        try:
+            if finished is not None:
+                await asyncio.wrap_future(finished)
+            await message.ack()
+        except Exception:
+            self.__logger.exception("Unable to acknowledge the job message")
\ No newline at end of file
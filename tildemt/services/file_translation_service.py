@@ -1,19 +1,31 @@
+import hashlib
 import logging
 import os
-import shutil
-import requests
 
 from tildemt.models.update_file_translation_metadata import UpdateFileTranslationMetadata
+from tildemt.utils import deadlines
+from tildemt.utils.http_client import create_session
+from tildemt.utils.multipart_stream import MultipartFileStream
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Connections to the file translation service are kept open between requests and jobs, for the job in progress,
+# its intermediate file uploads (UPLOAD_WORKERS) and the finished jobs uploading in background (BACKGROUND_UPLOADS)
+HTTP_CLIENT = create_session(
+    1 + int(os.environ.get("UPLOAD_WORKERS", "4")) + int(os.environ.get("BACKGROUND_UPLOADS", "1"))
+)
 
 
 class FileTranslationService():
+    """Metadata and files of a task in the file translation service. Requests don't outlast the deadline of the
+    current job"""
     def __init__(self, task):
         self.__logger = logging.getLogger('FileTranslatorService')
         self.__url = os.environ.get("FILE_TRANSLATION_SERVICE_URL")
         self.__task = task
 
-        self.__http_client = requests.Session()
-        self.__http_client.auth = (
+        self.__http_client = HTTP_CLIENT
+        self.__auth = (
             os.environ.get("FILE_TRANSLATION_SERVICE_USER"),
             os.environ.get("FILE_TRANSLATION_SERVICE_PASS")
         )
@@ -36,7 +48,12 @@ class FileTranslationService():
 
         self.__logger.info("Update metadata[%s]: %s", self.__task, metadata_update)
 
-        response = self.__http_client.put(f"{self.__url}/file/{self.__task}", json=metadata_update)
+        response = self.__http_client.put(
+            f"{self.__url}/file/{self.__task}",
+            json=metadata_update,
+            auth=self.__auth,
+            timeout=deadlines.request_timeout()
+        )
 
         response.raise_for_status()
 
@@ -46,7 +63,11 @@ class FileTranslationService():
 
     def get_metadata(self):
         self.__logger.info("Fetch metadata[%s]", self.__task)
-        response = self.__http_client.get(f"{self.__url}/file/{self.__task}")
+        response = self.__http_client.get(
+            f"{self.__url}/file/{self.__task}",
+            auth=self.__auth,
+            timeout=deadlines.request_timeout()
+        )
 
         response.raise_for_status()
 
@@ -56,43 +77,87 @@ class FileTranslationService():
         return self.__current_metadata
 
     def download_source_file(self, save_directory):
-        self.__logger.info("Fetch available file list")
-
-        response = self.__http_client.get(f"{self.__url}/file/{self.__task}")
-
-        response.raise_for_status()
-
-        file_list = response.json()["files"]
-        self.__logger.warning(file_list)
-
-        source_file = next(filter(lambda x: x["category"] == "Source", file_list))
+        """Downloads the source file listed in the current metadata.
+        Returns path of the downloaded file, its storage name and SHA-256 hex digest of the content"""
+        source_file = next(filter(lambda x: x["category"] == "Source", self.__get_files()))
 
         storage_name = f"{source_file['category']}{source_file['extension']}"
         file_path = f"{save_directory}/{storage_name}"
 
         self.__logger.info("Download source file")
-        with self.__http_client.get(f"{self.__url}/File/{self.__task}/{source_file['id']}", stream=True) as response:
+        digest = self.__download(source_file, file_path)
+        self.__logger.info("Source file downloaded: %s", file_path)
+
+        return file_path, storage_name, digest
+
+    def download_file(self, file_id, save_directory):
+        """Downloads a file of the task, other than the source file, listed in the current metadata.
+        Returns path of the downloaded file and SHA-256 hex digest of the content"""
+        file_info = next(filter(lambda x: x["id"] == file_id, self.__get_files()), None)
+        if file_info is None:
+            raise IOError(f"File {file_id} is not a file of the task")
+
+        file_path = f"{save_directory}/{file_info['category']}-{file_id}{file_info.get('extension') or ''}"
+
+        self.__logger.info("Download file %s", file_id)
+        digest = self.__download(file_info, file_path)
+        self.__logger.info("File downloaded: %s", file_path)
+
+        return file_path, digest
+
+    def __get_files(self):
+        """Returns files of the task listed in the current metadata. Metadata returned by an update might not
+        list the files, then the metadata is fetched again"""
+        metadata = self.__current_metadata
+        if not metadata or "files" not in metadata:
+            metadata = self.get_metadata()
+
+        return metadata["files"]
+
+    def __download(self, file_info, file_path):
+        """Downloads the file to 'file_path', returns SHA-256 hex digest of the content"""
+        digest = hashlib.sha256()
+        size = 0
+        with self.__http_client.get(
+            f"{self.__url}/File/{self.__task}/{file_info['id']}",
+            stream=True,
+            auth=self.__auth,
+            # Timeout of the connection and of reading each chunk, not of the whole download
+            timeout=deadlines.request_timeout()
+        ) as response:
             response.raise_for_status()
+            expected_size = file_info.get("size") or response.headers.get("Content-Length")
+
             with open(file_path, 'wb') as file:
-                shutil.copyfileobj(response.raw, file)
+                # Hash the content while it is written, so that the file does not have to be read again
+                for chunk in iter(lambda: response.raw.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    file.write(chunk)
 
-        self.__logger.info("Source file downloaded: %s", file_path)
+        if expected_size is not None and size != int(expected_size):
+            raise IOError(f"File {file_info['id']} download incomplete, received {size} of {expected_size} bytes")
 
-        return file_path, storage_name
+        return digest.hexdigest()
 
     def upload_file(self, file_path, file_type):
         self.__logger.info("Uploading file: %s", file_path)
 
-        with open(file_path, 'rb') as upload_file:
-            files = {'file': upload_file}
-            data = {"category": file_type}
-
-            response = self.__http_client.post(f"{self.__url}/file/{self.__task}", files=files, params=data)
-
-            if response.status_code == 409:
-                # Skip this error if we run file translation multiple times in debug mode
-                self.__logger.warning("File already uploaded")
-            else:
-                response.raise_for_status()
+        # File is streamed from disk while it is sent
+        with MultipartFileStream('file', file_path) as body:
+            response = self.__http_client.post(
+                f"{self.__url}/file/{self.__task}",
+                data=body,
+                params={"category": file_type},
+                headers={"Content-Type": body.content_type},
+                auth=self.__auth,
+                timeout=deadlines.request_timeout()
+            )
+
+        if response.status_code == 409:
+            # Skip this error if we run file translation multiple times in debug mode
+            self.__logger.warning("File already uploaded")
+        else:
+            response.raise_for_status()
 
-        self.__logger.info("File upload completed")
+        self.__logger.info("File upload completed: %s", file_path)
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+from tildemt.enums.file_translation_status_type import FileTranslationStatusType
+from tildemt.enums.file_upload_type import FileUploadType
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# File id of the translation memory of a local document
+TRANSLATION_MEMORY_FILE_ID = "translation-memory"
+
+
+class LocalFileTranslationService():
+    """Stands in for FileTranslationService with local files. Source file is read from 'source_path',
+    translated file is written to 'target_path', other uploaded files are written next to it
+    with the file category appended to the name. Translation memory of the document is read from
+    'translation_memory_path' as the file TRANSLATION_MEMORY_FILE_ID of the task"""
+    def __init__(self, task, source_path, target_path, source_lang, target_lang, domain=None,
+                 translation_memory_path=None):
+        self.__logger = logging.getLogger('LocalFileTranslationService')
+        self.__task = task
+        self.__source_path = source_path
+        self.__target_path = target_path
+        self.__file_paths = {task: source_path}
+
+        _, extension = os.path.splitext(source_path)
+
+        self.__current_metadata = {
+            'id': task,
+            'srcLang': source_lang,
+            'trgLang': target_lang,
+            'domain': domain,
+            'segments': 0,
+            'translatedSegments': 0,
+            'status': None,
+            'substatus': None,
+            'files': [{
+                'id': task,
+                'category': FileUploadType.SOURCE.value,
+                'extension': extension,
+                'size': os.path.getsize(source_path)
+            }]
+        }
+
+        if translation_memory_path:
+            self.__file_paths[TRANSLATION_MEMORY_FILE_ID] = translation_memory_path
+            self.__current_metadata['files'].append({
+                'id': TRANSLATION_MEMORY_FILE_ID,
+                'category': FileUploadType.TRANSLATION_MEMORY.value,
+                'extension': os.path.splitext(translation_memory_path)[1],
+                'size': os.path.getsize(translation_memory_path)
+            })
+
+        self.__lock = threading.Lock()
+
+        # Time of the first request of the job and time the job reached its final status
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def metadata(self):
+        with self.__lock:
+            return dict(self.__current_metadata)
+
+    def update_metadata(self, metadata):
+        with self.__lock:
+            self.__current_metadata.update(metadata)
+
+            if self.__current_metadata['status'] in (
+                FileTranslationStatusType.SUCCEEDED.value,
+                FileTranslationStatusType.ERROR.value
+            ):
+                self.end_time = time.monotonic()
+
+        self.__logger.debug("Update metadata[%s]: %s", self.__task, metadata)
+
+    def get_metadata(self):
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+
+        return self.metadata
+
+    def download_source_file(self, save_directory):
+        storage_name = f"{FileUploadType.SOURCE.value}{self.__current_metadata['files'][0]['extension']}"
+        file_path = f"{save_directory}/{storage_name}"
+
+        return file_path, storage_name, self.__copy(self.__source_path, file_path)
+
+    def download_file(self, file_id, save_directory):
+        if file_id not in self.__file_paths:
+            raise IOError(f"File {file_id} is not a file of the task")
+
+        file_info = next(filter(lambda x: x["id"] == file_id, self.__current_metadata["files"]))
+        file_path = f"{save_directory}/{file_info['category']}-{file_id}{file_info['extension']}"
+
+        return file_path, self.__copy(self.__file_paths[file_id], file_path)
+
+    @staticmethod
+    def __copy(source_path, file_path):
+        """Copies the file, returns SHA-256 hex digest of the content"""
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as source, open(file_path, 'wb') as target:
+            for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                target.write(chunk)
+
+        return digest.hexdigest()
+
+    def upload_file(self, file_path, file_type):
+        target_path = self.__target_path
+        if file_type != FileUploadType.TRANSLATED.value:
+            target_path = f'{target_path}.{file_type}'
+
+        os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+        shutil.copyfile(file_path, target_path)
+
+        self.__logger.info("File %s written to %s", file_path, target_path)
@@ -0,0 +1,51 @@
+"""Pre-translation of segments from the translation memory of the job, see TM_FUZZY_THRESHOLD. Segments matched
+in the translation memory are translated locally and only the other segments are sent to machine translation"""
+
+import logging
+import os
+from collections import deque
+
+from tildemt.utils import metrics
+
+# Minimal similarity (0-1) of a fuzzy translation memory match, only exact matches are used if 1
+TM_FUZZY_THRESHOLD = float(os.environ.get("TM_FUZZY_THRESHOLD", "1"))
+
+
+class PretranslationService():
+    """Translates segments with the translation memory and the translation service for unmatched segments"""
+    def __init__(self, translation_service, translation_memory):
+        self.__logger = logging.getLogger('PretranslationService')
+        self.__translation_service = translation_service
+        self.__translation_memory = translation_memory
+
+    @property
+    def domain(self):
+        return self.__translation_service.domain
+
+    def translate(self, segments):
+        """Translates an iterable of segments and yields translations in the same order"""
+        # Translation memory matches, and None for segments sent to the translation service, in the segment order
+        pending = deque()
+        matches = [0, 0]
+
+        def get_unmatched():
+            for segment in segments:
+                translation = self.__translation_memory.lookup(segment)
+                pending.append(translation)
+                matches[translation is None] += 1
+
+                if translation is None:
+                    yield segment
+
+        for result in self.__translation_service.translate(get_unmatched()):
+            while pending[0] is not None:
+                yield {'translation': pending.popleft()}
+
+            pending.popleft()
+            yield result
+
+        for translation in pending:
+            yield {'translation': translation}
+
+        self.__logger.info("%d of %d segments pretranslated from the translation memory", matches[0], sum(matches))
+        metrics.SEGMENTS_PRETRANSLATED.inc(matches[0])
@@ -0,0 +1,174 @@
+"""Translation of large documents by several workers. Segments of a document beyond the first SHARD_SEGMENTS are
+split in shards of SHARD_SEGMENTS segments, which are published on the message bus and can be translated
+by any worker. The worker of the document translates the first shard meanwhile, then collects translations
+of the other shards in order, so that the document is merged and uploaded by the worker of the document.
+Shards are read from the document and published as the translations are collected, SHARD_PUBLISH_AHEAD at a time.
+
+Shards that have not been translated in SHARD_TIMEOUT seconds, or failed, are translated locally.
+Segments of the shards are kept in temporary files for this, instead of memory"""
+
+import concurrent.futures
+import itertools
+import logging
+import os
+import tempfile
+import time
+from collections import deque, namedtuple
+
+from tildemt.services.text_translation_service import TextTranslationService
+from tildemt.utils import deadlines
+
+# Segments of a shard, documents are not sharded if not set
+SHARD_SEGMENTS = int(os.environ.get("SHARD_SEGMENTS", "0"))
+# Seconds to wait for translation of a shard by another worker
+SHARD_TIMEOUT = int(os.environ.get("SHARD_TIMEOUT", "600"))
+# Shards published ahead of the shard whose translations are collected
+SHARD_PUBLISH_AHEAD = int(os.environ.get("SHARD_PUBLISH_AHEAD", "8"))
+
+# Future of the reply is None if the shard could not be published
+Shard = namedtuple('Shard', ['index', 'file_path', 'segment_count', 'future', 'deadline'])
+
+# Function publishing a shard message, returns future of the reply message. Set by the message bus consumer
+# while it is connected, documents are not sharded otherwise
+_publish_shard = None
+
+
+def set_shard_publisher(publish_shard):
+    global _publish_shard # pylint: disable=global-statement
+    _publish_shard = publish_shard
+
+
+def translate_shard(message_body):
+    """Translates a shard published by another worker, returns the reply message"""
+    logger = logging.getLogger('ShardTranslationService')
+    logger.info("Translate shard %d of task %s", message_body['shard'], message_body['task'])
+
+    try:
+        # Shards are translated within the deadline of the document
+        deadlines.activate(message_body.get('deadline'))
+        service = TextTranslationService(message_body['srcLang'], message_body['trgLang'], message_body['domain'])
+        translations = [result['translation'] for result in service.translate(message_body['segments'])]
+    except Exception as ex:
+        logger.exception("Failed to translate shard %d of task %s", message_body['shard'], message_body['task'])
+        return {'error': repr(ex)}
+
+    return {'translations': translations}
+
+
+class ShardTranslationService():
+    """Translates segments with the text translation service of the document and shards on other workers"""
+    def __init__(self, text_translation_service, metadata):
+        self.__logger = logging.getLogger('ShardTranslationService')
+        self.__text_translation_service = text_translation_service
+        self.__metadata = metadata
+
+    @property
+    def domain(self):
+        return self.__text_translation_service.domain
+
+    def translate(self, segments):
+        """Translates an iterable of segments and yields translations in the same order"""
+        segments = iter(segments)
+        first_shard = list(itertools.islice(segments, SHARD_SEGMENTS))
+        second_shard = list(itertools.islice(segments, SHARD_SEGMENTS))
+
+        if not second_shard or _publish_shard is None:
+            yield from self.__text_translation_service.translate(itertools.chain(first_shard, second_shard, segments))
+            return
+
+        with tempfile.TemporaryDirectory(prefix='shards-') as shard_dir:
+            translations = self.__text_translation_service.translate(first_shard)
+
+            if not self.domain:
+                # Shards are translated in the domain detected from the first batch
+                yield from itertools.islice(translations, 1)
+
+            shard_segments = enumerate(
+                itertools.chain([second_shard], iter(lambda: list(itertools.islice(segments, SHARD_SEGMENTS)), [])),
+                1
+            )
+            shards = deque()
+
+            def publish_next():
+                index, segments_of_shard = next(shard_segments, (None, None))
+                if segments_of_shard is not None:
+                    shards.append(self.__publish_shard(index, segments_of_shard, shard_dir))
+
+            for _ in range(max(SHARD_PUBLISH_AHEAD, 1)):
+                publish_next()
+
+            yield from translations
+
+            # Shards failed on other workers are translated by a separate service, as the service of the first
+            # shard has finished its translation
+            fallback_service = None
+
+            while shards:
+                shard = shards.popleft()
+                publish_next()
+
+                translations = self.__get_translations(shard)
+                if translations is None:
+                    fallback_service = fallback_service or self.__text_translation_service.copy()
+                    translations = self.__translate_locally(shard, fallback_service)
+
+                yield from translations
+
+    def __publish_shard(self, index, segments, shard_dir):
+        file_path = os.path.join(shard_dir, f'{index}.txt')
+        with open(file_path, 'w', encoding='utf-8', newline='\n') as shard_file:
+            for segment in segments:
+                shard_file.write(f'{segment}\n')
+
+        # Publisher is cleared when the worker disconnects from the message bus
+        publish_shard = _publish_shard
+        try:
+            if publish_shard is None:
+                raise ConnectionError("Not connected to the message bus")
+
+            future = publish_shard({
+                'task': self.__metadata.get('id'),
+                'shard': index,
+                'srcLang': self.__metadata['srcLang'],
+                'trgLang': self.__metadata['trgLang'],
+                'domain': self.domain,
+                'deadline': deadlines.get(),
+                'segments': segments
+            })
+            self.__logger.info("Published shard %d of %d segments", index, len(segments))
+        except Exception:
+            self.__logger.exception("Failed to publish shard %d, translating locally", index)
+            future = None
+
+        # Shards are not waited for past the deadline of the document
+        deadline = time.monotonic() + deadlines.clip(SHARD_TIMEOUT)
+        return Shard(index, file_path, len(segments), future, deadline)
+
+    def __get_translations(self, shard):
+        """Returns translations of the shard translated by another worker, None if it has not been translated"""
+        if shard.future is None:
+            return None
+
+        try:
+            reply = shard.future.result(timeout=max(shard.deadline - time.monotonic(), 0))
+            translations = reply.get('translations')
+
+            if translations is not None and len(translations) == shard.segment_count:
+                return ({'translation': translation} for translation in translations)
+
+            self.__logger.warning("Shard %d failed: %s, translating locally", shard.index, reply.get('error'))
+
+        except concurrent.futures.TimeoutError:
+            shard.future.cancel()
+            self.__logger.warning("Shard %d has not been translated in time, translating locally", shard.index)
+
+        except (concurrent.futures.CancelledError, Exception):
+            # Replies are lost if the worker disconnects from the message bus
+            self.__logger.exception("Shard %d failed, translating locally", shard.index)
+
+        return None
+
+    @staticmethod
+    def __translate_locally(shard, translation_service):
+        with open(shard.file_path, 'r', encoding='utf-8', newline='\n') as shard_file:
+            yield from translation_service.translate(line[:-1] for line in shard_file)
@@ -1,33 +1,87 @@
+import concurrent.futures
+import contextvars
 import datetime
+import heapq
+import threading
 import time
 import logging
 import os
 import multiprocessing
 from concurrent.futures.thread import ThreadPoolExecutor
 from concurrent.futures import CancelledError
-import requests
 
 from tildemt.enums.text_translation_type import TextTranslationType
+from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.services.translation_fixture import TranslationRecorder, TranslationReplayer
+from tildemt.utils import accounting, deadlines, metrics, tracing
+from tildemt.utils.http_client import create_session
+
+# Batches of a job translated concurrently, batches are sent one at a time if 1
+MT_CONCURRENCY = int(os.environ.get("MT_CONCURRENCY", "1"))
+
+# Connections to the translation API are kept open between batches and jobs, for the concurrent batches of a job
+# and of a shard of another document translated meanwhile
+HTTP_CLIENT = create_session(max(MT_CONCURRENCY, 1) * 2)
+
+
+class LatencyModel():
+    """Translation API latency of a batch by its characters, learned for each language pair from recent requests
+    as a linear regression with exponentially decaying weights"""
+    def __init__(self, decay=0.98):
+        self.__decay = decay
+        # Decayed sums of weights, characters, seconds, squared characters and characters multiplied by seconds
+        self.__sums = {}
+        self.__lock = threading.Lock()
+
+    def observe(self, language_pair, characters, seconds):
+        with self.__lock:
+            sums = [value * self.__decay for value in self.__sums.get(language_pair, (0, 0, 0, 0, 0))]
+            for index, value in enumerate((1, characters, seconds, characters * characters, characters * seconds)):
+                sums[index] += value
+            self.__sums[language_pair] = sums
+
+    def estimate(self, language_pair, characters):
+        """Returns estimated seconds of a batch, or characters if the language pair has not been observed"""
+        with self.__lock:
+            sums = self.__sums.get(language_pair)
+
+        if not sums or not sums[1]:
+            return characters
+
+        weight, sum_characters, sum_seconds, sum_squares, sum_products = sums
+        variance = sum_squares * weight - sum_characters * sum_characters
+        slope = (sum_products * weight - sum_characters * sum_seconds) / variance if variance > 0 else 0
+
+        if slope <= 0:
+            # Batches of similar size, latency in proportion to characters
+            return characters * sum_seconds / sum_characters
+
+        return max((sum_seconds - slope * sum_characters) / weight, 0) + slope * characters
+
+
+LATENCY_MODEL = LatencyModel()
 
 
 class TextTranslationService():
-    def __init__(self, source_language, target_language, domain):
+    def __init__(self, source_language, target_language, domain, fixture_name=None):
         self.__logger = logging.getLogger("TextTranslationService")
         self.__url = os.environ.get("TRANSLATION_API_SERVICE_URL")
         # Parralel requests
-        self.__concurrency = 1
+        self.__concurrency = max(MT_CONCURRENCY, 1)
         # max characters in batch
         self.__max_batch_characters = 500
+        # Batches read ahead of the returned results, longest batches of the window are translated first
+        self.__max_pending_batches = self.__concurrency * 4
         # Retry count (For unexpected errors - not for timeout)
         self.__retries = 5
         # If timeout happens at translation, then translation is busy processing messages, maybe we need to wait a little
         # (In seconds)
-        self.__timeout_cooldown = self.__concurrency * 3
+        self.__timeout_cooldown = 3
         # Service halted
         self.__halted = False
         # If timeout happens all the time then we need to stop sometime
         self.__current_consecutive_failed_requests = 0
-        self.__max_consecutive_failed_requests = self.__concurrency * 3
+        self.__max_consecutive_failed_requests = 3
         multiprocess_manager = multiprocessing.Manager()
         self.__lock_edit = multiprocess_manager.Lock()
 
@@ -37,73 +91,144 @@ class TextTranslationService():
         # We need domain to translate, domain will be extracted from translation api response
         self.domain = domain
 
+        # Translation API requests are recorded to or replayed from the fixture, see MT_RECORD_DIR and MT_REPLAY_DIR
+        self.__recorder = TranslationRecorder.from_environment(fixture_name)
+        self.__replayer = TranslationReplayer.from_environment(fixture_name)
+
+    def copy(self):
+        """Returns a new service of the language pair and domain, recording to and replaying from the same fixture"""
+        service = TextTranslationService(self.__source_language, self.__target_language, self.domain)
+        service.__recorder = self.__recorder
+        service.__replayer = self.__replayer
+        return service
+
     def translate(self, segments):
+        """Translates an iterable of segments and yields translations in the same order.
+        Batches are submitted for translation as soon as they are read from 'segments'"""
+        try:
+            yield from self.__translate(segments)
+        finally:
+            if self.__recorder:
+                self.__recorder.save()
+
+    def __translate(self, segments):
         batches = self.__get_batches(segments)
 
         if not self.domain:
             self.__logger.info("Domain is not provided, autodetect it from first batch")
             # Acquire domain by translating one batch of text
-            first_batch = batches[0]
-            batches = batches[1:]
+            first_batch = next(batches, None)
 
-            first_batch_result = self.__translate_segment(first_batch)
+            if first_batch is not None:
+                first_batch_result = self.__translate_segment(first_batch)
 
-            for segment_result in first_batch_result:
-                yield segment_result
+                for segment_result in first_batch_result:
+                    yield segment_result
 
         self.__logger.info("Start translation of all batches")
 
         with ThreadPoolExecutor(max_workers=self.__concurrency) as executor:
-            futures = [executor.submit(self.__translate_segment, batch) for batch in batches]
+            # Batches read ahead by estimated latency (longest first) and futures of submitted batches by index
+            waiting = []
+            futures = {}
+            next_index = 0
+            batches = enumerate(batches)
+
+            try:
+                while not self.__halted:
+                    # Read batches while the window has room, so that the rest of the segments are read meanwhile
+                    while len(waiting) + len(futures) < self.__max_pending_batches:
+                        index, batch = next(batches, (None, None))
+                        if batch is None:
+                            break
+                        heapq.heappush(waiting, (-self.__estimate_seconds(batch), index, batch))
+
+                    running = [future for future in futures.values() if not future.done()]
+
+                    # Failed batch stops the translation before further batches are sent, not when its turn comes
+                    for future in futures.values():
+                        if future.done() and not future.cancelled() and future.exception():
+                            self.__get_results(future)
+                    while waiting and len(running) < self.__concurrency:
+                        _, index, batch = heapq.heappop(waiting)
+                        # Batch requests are traced as children of the current span
+                        future = executor.submit(
+                            contextvars.copy_context().run,
+                            accounting.measured(self.__translate_segment),
+                            batch
+                        )
+                        futures[index] = future
+                        running.append(future)
+
+                    if not futures:
+                        break
+
+                    # Translations are returned in document order as soon as they are ready
+                    if next_index in futures and futures[next_index].done():
+                        while next_index in futures and futures[next_index].done():
+                            yield from self.__get_results(futures.pop(next_index))
+                            next_index += 1
+                    else:
+                        concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
 
-            for future in futures:
+            except BaseException:
+                self.stop()
+                raise
+
+            finally:
                 if self.__halted:
                     cancelled_futures = 0
-                    for future_ob in futures:
+                    for future_ob in futures.values():
                         cancelled = future_ob.cancel()
                         if cancelled:
                             cancelled_futures += 1
 
-                    futures = None
-
                     self.__logger.debug("Cancelled futures: %d", cancelled_futures)
 
-                    break
-
-                try:
-                    future_exception = future.exception()
-                    if future_exception:
-                        self.stop()
-                        raise Exception(future_exception)
+        executor.shutdown(wait=True)
 
-                except CancelledError:
-                    # Swallow future cancellation error
-                    self.__logger.info("Future cancelled")
+    def __get_results(self, future):
+        try:
+            future_exception = future.exception()
+            if future_exception:
+                self.stop()
+                if isinstance(future_exception, FileTranslationException):
+                    raise future_exception
+                raise Exception(future_exception)
 
-                for segment_result in future.result():
-                    yield segment_result
+        except CancelledError:
+            # Swallow future cancellation error
+            self.__logger.info("Future cancelled")
+            return []
 
-        executor.shutdown(wait=True)
+        return future.result() or []
 
     def stop(self):
         self.__logger.debug("Cancel translation")
         self.__halted = True
 
+    def __estimate_seconds(self, batch):
+        return LATENCY_MODEL.estimate(
+            (self.__source_language, self.__target_language),
+            sum(len(segment) for segment in batch)
+        )
+
     def __get_batches(self, segments):
-        result = []
         batch = []
         batch_characters = 0
 
-        for _i, segment in enumerate(segments):
+        for segment in segments:
             segment_characters = len(segment)
 
             if batch_characters + segment_characters > self.__max_batch_characters:
                 if batch_characters == 0:
                     batch.append(segment)
-                    result.append(batch)
+                    metrics.MT_BATCH_FILL.observe(1)
+                    yield batch
                     batch = []
                 else:
-                    result.append(batch)
+                    metrics.MT_BATCH_FILL.observe(batch_characters / self.__max_batch_characters)
+                    yield batch
                     batch = [segment]
                     batch_characters = segment_characters
             else:
@@ -112,15 +237,24 @@ class TextTranslationService():
 
         if batch:
             # add last batch
-            result.append(batch)
-
-        return result
+            metrics.MT_BATCH_FILL.observe(batch_characters / self.__max_batch_characters)
+            yield batch
 
     def __translate_segment(self, batch):
+        with tracing.span('mt.batch', segments=len(batch), characters=sum(len(segment) for segment in batch)):
+            return self.__request_translation(batch)
+
+    def __request_translation(self, batch):
+        accounting.count('mtCharacters', sum(len(segment) for segment in batch))
+        requested = False
+
         i = 0
         while i < self.__retries:
             response = None
 
+            # Batches of a job past its deadline are not retried
+            deadlines.check('mt')
+
             with self.__lock_edit:
                 if self.__current_consecutive_failed_requests < self.__max_consecutive_failed_requests:
                     if self.__current_consecutive_failed_requests > 0:
@@ -142,20 +276,47 @@ class TextTranslationService():
                 else:
                     self.__logger.info("Retry translation request: %d/%d", i, self.__retries)
 
-                response = requests.post(
-                    f"{self.__url}/Text",
-                    json={
-                        "srcLang": self.__source_language,
-                        "trgLang": self.__target_language,
-                        "domain": self.domain,
-                        "text": batch,
-                        "textType": TextTranslationType.DOCUMENT.value
-                    }
-                )
+                # Requests after timeouts are retries as well
+                accounting.count('mtRequests')
+                if requested:
+                    accounting.count('mtRetries')
+                requested = True
+
+                request = {
+                    "srcLang": self.__source_language,
+                    "trgLang": self.__target_language,
+                    "domain": self.domain,
+                    "text": batch,
+                    "textType": TextTranslationType.DOCUMENT.value
+                }
+
+                request_start = time.perf_counter()
+                with tracing.span('mt.request', attempt=i) as request_span:
+                    try:
+                        if self.__replayer:
+                            response = self.__replayer.post(f"{self.__url}/Text", request)
+                        else:
+                            # Requests don't outlast the deadline of the job
+                            response = HTTP_CLIENT.post(
+                                f"{self.__url}/Text",
+                                json=request,
+                                timeout=deadlines.request_timeout()
+                            )
+                    finally:
+                        status = str(response.status_code) if response is not None else 'error'
+                        request_seconds = time.perf_counter() - request_start
+                        metrics.MT_REQUEST_SECONDS.labels(status).observe(request_seconds)
+                        request_span.set_attributes(status=status)
+
+                if self.__recorder:
+                    self.__recorder.record(request, response, time.monotonic() - request_seconds, request_seconds)
 
                 if response.status_code == 504:
-                    self.__logger.warning("Translation timed out, waiting reshedule: %ss", self.__timeout_cooldown)
-                    time.sleep(self.__timeout_cooldown)
+                    # Cooldown does not outlast the deadline of the job
+                    cooldown = deadlines.clip(self.__timeout_cooldown)
+                    self.__logger.warning("Translation timed out, waiting reshedule: %ss", cooldown)
+                    with tracing.span('mt.cooldown', seconds=cooldown):
+                        time.sleep(cooldown)
                     self.__logger.warning("Cooldown ended")
 
                     with self.__lock_edit:
@@ -171,6 +332,12 @@ class TextTranslationService():
                 response_data = response.json()
                 translated_batch = response_data['translations']
 
+                LATENCY_MODEL.observe(
+                    (self.__source_language, self.__target_language),
+                    sum(len(segment) for segment in batch),
+                    request_seconds
+                )
+
                 if not self.domain:
                     self.domain = response_data['domain']
                     self.__logger.info("Domain auto detected from text: %s", self.domain)
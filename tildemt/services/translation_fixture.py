@@ -0,0 +1,162 @@
+"""Record and replay of translation API traffic of jobs, so that a job can be translated by different builds
+of the worker against identical translation API responses.
+
+Requests of a job are recorded to a fixture file in MT_RECORD_DIR with their batches, responses, status codes
+and timing. Fixture files in MT_REPLAY_DIR are served instead of the translation API, with the recorded latency
+multiplied by MT_REPLAY_LATENCY_SCALE. Fixture files are named by the source file hash and the language pair,
+so that the same document is replayed regardless of its task id"""
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+MT_RECORD_DIR = os.environ.get("MT_RECORD_DIR")
+MT_REPLAY_DIR = os.environ.get("MT_REPLAY_DIR")
+# 1 replays the recorded latency, 0 responds immediately
+MT_REPLAY_LATENCY_SCALE = float(os.environ.get("MT_REPLAY_LATENCY_SCALE", "1"))
+
+
+def get_fixture_name(metadata):
+    """Returns fixture name of the job or None if the source file hash is not known"""
+    if not metadata.get('sourceHash'):
+        return None
+
+    return f"{metadata['sourceHash']}.{metadata['srcLang']}-{metadata['trgLang']}"
+
+
+class TranslationRecorder():
+    """Records translation API requests of a job"""
+    def __init__(self, file_path):
+        self.__logger = logging.getLogger('TranslationRecorder')
+        self.__file_path = file_path
+        self.__start_time = time.monotonic()
+        self.__requests = []
+        self.__saved_requests = 0
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls, fixture_name):
+        """Returns recorder of the fixture or None if recording is disabled"""
+        if not MT_RECORD_DIR or not fixture_name:
+            return None
+
+        return cls(os.path.join(MT_RECORD_DIR, f'{fixture_name}.json'))
+
+    def record(self, request, response, start_time, seconds):
+        """Records the request sent at 'start_time' (time.monotonic) and its response received after 'seconds'"""
+        with self.__lock:
+            self.__requests.append({
+                'offset': start_time - self.__start_time,
+                'seconds': seconds,
+                'status': response.status_code,
+                'request': request,
+                'response': response.text
+            })
+
+    def save(self):
+        """Writes all requests recorded so far to the fixture file. Services sharing the recorder save it
+        when they finish, the fixture is written again only if requests have been recorded meanwhile"""
+        with self.__lock:
+            if self.__saved_requests == len(self.__requests) and os.path.exists(self.__file_path):
+                return
+
+            recorded_requests = list(self.__requests)
+            self.__saved_requests = len(recorded_requests)
+
+        os.makedirs(os.path.dirname(self.__file_path), exist_ok=True)
+
+        temp_path = f'{self.__file_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as fixture_file:
+            json.dump({'requests': recorded_requests}, fixture_file)
+        os.replace(temp_path, self.__file_path)
+
+        self.__logger.info("Translation requests recorded to %s", self.__file_path)
+
+
+class TranslationReplayer():
+    """Serves translation API responses of a recorded job.
+
+    Batches identical to recorded ones get the recorded responses in the recorded order, including errors.
+    Other batches, if the build batches segments differently, are composed of recorded translations of
+    the segments with latency in proportion to the characters of the batch"""
+    def __init__(self, file_path, latency_scale):
+        self.__logger = logging.getLogger('TranslationReplayer')
+        self.__latency_scale = latency_scale
+        self.__lock = threading.Lock()
+
+        with open(file_path, 'r', encoding='utf-8') as fixture_file:
+            recorded_requests = json.load(fixture_file)['requests']
+
+        self.__responses = collections.defaultdict(collections.deque)
+        self.__translations = {}
+        self.__domain = None
+
+        characters = 0
+        seconds = 0
+        for recorded in recorded_requests:
+            self.__responses[tuple(recorded['request']['text'])].append(recorded)
+
+            if recorded['status'] != 200:
+                continue
+
+            response = json.loads(recorded['response'])
+            self.__domain = self.__domain or response['domain']
+            for text, translation in zip(recorded['request']['text'], response['translations']):
+                self.__translations[text] = translation['translation']
+
+            characters += sum(len(text) for text in recorded['request']['text'])
+            seconds += recorded['seconds']
+
+        self.__seconds_per_character = seconds / characters if characters else 0
+
+        self.__logger.info("Replaying %d translation requests from %s", len(recorded_requests), file_path)
+
+    @classmethod
+    def from_environment(cls, fixture_name):
+        """Returns replayer of the fixture or None if replay is disabled"""
+        if not MT_REPLAY_DIR or not fixture_name:
+            return None
+
+        file_path = os.path.join(MT_REPLAY_DIR, f'{fixture_name}.json')
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"Translation fixture {file_path} does not exist")
+
+        return cls(file_path, MT_REPLAY_LATENCY_SCALE)
+
+    def post(self, url, request):
+        """Returns response to the request as requests.post would"""
+        texts = request['text']
+
+        with self.__lock:
+            responses = self.__responses.get(tuple(texts))
+            # Last response of a batch is repeated if the batch is requested more times than recorded
+            recorded = (responses.popleft() if len(responses) > 1 else responses[0]) if responses else None
+
+        if recorded is not None:
+            status, body, seconds = recorded['status'], recorded['response'], recorded['seconds']
+        else:
+            missing = [text for text in texts if text not in self.__translations]
+            if missing:
+                self.__logger.warning("%d segments of the batch are not recorded, source text returned", len(missing))
+
+            status = 200
+            body = json.dumps({
+                'domain': request['domain'] or self.__domain,
+                'translations': [{'translation': self.__translations.get(text, text)} for text in texts]
+            })
+            seconds = sum(len(text) for text in texts) * self.__seconds_per_character
+
+        time.sleep(seconds * self.__latency_scale)
+
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response.encoding = 'utf-8'
+        response._content = body.encode('utf-8') # pylint: disable=protected-access
+
+        return response
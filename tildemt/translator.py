@@ -1,27 +1,83 @@
+import concurrent.futures
+import contextvars
 import datetime
+import json
 import logging
 import logging.config
 import os
 import os.path
 import tempfile
+import threading
+import time
 import shutil
+from tildemt.enums.admission_decision import AdmissionDecision
 from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
 from tildemt.enums.file_translation_status_type import FileTranslationStatusType
 from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.exceptions.job_deferred_exception import JobDeferredException
 
 import tildemt.file_translator
+from tildemt.__about__ import __version__
 from tildemt.enums.file_upload_type import FileUploadType
 from tildemt.services.file_translation_service import FileTranslationService
+from tildemt.utils import accounting, deadlines, metrics
+from tildemt.utils.artifact_cache import ArtifactCache
+from tildemt.utils.profiler import JobProfiler
+from tildemt.utils import tracing
+from tildemt.utils.resource_budget import ResourceBudget, ResourceEstimate, estimate_resources
+
+# Translated files of previously translated documents
+RESULT_CACHE = ArtifactCache.from_environment("RESULT_CACHE_DIR", "RESULT_CACHE_SIZE")
+
+# Memory and temporary disk space budget of the worker shared by translation jobs
+RESOURCE_BUDGET = ResourceBudget.from_environment(tempfile.gettempdir())
+
+# Profile all jobs, otherwise only jobs requested with the profile flag are profiled
+PROFILE_JOBS = os.environ.get("PROFILE_JOBS", "false").lower() == "true"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "profiles"))
+
+# Intermediate files uploaded by file translators while the translation continues
+UPLOAD_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("UPLOAD_WORKERS", "4")),
+    thread_name_prefix='upload'
+)
+
+# Finished jobs uploading translated files in background while the next job is processed
+BACKGROUND_UPLOADS = int(os.environ.get("BACKGROUND_UPLOADS", "1"))
+BACKGROUND_UPLOAD_SLOTS = threading.BoundedSemaphore(BACKGROUND_UPLOADS) if BACKGROUND_UPLOADS else None
+BACKGROUND_UPLOAD_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=max(BACKGROUND_UPLOADS, 1),
+    thread_name_prefix='result-upload'
+)
 
 
 class Translator():
-    def __init__(self, doc_id):
+    def __init__(
+        self,
+        doc_id,
+        profile=False,
+        file_translation_service=None,
+        translation_memory=None,
+        deadline=None,
+        published_at=None,
+        may_defer=True
+    ):
         self.__logger = logging.getLogger('FileTranslator')
 
         self.__logger.info("Initializing File Translator")
 
         self.doc_id = doc_id
 
+        # File id of the TMX document pre-translating segments of the job
+        self.translation_memory = translation_memory
+
+        # Deadline of the job (ISO 8601) and time the job was published (time.time), see JOB_DEADLINE_SECONDS
+        self.deadline = deadline
+        self.published_at = published_at
+
+        # Job can be deferred for lack of resources, otherwise it waits for other jobs to release them
+        self.may_defer = may_defer
+
         # List of temporary files created in the translation process
         self.temp_files = []
 
@@ -29,18 +85,63 @@ class Translator():
 
         self.temp_dir = tempfile.gettempdir()
 
-        self.__file_translation_service = FileTranslationService(doc_id)
+        # Translation statistics reported by the file translator
+        self.segment_count = 0
+        self.domain = None
+
+        # Resources reserved for this job in the worker's budget
+        self.__reservation = None
+
+        # Intermediate file uploads in progress
+        self.__uploads = []
+
+        # Resolved when the job has released its resources, after the translated file has been uploaded
+        # if the upload runs in background
+        self.finished = concurrent.futures.Future()
+
+        # Time spent in stages of the job
+        self.__stage_clock = metrics.StageClock()
+
+        # Resources used by the job, reported when the job releases its resources
+        self.__account = accounting.JobAccount(doc_id)
+
+        # CPU and memory profiler of the job stages
+        self.__profiler = JobProfiler(os.path.join(PROFILE_DIR, doc_id)) if profile or PROFILE_JOBS else None
+
+        # Root span of the job trace
+        self.__trace = tracing.DISABLED_SPAN
+
+        # Storage of the document metadata and files, file translation service if not provided
+        self.__file_translation_service = file_translation_service or FileTranslationService(doc_id)
 
     def translate(self):
-        "Initialize translation process & translate"
+        """Initialize translation process & translate.
+        Returns False if the job has been deferred and has to be retried later.
+        Translated file might still be uploaded in background when this returns, see 'finished'"""
 
         extension = None
+        deferred = False
+        background = False
         start_time = datetime.datetime.utcnow()
 
+        metrics.JOBS_IN_PROGRESS.inc()
+        self.__stage_clock.activate()
+        self.__account.start()
+
+        if self.__profiler:
+            self.__stage_clock.listeners.append(self.__profiler.switch)
+            self.__profiler.start()
+
+        # Trace is exported when the job releases its resources
+        self.__trace = tracing.start_trace('job', self.doc_id, task=self.doc_id)
+
         try:
             self.__logger.info("Initializing the translation process")
 
-            self.__file_translation_service.update_metadata({'status': FileTranslationStatusType.INITIALIZING.value})
+            # Jobs past their deadline are abandoned before any work is done
+            deadline = deadlines.parse(self.deadline)
+            deadlines.activate(deadline)
+            deadlines.check('queue')
 
             # Get the neccessary file metadata
             self.file_meta = self.__file_translation_service.get_metadata()
@@ -50,6 +151,20 @@ class Translator():
             extension = source_file["extension"]
 
             extension = self.file_meta["extension"] = extension[1:].lower()
+            if extension in tildemt.file_translator.FILE_TYPES:
+                self.__stage_clock.file_format = extension
+
+            if deadline is None:
+                deadlines.activate(deadlines.get_default(extension, self.published_at or time.time()))
+                deadlines.check('queue')
+
+            self.__trace.set_attributes(format=extension, sourceBytes=source_file.get("size") or 0)
+
+            # Check whether the source file can be downloaded, before any resources are used. Content of archives
+            # is not known yet, so the rough estimate does not reject the job
+            self.__admit(estimate_resources(extension, source_file.get("size") or 0), rough=True)
+
+            self.__file_translation_service.update_metadata({'status': FileTranslationStatusType.INITIALIZING.value})
 
             source_dir = f'{self.temp_dir}/{self.doc_id}/source'
             result_dir = f'{self.temp_dir}/{self.doc_id}/result'
@@ -59,55 +174,285 @@ class Translator():
             if not os.path.exists(result_dir):
                 os.makedirs(result_dir)
 
-            local_source_file, file_name_id = self.__file_translation_service.download_source_file(source_dir)
+            with metrics.stage('download'), tracing.span('download') as download_span:
+                local_source_file, file_name_id, source_hash = self.__file_translation_service.download_source_file(
+                    source_dir
+                )
+                download_span.set_attributes(bytes=os.path.getsize(local_source_file))
+                accounting.count('downloadedBytes', os.path.getsize(local_source_file))
             local_target_file = f'{result_dir}/{file_name_id}'
+            self.file_meta['sourceHash'] = source_hash
 
-            self.__logger.info("File extension: %s", extension)
-
-            # Initialize the appropriate Translator according to the file extension
-            file_translator_type = extension
+            translation_memory_hash = None
+            if self.translation_memory:
+                translation_memory_hash = self.__download_translation_memory(source_dir)
 
-            translator = tildemt.file_translator.FILE_TYPES.get(file_translator_type)
+            deadlines.check('download')
 
-            if translator is None:
-                raise FileTranslationException(FileTranslationSubstatus.UNKNOWN_FILE_TYPE)
-
-            translator = translator(self.file_meta)
+            self.__admit(
+                estimate_resources(extension, os.path.getsize(local_source_file), local_source_file)
+            )
 
-            # Bind the translation events
-            self.__logger.info("Binding translation Events")
-            translator.on_start += self.__on_translation_start
-            translator.on_progress += self.__on_translation_progress
-            translator.on_temp_file += self.__on_temp_file_created
-            translator.on_upload_file_result += self.__file_translation_service.upload_file
-            translator.on_postprocess_start += self.__on_postprocess_start
+            self.__logger.info("File extension: %s", extension)
 
-            self.__on_preprocess_start()
+            result_key = self.__get_result_key(source_hash, translation_memory_hash) if RESULT_CACHE else None
+            completed_metadata = self.__restore_result(result_key, local_target_file) if result_key else None
 
-            translator.translate(local_source_file, local_target_file)
+            if completed_metadata is None:
+                translated_segment_count = self.__translate_file(extension, local_source_file, local_target_file)
 
-            self.__file_translation_service.upload_file(local_target_file, FileUploadType.TRANSLATED.value)
+                if result_key:
+                    self.__store_result(result_key, local_target_file, translated_segment_count)
 
-            # Change the document status to "completed" and update statistics
-            end_time = datetime.datetime.utcnow()
-
-            self.__file_translation_service.update_metadata(
-                {
+                # Document status "completed" and statistics
+                completed_metadata = {
                     'status': FileTranslationStatusType.SUCCEEDED.value,
-                    'translatedSegments': translator.translated_segment_count,
+                    'translatedSegments': translated_segment_count,
                 }
-            )
 
+            # Translated file can't be uploaded before the intermediate files
+            for upload in self.__uploads:
+                upload.result()
+
+            background = self.__complete(local_target_file, completed_metadata)
+
+        except JobDeferredException:
+            self.__logger.warning("File translation deferred, worker lacks resources for the document")
+            self.__trace.set_attributes(deferred=True)
+            deferred = True
         except FileTranslationException as err:
             self.__logger.exception("File translation terminated with error code %s: %s", err.error_type, err.message)
+            self.__trace.set_error(err.error_type.value)
             self.__report_error(err.error_type)
-        except Exception:
+        except Exception as ex:
             self.__logger.exception("File translation terminated with uncaught Exception")
+            self.__trace.set_error(repr(ex))
             self.__report_error(FileTranslationSubstatus.UNSPECIFIED)
         finally:
-            self.__cleanup()
+            # Job in background keeps its files and resources until the upload is finished
+            if not background:
+                self.__release()
+
+        self.__logger.info("File translation finished in %s", datetime.datetime.utcnow() - start_time)
 
-        self.__logger.info("File translation finished in %s", end_time - start_time)
+        return not deferred
+
+    def __complete(self, local_target_file, completed_metadata):
+        """Uploads the translated file and updates the document metadata. Upload runs in background, so that
+        the next job can start, unless all background uploads are busy. Returns True if running in background"""
+        if BACKGROUND_UPLOAD_SLOTS is None:
+            self.__upload_result(local_target_file, completed_metadata)
+            return False
+
+        # Wait for a free slot, so that unfinished uploads don't pile up on disk
+        BACKGROUND_UPLOAD_SLOTS.acquire()
+
+        if self.__profiler:
+            # Rest of the job is profiled in the upload thread
+            self.__profiler.suspend()
+
+        self.__account.suspend()
+
+        # Document is not held in memory while uploading, the next job can use the memory but not the disk space
+        self.__release_memory()
+
+        BACKGROUND_UPLOAD_EXECUTOR.submit(
+            self.__upload_result_in_background,
+            local_target_file,
+            completed_metadata,
+            deadlines.get()
+        )
+
+        return True
+
+    def __upload_result(self, local_target_file, completed_metadata):
+        # Translation is not uploaded for a job abandoned by the client
+        deadlines.check('upload')
+
+        with metrics.stage('upload'), tracing.span('upload', bytes=os.path.getsize(local_target_file)):
+            self.__file_translation_service.upload_file(local_target_file, FileUploadType.TRANSLATED.value)
+            accounting.count('uploadedBytes', os.path.getsize(local_target_file))
+        self.__file_translation_service.update_metadata(completed_metadata)
+
+    def __upload_result_in_background(self, local_target_file, completed_metadata, deadline):
+        self.__stage_clock.activate()
+        self.__account.activate()
+        tracing.activate(self.__trace)
+        deadlines.activate(deadline)
+        try:
+            self.__upload_result(local_target_file, completed_metadata)
+        except Exception as ex:
+            if isinstance(ex, FileTranslationException):
+                self.__logger.exception("Upload of the translated file terminated with error code %s", ex.error_type)
+                self.__trace.set_error(ex.error_type.value)
+                error_type = ex.error_type
+            else:
+                self.__logger.exception("Upload of the translated file terminated with uncaught Exception")
+                self.__trace.set_error(repr(ex))
+                error_type = FileTranslationSubstatus.UNSPECIFIED
+
+            try:
+                self.__report_error(error_type)
+            except Exception:
+                self.__logger.exception("Unable to report the upload error")
+        finally:
+            self.__release()
+            BACKGROUND_UPLOAD_SLOTS.release()
+
+    def __release(self):
+        """Cleans up temporary files and releases resources reserved for the job"""
+        try:
+            self.__release_resources()
+        finally:
+            self.finished.set_result(None)
+
+    def __release_resources(self):
+        # Files of unfinished uploads can't be removed
+        concurrent.futures.wait(self.__uploads)
+
+        self.__account.measure_temp_files(f'{self.temp_dir}/{self.doc_id}')
+        self.__cleanup()
+
+        if self.__reservation is not None:
+            RESOURCE_BUDGET.release(self.__reservation)
+            self.__reservation = None
+
+        if self.__profiler:
+            self.__profiler.stop(self.__stage_clock.durations)
+
+        self.__stage_clock.observe()
+
+        resources = self.__account.stop(self.file_meta.get('extension') or '')
+        self.__trace.set_attributes(**resources)
+        metrics.JOBS_IN_PROGRESS.dec()
+
+        self.__trace.end()
+
+    def __release_memory(self):
+        """Releases memory reserved for the job, keeping the disk space reservation"""
+        if self.__reservation is not None:
+            RESOURCE_BUDGET.release(ResourceEstimate(memory=self.__reservation.memory, disk=0))
+            self.__reservation = self.__reservation._replace(memory=0)
+
+    def __admit(self, estimate, rough=False):
+        """Reserves resources for the job in the worker's budget, a 'rough' estimate is limited to the budget.
+        Raises JobDeferredException if the job has to wait for resources
+        and FileTranslationException if the job does not fit in the budget"""
+        if not RESOURCE_BUDGET:
+            return
+
+        if rough:
+            estimate = RESOURCE_BUDGET.limit(estimate)
+
+        decision = RESOURCE_BUDGET.reserve(estimate, self.__reservation, wait=not self.may_defer)
+        self.__reservation = estimate if decision == AdmissionDecision.ADMIT else None
+
+        if decision == AdmissionDecision.DEFER:
+            raise JobDeferredException()
+
+        if decision == AdmissionDecision.REJECT:
+            raise FileTranslationException(
+                FileTranslationSubstatus.BAD_FILE, "Document exceeds the resource budget of the worker"
+            )
+
+    def __translate_file(self, extension, local_source_file, local_target_file):
+        """Translates the source file with file translator of the file extension, returns count of translated segments"""
+
+        # Initialize the appropriate Translator according to the file extension
+        translator = tildemt.file_translator.get_file_translator(extension)
+
+        if translator is None:
+            raise FileTranslationException(FileTranslationSubstatus.UNKNOWN_FILE_TYPE)
+
+        translator = translator(self.file_meta)
+
+        # Bind the translation events
+        self.__logger.info("Binding translation Events")
+        translator.on_start += self.__on_translation_start
+        translator.on_progress += self.__on_translation_progress
+        translator.on_temp_file += self.__on_temp_file_created
+        translator.on_upload_file_result += self.__on_upload_file_result
+        translator.on_postprocess_start += self.__on_postprocess_start
+
+        self.__on_preprocess_start()
+
+        # Writing of the translated document, time of preprocessing, extraction and translation is measured
+        # by the file translator
+        with metrics.stage('merge'), tracing.span('translate', fileTranslator=type(translator).__name__) as span:
+            translator.translate(local_source_file, local_target_file)
+            span.set_attributes(
+                segments=translator.translated_segment_count,
+                bytes=os.path.getsize(local_target_file)
+            )
+
+        return translator.translated_segment_count
+
+    def __download_translation_memory(self, source_dir):
+        """Downloads the translation memory of the job, returns SHA-256 hex digest of the translation memory"""
+        with metrics.stage('download'), tracing.span('download', file='translationMemory') as download_span:
+            local_file, file_hash = self.__file_translation_service.download_file(self.translation_memory, source_dir)
+            download_span.set_attributes(bytes=os.path.getsize(local_file))
+            accounting.count('downloadedBytes', os.path.getsize(local_file))
+
+        self.file_meta['translationMemory'] = local_file
+
+        return file_hash
+
+    def __get_result_key(self, source_hash, translation_memory_hash=None):
+        parts = [
+            __version__,
+            source_hash,
+            self.file_meta['extension'],
+            self.file_meta['srcLang'],
+            self.file_meta['trgLang'],
+            self.file_meta['domain'] or ''
+        ]
+
+        if translation_memory_hash:
+            # Translations of a document differ by the translation memory used
+            parts.append(translation_memory_hash)
+
+        return ArtifactCache.get_key(*parts)
+
+    def __restore_result(self, result_key, local_target_file):
+        """Restores cached translation of identical source file to 'local_target_file'.
+        Returns metadata of the completed document or None if translation is not cached"""
+        result_metadata_file = f'{local_target_file}.json'
+
+        if not (
+            RESULT_CACHE.get(result_key, 'metadata', result_metadata_file)
+            and RESULT_CACHE.get(result_key, 'result', local_target_file)
+        ):
+            return None
+
+        self.__logger.info("Identical document has been translated already, using cached translation")
+        accounting.count_cache_hit('result')
+
+        with open(result_metadata_file, 'r', encoding='utf-8') as metadata_file:
+            result_metadata = json.load(metadata_file)
+
+        return {
+            'status': FileTranslationStatusType.SUCCEEDED.value,
+            'segments': result_metadata['segments'],
+            'translatedSegments': result_metadata['translatedSegments'],
+            'domain': result_metadata['domain'],
+        }
+
+    def __store_result(self, result_key, local_target_file, translated_segment_count):
+        result_metadata_file = f'{local_target_file}.json'
+
+        with open(result_metadata_file, 'w', encoding='utf-8') as metadata_file:
+            json.dump(
+                {
+                    'segments': self.segment_count,
+                    'translatedSegments': translated_segment_count,
+                    'domain': self.domain,
+                },
+                metadata_file
+            )
+
+        RESULT_CACHE.put(result_key, 'result', local_target_file)
+        RESULT_CACHE.put(result_key, 'metadata', result_metadata_file)
 
     def __report_error(self, error_type: FileTranslationSubstatus):
         """Sets translation status metadata in Resource Repository to error with passed error code and message"""
@@ -134,6 +479,10 @@ class Translator():
 
         temp_file_dir = f'{self.temp_dir}/{self.doc_id}'
 
+        if not os.path.isdir(temp_file_dir):
+            # Job has been abandoned before any files were downloaded
+            return
+
         try:
             self.__logger.info("Removing directory %s", temp_file_dir)
             shutil.rmtree(temp_file_dir)
@@ -162,12 +511,32 @@ class Translator():
         seg_count: int = -1,
         seg_translated: int = -1,
     ):
-        """Event fired at the start of a translation, reporting the total segment count, and at designated times, reporting the progress"""
-        if seg_translated > -1:
-            self.__file_translation_service.update_metadata({'translatedSegments': seg_translated, 'domain': domain})
+        """Event fired at designated times reporting the progress, with the count of segments read so far,
+        and when all segments have been read, reporting the total segment count"""
+        self.domain = domain
+
+        metadata = {'domain': domain}
 
         if seg_count > -1:
-            self.__file_translation_service.update_metadata({'segments': seg_count, 'domain': domain})
+            self.segment_count = seg_count
+            metadata['segments'] = seg_count
+
+        if seg_translated > -1:
+            metadata['translatedSegments'] = seg_translated
+
+        self.__file_translation_service.update_metadata(metadata)
+
+    def __on_upload_file_result(self, file_path, file_type):
+        """Event fired when an intermediate file is ready. File is uploaded while the translation continues"""
+        accounting.count('uploadedBytes', os.path.getsize(file_path))
+        self.__uploads.append(
+            UPLOAD_EXECUTOR.submit(
+                contextvars.copy_context().run,
+                accounting.measured(self.__file_translation_service.upload_file),
+                file_path,
+                file_type
+            )
+        )
 
     def __on_temp_file_created(self, filepath):
         """Event fired when a temporary file is created in the translation process. Stores the file path in a list for later clean-up porcess."""
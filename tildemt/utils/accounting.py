@@ -0,0 +1,169 @@
+"""Resources used by translation jobs. Each job is reported as a single log record 'Job resources: {...}'
+and aggregated by document format in the metrics of the worker.
+
+CPU time is measured in the threads running the job, including the pool threads running its tasks, and for
+child processes (Okapi Tikal) that finished while the job was running together with the time reported by
+worker processes filtering the document parts. Peak memory is the peak resident set size of the worker process while the job
+was running. Both include other jobs processed by the worker at the same time"""
+
+import contextvars
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from collections import defaultdict
+
+from tildemt.utils import metrics
+
+# Counters of the job processed in the current thread
+_current_account = contextvars.ContextVar('job_account', default=None)
+
+
+class JobAccount():
+    """Resources used by a single job"""
+    def __init__(self, task):
+        self.__logger = logging.getLogger('JobAccount')
+        self.task = task
+
+        self.__counters = defaultdict(int)
+        self.__cache_hits = defaultdict(int)
+        self.__lock = threading.Lock()
+
+        self.__thread_time = None
+        self.__children_time = None
+
+    def start(self):
+        """Starts measuring the job in this thread and makes the account current"""
+        self.activate()
+        self.__children_time = _get_children_time()
+        _reset_peak_rss()
+
+    def activate(self):
+        """Makes the account current in this thread, CPU time of the thread is counted until suspended"""
+        _current_account.set(self)
+        self.__thread_time = time.thread_time()
+
+    def suspend(self):
+        """Stops counting CPU time of this thread, the job can be continued in another thread"""
+        self.count('cpuSeconds', time.thread_time() - self.__thread_time)
+
+    def count(self, name, value=1):
+        with self.__lock:
+            self.__counters[name] += value
+
+    def count_cache_hit(self, cache):
+        with self.__lock:
+            self.__cache_hits[cache] += 1
+
+    def measure_temp_files(self, directory):
+        """Counts size of the files in the temporary directory of the job, before it is cleaned up"""
+        size = 0
+        for path, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                try:
+                    size += os.path.getsize(os.path.join(path, file_name))
+                except OSError:
+                    pass
+
+        self.count('tempDiskBytes', size)
+
+    def stop(self, file_format):
+        """Finishes the account in the thread that finished the job, returns the resource record of the job"""
+        self.suspend()
+
+        with self.__lock:
+            counters = dict(self.__counters)
+            cache_hits = dict(self.__cache_hits)
+
+        record = {
+            'task': self.task,
+            'format': file_format,
+            'cpuSeconds': counters.get('cpuSeconds', 0),
+            'childCpuSeconds': _get_children_time() - self.__children_time + counters.get('childCpuSeconds', 0),
+            'peakRssBytes': _get_peak_rss(),
+            'tempDiskBytes': counters.get('tempDiskBytes', 0),
+            'downloadedBytes': counters.get('downloadedBytes', 0),
+            'uploadedBytes': counters.get('uploadedBytes', 0),
+            'mtRequests': counters.get('mtRequests', 0),
+            'mtCharacters': counters.get('mtCharacters', 0),
+            'mtRetries': counters.get('mtRetries', 0),
+            'cacheHits': cache_hits
+        }
+
+        self.__logger.info("Job resources: %s", json.dumps(record))
+        _observe(record)
+
+        return record
+
+
+def count(name, value=1):
+    """Adds 'value' to the counter of the job processed in the current thread"""
+    account = _current_account.get()
+    if account is not None:
+        account.count(name, value)
+
+
+def measured(function):
+    """Wraps 'function' submitted to a thread pool, so that CPU time of the pool thread is counted for the job
+    processed in the current thread. Submit it in a copy of the current context"""
+    def run(*args, **kwargs):
+        start_time = time.thread_time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            count('cpuSeconds', time.thread_time() - start_time)
+
+    return run
+
+
+def count_cache_hit(cache):
+    """Counts an artifact of the job processed in the current thread restored from the cache"""
+    account = _current_account.get()
+    if account is not None:
+        account.count_cache_hit(cache)
+
+
+def _observe(record):
+    file_format = record['format']
+
+    metrics.JOB_CPU_SECONDS.labels(file_format, 'worker').inc(record['cpuSeconds'])
+    metrics.JOB_CPU_SECONDS.labels(file_format, 'children').inc(record['childCpuSeconds'])
+    metrics.JOB_PEAK_RSS_BYTES.labels(file_format).observe(record['peakRssBytes'])
+    metrics.JOB_TEMP_DISK_BYTES.labels(file_format).observe(record['tempDiskBytes'])
+    metrics.JOB_TRANSFER_BYTES.labels(file_format, 'download').inc(record['downloadedBytes'])
+    metrics.JOB_TRANSFER_BYTES.labels(file_format, 'upload').inc(record['uploadedBytes'])
+    metrics.JOB_MT_REQUESTS.labels(file_format).inc(record['mtRequests'])
+    metrics.JOB_MT_CHARACTERS.labels(file_format).inc(record['mtCharacters'])
+    metrics.JOB_MT_RETRIES.labels(file_format).inc(record['mtRetries'])
+
+    for cache, hits in record['cacheHits'].items():
+        metrics.JOB_CACHE_HITS.labels(file_format, cache).inc(hits)
+
+
+def _get_children_time():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _reset_peak_rss():
+    """Resets peak resident set size of the process, so that the peak of the job can be measured (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def _get_peak_rss():
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # Peak of the process lifetime, in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
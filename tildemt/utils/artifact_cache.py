@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class ArtifactCache():
+    """Content-addressed local file cache. Entries are evicted in least recently used order
+    when the total size of the cache exceeds 'max_size' bytes. Sizes and use order of the entries are kept
+    in memory, the cache directory is scanned only when the cache is created"""
+    def __init__(self, directory, max_size):
+        self.__logger = logging.getLogger('ArtifactCache')
+
+        self.directory = directory
+        self.max_size = max_size
+
+        self.__lock = threading.Lock()
+
+        # Artifact sizes by artifact name of each entry, by entry key in least recently used order
+        self.__entries = OrderedDict()
+        self.__total_size = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.__scan()
+
+    @staticmethod
+    def from_environment(directory_variable, size_variable, default_size_mb=1024):
+        """Creates cache configured by environment variables. Returns None if cache directory is not configured"""
+        directory = os.environ.get(directory_variable)
+        if not directory:
+            return None
+
+        max_size = int(os.environ.get(size_variable, str(default_size_mb))) * 1024 * 1024
+        return ArtifactCache(directory, max_size)
+
+    @staticmethod
+    def get_key(*parts):
+        """Returns cache key for the passed key parts"""
+        return hashlib.sha256('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def get(self, key, name, target_path):
+        """Copies cached artifact 'name' of entry 'key' to 'target_path'. Returns False if artifact is not cached"""
+        entry_path = self.__get_entry_path(key)
+        artifact_path = os.path.join(entry_path, name)
+
+        with self.__lock:
+            if name not in self.__entries.get(key, ()):
+                return False
+
+            # Mark entry as recently used
+            self.__entries.move_to_end(key)
+
+        try:
+            shutil.copyfile(artifact_path, target_path)
+            # Use order is kept on disk for the next start of the worker
+            os.utime(entry_path)
+        except OSError:
+            # Entry might have been evicted meanwhile
+            self.__logger.exception("Unable to read cached artifact %s", artifact_path)
+            return False
+
+        self.__logger.info("Cached artifact '%s' restored to %s", name, target_path)
+        return True
+
+    def put(self, key, name, source_path):
+        """Stores a copy of 'source_path' as artifact 'name' of entry 'key'"""
+        entry_path = self.__get_entry_path(key)
+
+        try:
+            os.makedirs(entry_path, exist_ok=True)
+
+            # Copy to temporary file first, so that partially written artifacts are never visible
+            file_descriptor, temp_path = tempfile.mkstemp(dir=entry_path, prefix='.')
+            os.close(file_descriptor)
+            shutil.copyfile(source_path, temp_path)
+            size = os.path.getsize(temp_path)
+
+            with self.__lock:
+                os.replace(temp_path, os.path.join(entry_path, name))
+                os.utime(entry_path)
+
+                artifacts = self.__entries.setdefault(key, {})
+                self.__total_size += size - artifacts.get(name, 0)
+                artifacts[name] = size
+                self.__entries.move_to_end(key)
+
+                evicted = self.__evict()
+        except OSError:
+            self.__logger.exception("Unable to store artifact '%s' in cache", name)
+            return
+
+        for evicted_path in evicted:
+            self.__logger.info("Evicting cache entry %s", evicted_path)
+            shutil.rmtree(evicted_path, ignore_errors=True)
+
+        self.__logger.info("Artifact '%s' stored in cache", name)
+
+    def __get_entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def __scan(self):
+        """Indexes entries of the cache directory in least recently used order"""
+        entries = []
+
+        for prefix in os.listdir(self.directory):
+            prefix_path = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_path):
+                continue
+
+            for key in os.listdir(prefix_path):
+                entry_path = os.path.join(prefix_path, key)
+                artifacts = {
+                    entry.name: entry.stat().st_size
+                    for entry in os.scandir(entry_path)
+                    if entry.is_file() and not entry.name.startswith('.')
+                }
+                entries.append((os.path.getmtime(entry_path), key, artifacts))
+
+        for _, key, artifacts in sorted(entries):
+            self.__entries[key] = artifacts
+            self.__total_size += sum(artifacts.values())
+
+        self.__logger.info("Cache %s has %d entries of %d bytes", self.directory, len(entries), self.__total_size)
+
+        for evicted_path in self.__evict():
+            shutil.rmtree(evicted_path, ignore_errors=True)
+
+    def __evict(self):
+        """Removes least recently used entries from the index until the cache fits in the size limit.
+        Returns paths of the evicted entries, which are removed from disk outside of the lock"""
+        evicted = []
+
+        while self.__total_size > self.max_size and len(self.__entries) > 1:
+            key, artifacts = self.__entries.popitem(last=False)
+            self.__total_size -= sum(artifacts.values())
+            evicted.append(self.__get_entry_path(key))
+
+        return evicted
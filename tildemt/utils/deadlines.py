@@ -0,0 +1,104 @@
+"""Deadlines of translation jobs. A job message can set the time by which the result is needed ("deadline", ISO 8601),
+otherwise the deadline is JOB_DEADLINE_SECONDS of the document format after the job was published. Jobs are
+abandoned with substatus DeadlineExceededError when the deadline passes, so that the worker's capacity goes
+to jobs that can still finish in time"""
+
+import contextvars
+import datetime
+import logging
+import os
+import time
+
+from tildemt.enums.file_translation_status_subtype import FileTranslationSubstatus
+from tildemt.exceptions.file_translation_exception import FileTranslationException
+from tildemt.utils import metrics
+
+
+def _parse_default_seconds(value):
+    """Parses 'docx=3600,txt=600,1800' into seconds by document format, the entry without a format is used
+    for other formats"""
+    default_seconds = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(','))):
+        file_format, _, seconds = entry.rpartition('=')
+        default_seconds[file_format.strip().lower() or None] = float(seconds)
+
+    return default_seconds
+
+
+# Deadline of jobs without a deadline in the message by document format, jobs have no deadline if not set
+JOB_DEADLINE_SECONDS = _parse_default_seconds(os.environ.get("JOB_DEADLINE_SECONDS", ""))
+
+# Shortest timeout of requests of a job close to its deadline, requests can't be sent without a timeout
+MIN_REQUEST_TIMEOUT = 1
+
+# Deadline (time.time) of the job processed in the current thread
+_current_deadline = contextvars.ContextVar('job_deadline', default=None)
+
+
+def parse(value):
+    """Returns the deadline (time.time) of an ISO 8601 time, times without a time zone are in UTC.
+    Malformed times are logged and ignored"""
+    if value is None:
+        return None
+
+    try:
+        deadline = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, TypeError, ValueError):
+        logging.getLogger('Deadline').warning("Ignoring malformed deadline %r", value)
+        return None
+
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=datetime.timezone.utc)
+
+    return deadline.timestamp()
+
+
+def get_default(file_format, start_time):
+    """Returns deadline of a job of the format published at 'start_time' (time.time), or None"""
+    seconds = JOB_DEADLINE_SECONDS.get(file_format, JOB_DEADLINE_SECONDS.get(None))
+    return start_time + seconds if seconds is not None else None
+
+
+def activate(deadline):
+    """Makes the deadline current in this thread, batch translation threads copy the context of the job"""
+    _current_deadline.set(deadline)
+
+
+def get():
+    return _current_deadline.get()
+
+
+def remaining():
+    """Returns seconds left to the deadline of the current job, None if the job has no deadline"""
+    deadline = _current_deadline.get()
+    return max(deadline - time.time(), 0) if deadline is not None else None
+
+
+def clip(seconds):
+    """Returns 'seconds' limited to the time left to the deadline of the current job"""
+    seconds_left = remaining()
+    return min(seconds, seconds_left) if seconds_left is not None else seconds
+
+
+def request_timeout():
+    """Returns timeout of a request that should not outlast the deadline of the current job, None if the job
+    has no deadline. Timeout is at least MIN_REQUEST_TIMEOUT"""
+    seconds_left = remaining()
+    return max(seconds_left, MIN_REQUEST_TIMEOUT) if seconds_left is not None else None
+
+
+def check(stage):
+    """Raises FileTranslationException if the deadline of the current job has passed, 'stage' is the stage
+    of the job abandoned"""
+    if remaining() != 0:
+        return
+
+    exceeded(stage)
+
+
+def exceeded(stage):
+    """Abandons the job in 'stage', when an operation limited by the deadline has timed out"""
+    logging.getLogger('Deadline').warning("Deadline of the job has passed in stage %s", stage)
+    metrics.JOBS_DEADLINE_EXCEEDED.labels(stage).inc()
+
+    raise FileTranslationException(FileTranslationSubstatus.DEADLINE_EXCEEDED, "Deadline of the job has passed")
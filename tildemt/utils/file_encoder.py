@@ -1,46 +1,124 @@
-import subprocess
+import codecs
+import io
+import logging
+import threading
+
+# Size of the file prefix used for encoding detection
+DETECTION_SAMPLE_SIZE = 64 * 1024
+
+# Byte order marks, UTF-32 marks are checked first as they start with UTF-16 marks
+BYTE_ORDER_MARKS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Names of the registered decoding error handlers by codepage, see get_fallback_errors
+_fallback_errors = {}
+_fallback_errors_lock = threading.Lock()
+
+
+def get_fallback_errors(codepage):
+    """Returns name of a decoding error handler, which decodes bytes that are invalid in the detected encoding
+    with the codepage, or replaces them if the codepage is not known. Used for files detected as UTF-8 from
+    the sample, which might contain codepage characters further in the file"""
+    with _fallback_errors_lock:
+        if codepage not in _fallback_errors:
+            name = f'codepage-fallback-{codepage or "replace"}'
+            codecs.register_error(name, _get_fallback_handler(codepage))
+            _fallback_errors[codepage] = name
+
+        return _fallback_errors[codepage]
+
+
+def _get_fallback_handler(codepage):
+    logger = logging.getLogger('FileEncoder')
+
+    def handle(error):
+        if not isinstance(error, UnicodeDecodeError):
+            raise error
+
+        invalid = error.object[error.start:error.end]
+        logger.warning(
+            "Bytes %r at %d are not valid %s, decoded as %s", invalid, error.start, error.encoding, codepage or "U+FFFD"
+        )
+
+        return invalid.decode(codepage, errors='replace') if codepage else '\ufffd', error.end
+
+    return handle
 
 
 class FileEncoder():
-    """Class uses Linux command line utilities for detecting and manipulating text-file encoding"""
+    """Class detects text-file encoding from the beginning of the file"""
+    def open(self, file_path, language=None):
+        """Opens the text file for reading with the detected encoding, lines are not translated.
+        Bytes that are invalid in the encoding detected from the sample are decoded with the codepage
+        of the language. Returns the file and the encoding"""
+        encoding, _ = self.get_encoding(file_path, language)
+        if encoding is None:
+            logging.getLogger('FileEncoder').error("Unable to detect file encoding, reading as UTF-8")
+            encoding = 'utf-8'
+
+        errors = 'strict'
+        if encoding in ('utf-8', 'utf-8-sig'):
+            errors = get_fallback_errors(self.get_codepage(language) if language else None)
+
+        return io.open(file_path, 'r', encoding=encoding, errors=errors, newline=''), encoding
+
     def get_encoding(self, file_path, language=None):
-        """Gets and returns the encoding of a text file using 'file -bi' command
+        """Gets and returns the encoding of a text file from the first DETECTION_SAMPLE_SIZE bytes of the file
         'file_path' - full path to file
         'language' - two-symbol ISO language code of the file's source language.
                      Used to blindly guess the codepage of non-Unicode files.
         Returns the probable encoding or None if undetermined and a flag
         indicating whether an ASCII extentension codepage is used. """
 
-        exit_code = -1
-        encoding = ''
-        is_ascii = False
-
-        file_process_args = ['file', '-bi', file_path]
-        filtred_info_process_args = ['sed', '-e', 's/.*[ ]charset=//']
-        with subprocess.Popen(file_process_args, stdout=subprocess.PIPE) as file_info_process:
-            with subprocess.Popen(
-                filtred_info_process_args,
-                stdin=file_info_process.stdout,
-                stdout=subprocess.PIPE
-            ) as filtred_info_process:
+        with open(file_path, 'rb') as file:
+            sample = file.read(DETECTION_SAMPLE_SIZE)
+            is_complete = not file.read(1)
 
-                for line in filtred_info_process.stdout.readlines():
-                    encoding = encoding + line.strip().decode("utf-8")
+        encoding = self.__detect_unicode(sample, is_complete)
+        if encoding is not None:
+            return encoding, False
 
-                exit_code = filtred_info_process.wait()
+        # Neither ASCII nor Unicode, file uses an ASCII extension codepage
+        if language:
+            return self.get_codepage(language), True
 
-        if exit_code == 0:
-            # No extra guessing should be necessary for 'us-ascii' encoding, because the file
-            # obviously contains only symbols 0 - 127 without any extensions
-            if encoding not in ['us-ascii', 'utf-8', 'utf-16le', 'utf-16be']:
-                is_ascii = True
+        return None, True
 
-            if language and is_ascii:
-                return self.get_codepage(language), is_ascii
+    @staticmethod
+    def __detect_unicode(sample, is_complete):
+        """Returns encoding of the sample if it is ASCII or Unicode text, otherwise None"""
+        for byte_order_mark, encoding in BYTE_ORDER_MARKS:
+            if sample.startswith(byte_order_mark):
+                return encoding
 
-            return encoding, is_ascii
+        # UTF-16 without byte order mark, text in Latin script has zero high bytes in most of the characters
+        if len(sample) >= 2:
+            even_zeros = sample[0::2].count(0) / (len(sample) // 2)
+            odd_zeros = sample[1::2].count(0) / (len(sample) // 2)
+            if odd_zeros > 0.3 and even_zeros < 0.05:
+                return 'utf-16-le'
+            if even_zeros > 0.3 and odd_zeros < 0.05:
+                return 'utf-16-be'
+
+        if sample.isascii():
+            # No extra guessing should be necessary for ASCII, because the file
+            # obviously contains only symbols 0 - 127 without any extensions.
+            # Rest of a longer file is most likely UTF-8, which is a superset of ASCII
+            return 'us-ascii' if is_complete else 'utf-8'
+
+        try:
+            # Sample might end in the middle of a multi-byte character
+            codecs.getincrementaldecoder('utf-8')().decode(sample, final=is_complete)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
 
-        return None, is_ascii
+        return None
 
     @staticmethod
     def get_codepage(language):
@@ -119,16 +197,3 @@ class FileEncoder():
                 return encoding
 
         return None
-
-    @staticmethod
-    def convert_to(source_filepath, source_encoding, target_filepath, target_encoding='utf-8'):
-        """Converts the source file with source encoding to target encoding which defaults to UTF-8 and saves
-        it in the target file location"""
-
-        exit_code = -1
-
-        arguments = ['iconv', '-f', source_encoding, '-t', target_encoding, '-o', target_filepath, source_filepath]
-        with subprocess.Popen(arguments, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=None) as process:
-            exit_code = process.wait()
-
-        return exit_code == 0
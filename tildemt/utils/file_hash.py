@@ -0,0 +1,13 @@
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_file_hash(file_path):
+    """Returns SHA-256 hex digest of the file content"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
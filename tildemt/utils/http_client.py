@@ -0,0 +1,15 @@
+"""HTTP sessions shared by the threads of the worker"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def create_session(pool_size):
+    """Returns a session keeping up to 'pool_size' connections to each host open between requests,
+    size it to the count of threads sending requests concurrently. Requests sent by more threads
+    open connections that are closed afterwards"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max(pool_size, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
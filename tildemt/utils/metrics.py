@@ -0,0 +1,198 @@
+"""Prometheus metrics of the worker, exposed by the health check server at /metrics"""
+
+import contextlib
+import contextvars
+import time
+from collections import defaultdict
+from prometheus_client import Counter, Gauge, Histogram
+
+# Stages of a job: download, preprocess, extract, mt, merge, upload
+STAGE_SECONDS = Histogram(
+    'file_translation_stage_seconds',
+    'Time spent by a translation job in the stage, time of nested stages excluded',
+    ['stage', 'format'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+)
+
+MT_REQUEST_SECONDS = Histogram(
+    'mt_request_seconds',
+    'Latency of translation API requests by response status',
+    ['status'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120)
+)
+
+MT_BATCH_FILL = Histogram(
+    'mt_batch_fill_ratio',
+    'Characters of a translation batch relative to the batch size limit',
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1)
+)
+
+SEGMENTS_TRANSLATED = Counter(
+    'file_translation_segments_translated',
+    'Translated segments',
+    ['format']
+)
+
+SEGMENTS_PRETRANSLATED = Counter(
+    'file_translation_segments_pretranslated',
+    'Segments translated from the translation memory of the job instead of machine translation'
+)
+
+JOBS_IN_PROGRESS = Gauge(
+    'file_translation_jobs_in_progress',
+    'Translation jobs in progress, including jobs uploading their results'
+)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    'file_translation_queue_wait_seconds',
+    'Time between publishing of the job message and start of the job',
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+)
+
+JOBS_DEADLINE_EXCEEDED = Counter(
+    'file_translation_jobs_deadline_exceeded',
+    'Jobs abandoned because their deadline has passed, by the stage of the job',
+    ['stage']
+)
+
+MODULE_IMPORT_SECONDS = Gauge(
+    'file_translation_module_import_seconds',
+    'Time spent importing the module of a file translator on its first use',
+    ['module']
+)
+
+# Resources used by jobs, see tildemt.utils.accounting
+JOB_CPU_SECONDS = Counter(
+    'file_translation_job_cpu_seconds',
+    'CPU time of translation jobs in the worker process and in child processes',
+    ['format', 'process']
+)
+
+JOB_PEAK_RSS_BYTES = Histogram(
+    'file_translation_job_peak_rss_bytes',
+    'Peak resident set size of the worker process while the job was running',
+    ['format'],
+    buckets=tuple(size * 1024 * 1024 for size in (64, 128, 256, 512, 1024, 2048, 4096, 8192))
+)
+
+JOB_TEMP_DISK_BYTES = Histogram(
+    'file_translation_job_temp_disk_bytes',
+    'Temporary files of the job',
+    ['format'],
+    buckets=tuple(size * 1024 * 1024 for size in (1, 4, 16, 64, 256, 1024, 4096))
+)
+
+JOB_TRANSFER_BYTES = Counter(
+    'file_translation_job_transfer_bytes',
+    'Bytes downloaded from and uploaded to the file translation service',
+    ['format', 'direction']
+)
+
+JOB_MT_REQUESTS = Counter(
+    'file_translation_job_mt_requests',
+    'Translation API requests of jobs, including retries',
+    ['format']
+)
+
+JOB_MT_CHARACTERS = Counter(
+    'file_translation_job_mt_characters',
+    'Characters sent to the translation API, retries excluded',
+    ['format']
+)
+
+JOB_MT_RETRIES = Counter(
+    'file_translation_job_mt_retries',
+    'Retried translation API requests of jobs',
+    ['format']
+)
+
+JOB_CACHE_HITS = Counter(
+    'file_translation_job_cache_hits',
+    'Artifacts of jobs restored from the cache',
+    ['format', 'cache']
+)
+
+# Stage clock of the job processed in the current thread
+_current_clock = contextvars.ContextVar('stage_clock', default=None)
+
+
+class StageClock():
+    """Measures time spent by a job in each stage. Stages can be nested, time of a nested stage
+    is not counted in the enclosing stage, so that durations of all stages sum up to the job time"""
+    def __init__(self):
+        self.file_format = ''
+
+        # Callables called with the previous and the new stage when the stage changes
+        self.listeners = []
+
+        self.__durations = defaultdict(float)
+        self.__stage = None
+        self.__since = time.perf_counter()
+
+    def switch(self, stage):
+        """Starts the stage, returns the previous stage"""
+        now = time.perf_counter()
+        if self.__stage is not None:
+            self.__durations[self.__stage] += now - self.__since
+
+        previous, self.__stage, self.__since = self.__stage, stage, now
+
+        if stage != previous:
+            for listener in self.listeners:
+                listener(previous, stage)
+
+        return previous
+
+    def activate(self):
+        """Makes the clock current in this thread, stages are measured by the module functions"""
+        _current_clock.set(self)
+
+    @property
+    def durations(self):
+        """Seconds spent in each stage so far"""
+        self.switch(self.__stage)
+        return dict(self.__durations)
+
+    def observe(self):
+        """Observes durations of the stages and resets them"""
+        self.switch(self.__stage)
+
+        for stage, duration in self.__durations.items():
+            STAGE_SECONDS.labels(stage, self.file_format).observe(duration)
+
+        self.__durations.clear()
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Measures the block as the stage of the current job"""
+    clock = _current_clock.get()
+    if clock is None:
+        yield
+        return
+
+    previous = clock.switch(name)
+    try:
+        yield
+    finally:
+        clock.switch(previous)
+
+
+def iterate(name, iterable):
+    """Yields items of 'iterable', time spent producing the items is measured as the stage of the current job"""
+    clock = _current_clock.get()
+    if clock is None:
+        yield from iterable
+        return
+
+    iterator = iter(iterable)
+    while True:
+        previous = clock.switch(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            clock.switch(previous)
+
+        yield item
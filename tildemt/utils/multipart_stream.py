@@ -0,0 +1,52 @@
+import io
+import os
+import uuid
+
+
+class MultipartFileStream():
+    """File-like multipart/form-data request body with a single file field.
+    File content is read in chunks while the request is sent, so the body is never held in memory"""
+    def __init__(self, field_name, file_path):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+
+        file_name = os.path.basename(file_path).replace('"', '%22')
+        header = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{file_name}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8')
+        footer = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+
+        self.__length = len(header) + os.path.getsize(file_path) + len(footer)
+        self.__parts = [io.BytesIO(header), open(file_path, 'rb'), io.BytesIO(footer)]
+
+    def __len__(self):
+        # Length of the body is known in advance, so it is sent with Content-Length instead of chunked encoding
+        return self.__length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, size=-1):
+        chunks = []
+
+        while self.__parts and size != 0:
+            chunk = self.__parts[0].read(size)
+            if not chunk:
+                self.__parts.pop(0).close()
+                continue
+
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+
+        return b''.join(chunks)
+
+    def close(self):
+        for part in self.__parts:
+            part.close()
+        self.__parts = []
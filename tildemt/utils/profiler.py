@@ -0,0 +1,132 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import tracemalloc
+
+# Frames stored for each traced memory allocation
+TRACEMALLOC_FRAMES = 10
+
+# Memory tracing is process-wide, it is started by the first profiled job and stopped when no profiled job is left
+_tracing_lock = threading.Lock()
+_tracing_jobs = 0
+_started_tracing = False
+
+
+def _start_tracing():
+    global _tracing_jobs, _started_tracing # pylint: disable=global-statement
+
+    with _tracing_lock:
+        if _tracing_jobs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _started_tracing = True
+
+        _tracing_jobs += 1
+
+
+def _stop_tracing():
+    """Stops memory tracing if no other profiled job is in progress and tracing was started by the profiler"""
+    global _tracing_jobs, _started_tracing # pylint: disable=global-statement
+
+    with _tracing_lock:
+        _tracing_jobs -= 1
+
+        if _tracing_jobs == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class JobProfiler():
+    """Profiles CPU time and memory allocations of a job per stage of the job's StageClock.
+    Profiles are written to 'directory' when the job finishes:
+        - <stage>.prof - cProfile statistics of the stage, readable with pstats or snakeviz
+        - memory.snapshot - tracemalloc snapshot of memory allocated at the end of the job
+        - summary.json - time and peak traced memory of each stage
+    Only the job's thread is profiled, time spent waiting for other threads and processes
+    (translation requests, Okapi Tikal, worker processes) is seen as waiting in the stage.
+    Memory is traced for the whole process, so peaks of concurrently profiled jobs include each other"""
+    def __init__(self, directory):
+        self.__logger = logging.getLogger('JobProfiler')
+
+        self.directory = directory
+
+        self.__profiles = {}
+        self.__peak_memory = {}
+        self.__stage = None
+        self.__tracing = False
+
+    def start(self, stage=None):
+        _start_tracing()
+        self.__tracing = True
+
+        tracemalloc.reset_peak()
+        self.__enable(stage)
+
+    def switch(self, previous, stage):
+        """StageClock listener, profiles the new stage in a separate profile"""
+        self.__disable()
+        self.__enable(stage)
+
+    def suspend(self):
+        """Stops profiling until the next stage starts, the next stage can be profiled in another thread"""
+        self.__disable()
+
+    def stop(self, durations):
+        """Stops profiling and writes the profiles, 'durations' - seconds spent in each stage"""
+        self.__disable()
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            for stage, profile in self.__profiles.items():
+                profile.dump_stats(os.path.join(self.directory, f'{stage}.prof'))
+
+            if tracemalloc.is_tracing():
+                tracemalloc.take_snapshot().dump(os.path.join(self.directory, 'memory.snapshot'))
+
+            with open(os.path.join(self.directory, 'summary.json'), 'w', encoding='utf-8') as summary_file:
+                json.dump(
+                    {
+                        stage: {
+                            'seconds': durations.get(stage, 0),
+                            'peakMemory': self.__peak_memory.get(stage, 0)
+                        }
+                        for stage in dict.fromkeys(list(durations) + list(self.__profiles))
+                    },
+                    summary_file,
+                    indent=2
+                )
+
+            self.__logger.info("Job profile written to %s", self.directory)
+
+        except OSError:
+            self.__logger.exception("Unable to write job profile to %s", self.directory)
+
+        finally:
+            if self.__tracing:
+                _stop_tracing()
+                self.__tracing = False
+
+    def __enable(self, stage):
+        self.__stage = stage or 'other'
+
+        profile = self.__profiles.setdefault(self.__stage, cProfile.Profile())
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this thread
+            self.__logger.warning("Unable to profile stage %s", self.__stage)
+
+    def __disable(self):
+        if self.__stage is None:
+            return
+
+        self.__profiles[self.__stage].disable()
+
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            self.__peak_memory[self.__stage] = max(self.__peak_memory.get(self.__stage, 0), peak)
+            tracemalloc.reset_peak()
+
+        self.__stage = None
@@ -0,0 +1,199 @@
+"""Admission of translation jobs against the memory and temporary disk space budget of the worker.
+
+Resources needed for a job are estimated from the size of the source file and, for archive based documents,
+from the uncompressed sizes of the document parts listed in the central directory of the archive. Jobs are
+deferred only while other jobs hold reservations, as only they can free the resources the job waits for"""
+
+import logging
+import os
+import shutil
+import threading
+import zipfile
+from collections import namedtuple
+from tildemt.enums.admission_decision import AdmissionDecision
+
+# Peak memory and temporary disk space needed for a translation job, in bytes
+ResourceEstimate = namedtuple('ResourceEstimate', ['memory', 'disk'])
+
+ARCHIVE_FORMATS = ('docx', 'xlsx', 'pptx', 'odt')
+
+# Peak memory per byte of text or XML content: decoded text, element trees, source and target segments
+MEMORY_FACTORS = {'txt': 6, 'tmx': 12}
+DEFAULT_MEMORY_FACTOR = 10
+# Temporary files per byte of the source file: source, converted source, XLF-Inline source and target, result
+DISK_FACTOR = 5
+# Temporary files per byte of the archive: source, preprocessed source and result
+ARCHIVE_DISK_FACTOR = 3
+# Temporary files per byte of XML content of the archive: XLF-Inline source and target
+ARCHIVE_TEXT_DISK_FACTOR = 2
+# Uncompressed XML content per byte of the archive assumed before the archive is downloaded
+ARCHIVE_XML_RATIO = 4
+
+
+def estimate_resources(extension, file_size, file_path=None):
+    """Estimates resources needed for translating source file of 'file_size' bytes.
+    Uncompressed size of the archive content is read from 'file_path' if passed,
+    otherwise it is assumed from the archive size, see ARCHIVE_XML_RATIO"""
+
+    if extension not in ARCHIVE_FORMATS:
+        return ResourceEstimate(
+            memory=file_size * MEMORY_FACTORS.get(extension, DEFAULT_MEMORY_FACTOR),
+            disk=file_size * DISK_FACTOR
+        )
+
+    xml_size = file_size * ARCHIVE_XML_RATIO
+    if file_path is not None:
+        try:
+            with zipfile.ZipFile(file_path, 'r') as archive:
+                # Only the central directory is read, media and other binary parts are copied without parsing
+                xml_size = sum(
+                    item.file_size for item in archive.infolist() if item.filename.endswith(('.xml', '.rels'))
+                )
+        except (zipfile.BadZipFile, OSError):
+            logging.getLogger('ResourceBudget').warning("Unable to read archive %s", file_path)
+
+    return ResourceEstimate(
+        memory=xml_size * DEFAULT_MEMORY_FACTOR,
+        disk=file_size * ARCHIVE_DISK_FACTOR + xml_size * ARCHIVE_TEXT_DISK_FACTOR
+    )
+
+
+def get_available_memory():
+    """Returns memory available to the container in bytes, or None if it can't be determined"""
+
+    # cgroup v2 and v1 limits of the container
+    for limit_path, usage_path in (
+        ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+        ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes'),
+    ):
+        try:
+            with open(limit_path, 'r', encoding='utf-8') as limit_file, \
+                    open(usage_path, 'r', encoding='utf-8') as usage_file:
+                limit = limit_file.read().strip()
+                usage = int(usage_file.read().strip())
+        except (OSError, ValueError):
+            continue
+
+        # Unlimited cgroup v1 memory is reported as a huge number
+        if limit != 'max' and int(limit) < 1 << 60:
+            return max(int(limit) - usage, 0)
+
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf-8') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+class ResourceBudget():
+    """Memory and temporary disk space budget of the worker shared by translation jobs in progress.
+    A resource is not limited if its budget is None"""
+    def __init__(self, memory, disk, temp_dir):
+        self.__logger = logging.getLogger('ResourceBudget')
+
+        self.memory = memory
+        self.disk = disk
+        self.temp_dir = temp_dir
+
+        self.__reserved = ResourceEstimate(memory=0, disk=0)
+        # Notified when reserved resources are released
+        self.__released = threading.Condition()
+
+    @staticmethod
+    def from_environment(temp_dir):
+        """Creates budget configured by environment variables. Returns None if no budget is configured"""
+        memory = os.environ.get("WORKER_MEMORY_BUDGET_MB")
+        disk = os.environ.get("WORKER_DISK_BUDGET_MB")
+        if not (memory or disk):
+            return None
+
+        return ResourceBudget(
+            int(memory) * 1024 * 1024 if memory else None,
+            int(disk) * 1024 * 1024 if disk else None,
+            temp_dir
+        )
+
+    def limit(self, estimate):
+        """Returns the estimate limited to the budget, for rough estimates that must not reject a job"""
+        return ResourceEstimate(
+            memory=estimate.memory if self.memory is None else min(estimate.memory, self.memory),
+            disk=estimate.disk if self.disk is None else min(estimate.disk, self.disk)
+        )
+
+    def reserve(self, estimate, previous=None, wait=False):
+        """Reserves resources for a job, replacing its 'previous' reservation. Returns:
+            ADMIT - resources are reserved until released
+            DEFER - resources are reserved by other jobs at the moment, job should be retried later
+            REJECT - job does not fit in the budget at all
+        Jobs are admitted when no other job holds a reservation, even if other processes use the resources.
+        If 'wait' is set, waits for other jobs to release their resources instead of deferring the job.
+        The previous reservation is released if the job is not admitted"""
+
+        with self.__released:
+            if previous is not None:
+                self.__reserved = ResourceEstimate(*(r - p for r, p in zip(self.__reserved, previous)))
+                self.__released.notify_all()
+
+            while True:
+                decision = self.__decide(estimate)
+                if decision != AdmissionDecision.DEFER or not wait:
+                    break
+
+                self.__logger.info("Waiting for other jobs to release resources")
+                self.__released.wait()
+
+            if decision == AdmissionDecision.ADMIT:
+                self.__reserved = ResourceEstimate(*(r + e for r, e in zip(self.__reserved, estimate)))
+
+        self.__logger.info(
+            "%s job, estimated memory: %.1f MB, disk: %.1f MB, reserved memory: %.1f MB, disk: %.1f MB",
+            decision.value,
+            estimate.memory / 1024 / 1024,
+            estimate.disk / 1024 / 1024,
+            self.__reserved.memory / 1024 / 1024,
+            self.__reserved.disk / 1024 / 1024
+        )
+        return decision
+
+    def release(self, estimate):
+        """Releases resources reserved for a finished job"""
+        with self.__released:
+            self.__reserved = ResourceEstimate(*(r - e for r, e in zip(self.__reserved, estimate)))
+            self.__released.notify_all()
+
+    def __decide(self, estimate):
+        if (self.memory is not None and estimate.memory > self.memory) or \
+                (self.disk is not None and estimate.disk > self.disk):
+            return AdmissionDecision.REJECT
+
+        if estimate.memory > self.__get_available_memory() or estimate.disk > self.__get_available_disk():
+            if any(self.__reserved):
+                return AdmissionDecision.DEFER
+
+            # Waiting would not help, only other jobs can release the resources
+            self.__logger.warning("Admitting job exceeding free resources, no other jobs hold reservations")
+
+        return AdmissionDecision.ADMIT
+
+    def __get_available_memory(self):
+        available = get_available_memory()
+        if self.memory is not None:
+            remaining = self.memory - self.__reserved.memory
+            available = remaining if available is None else min(available, remaining)
+
+        return float('inf') if available is None else available
+
+    def __get_available_disk(self):
+        try:
+            available = shutil.disk_usage(self.temp_dir).free
+        except OSError:
+            available = float('inf')
+
+        if self.disk is not None:
+            available = min(available, self.disk - self.__reserved.disk)
+
+        return available
@@ -0,0 +1,207 @@
+"""Timed spans of translation jobs, exported to TRACE_EXPORT_DIR when the job finishes.
+
+Spans are exported as JSON lines, one span per line, or in OTLP JSON format, one export request
+per job, that can be loaded by OpenTelemetry collector file receiver. Tracing is disabled,
+and spans cost nothing, if TRACE_EXPORT_DIR is not set"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+TRACE_EXPORT_DIR = os.environ.get("TRACE_EXPORT_DIR")
+# 'jsonl' or 'otlp'
+TRACE_EXPORT_FORMAT = os.environ.get("TRACE_EXPORT_FORMAT", "jsonl").lower()
+
+SERVICE_NAME = "file-translation-worker"
+
+# Span of the current thread, new spans are its children
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span():
+    """Timed operation of a job with attributes"""
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+
+        self.start_time = time.time_ns()
+        self.end_time = None
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def set_error(self, message):
+        self.error = message
+
+    def end(self):
+        if self.end_time is not None:
+            return
+
+        self.end_time = time.time_ns()
+        self.trace.add(self)
+
+        if self.parent_id is None:
+            self.trace.export()
+
+    def to_dict(self):
+        return {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'startTimeUnixNano': self.start_time,
+            'endTimeUnixNano': self.end_time,
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start_time),
+            'endTimeUnixNano': str(self.end_time),
+            'attributes': [{'key': key, 'value': _to_otlp_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1}
+        }
+
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+
+        return span
+
+
+class _DisabledSpan():
+    """Span returned when tracing is disabled or there is no trace in the current thread"""
+    def set_attributes(self, **attributes):
+        pass
+
+    def set_error(self, message):
+        pass
+
+    def end(self):
+        pass
+
+
+DISABLED_SPAN = _DisabledSpan()
+
+
+class Trace():
+    """Spans of a single job"""
+    def __init__(self, file_name):
+        self.__logger = logging.getLogger('Trace')
+
+        self.trace_id = secrets.token_hex(16)
+        self.file_name = file_name
+
+        self.__spans = []
+        self.__lock = threading.Lock()
+
+    def add(self, span):
+        with self.__lock:
+            self.__spans.append(span)
+
+    def export(self):
+        """Writes finished spans of the trace to the export directory"""
+        with self.__lock:
+            spans, self.__spans = self.__spans, []
+
+        file_path = os.path.join(TRACE_EXPORT_DIR, f'{self.file_name}.{self.trace_id}.jsonl')
+        try:
+            os.makedirs(TRACE_EXPORT_DIR, exist_ok=True)
+
+            with open(file_path, 'w', encoding='utf-8') as trace_file:
+                if TRACE_EXPORT_FORMAT == 'otlp':
+                    json.dump(_to_otlp_request(spans), trace_file)
+                    trace_file.write('\n')
+                else:
+                    for span in spans:
+                        json.dump(span.to_dict(), trace_file)
+                        trace_file.write('\n')
+
+            self.__logger.info("Trace exported to %s", file_path)
+
+        except OSError:
+            self.__logger.exception("Unable to export trace to %s", file_path)
+
+
+def start_trace(name, file_name, **attributes):
+    """Starts the root span of a job trace and makes it current in this thread.
+    Trace is exported when the root span ends"""
+    if not TRACE_EXPORT_DIR:
+        return DISABLED_SPAN
+
+    root = Span(Trace(file_name), name, None, attributes)
+    _current_span.set(root)
+
+    return root
+
+
+def activate(span):
+    """Makes the span current in this thread, so that spans of another thread can be added to the trace"""
+    if isinstance(span, Span):
+        _current_span.set(span)
+
+
+def start_span(name, **attributes):
+    """Starts a child span of the current span, without making it current. Span has to be ended by the caller"""
+    parent = _current_span.get()
+    if parent is None:
+        return DISABLED_SPAN
+
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Measures the block as a child span of the current span, spans started in the block are its children.
+    Not to be used across yields of a generator, as the span would be current in the consumer's code"""
+    child = start_span(name, **attributes)
+    if child is DISABLED_SPAN:
+        yield child
+        return
+
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as ex:
+        child.set_error(repr(ex))
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def _to_otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _to_otlp_request(spans):
+    return {
+        'resourceSpans': [{
+            'resource': {
+                'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]
+            },
+            'scopeSpans': [{
+                'scope': {'name': 'tildemt'},
+                'spans': [span.to_otlp() for span in spans]
+            }]
+        }]
+    }
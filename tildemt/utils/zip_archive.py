@@ -0,0 +1,96 @@
+import copy
+import os
+import shutil
+import struct
+import sys
+import zipfile
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Field indices of the local file header (zipfile.structFileHeader)
+FH_SIGNATURE = 0
+FH_FILENAME_LENGTH = 10
+FH_EXTRA_FIELD_LENGTH = 11
+
+# Extra field header id of ZIP64 extended information
+ZIP64_EXTRA_ID = 0x0001
+# General purpose flags
+ENCRYPTED_FLAG = 0x01
+DATA_DESCRIPTOR_FLAG = 0x08
+
+# Raw copy writes to private state of zipfile.ZipFile, it is used only with Python versions it was verified with
+# (tests/test_zip_archive.py) and members are decompressed and compressed again with other versions
+RAW_COPY_SUPPORTED = (3, 8) <= sys.version_info[:2] <= (3, 13) and all(
+    hasattr(zipfile, name) for name in ('structFileHeader', 'sizeFileHeader', 'stringFileHeader', 'ZIP64_LIMIT')
+)
+
+
+def copy_member(source, target, item):
+    """Copies archive member 'item' from 'source' to 'target' ZipFile as raw compressed data,
+    without decompressing and compressing it again where supported"""
+
+    if item.flag_bits & ENCRYPTED_FLAG:
+        target.writestr(item, source.read(item))
+    elif RAW_COPY_SUPPORTED:
+        copy_raw_member(source, target, item)
+    else:
+        recompress_member(source, target, item)
+
+
+def recompress_member(source, target, item):
+    """Copies archive member 'item' from 'source' to 'target' ZipFile with the public ZipFile API,
+    the data is streamed, decompressed and compressed again"""
+    member = copy.copy(item)
+    member.extra = strip_extra(item.extra, ZIP64_EXTRA_ID)
+
+    with source.open(item) as reader:
+        with target.open(member, 'w', force_zip64=item.file_size > zipfile.ZIP64_LIMIT) as writer:
+            shutil.copyfileobj(reader, writer, COPY_CHUNK_SIZE)
+
+
+def copy_raw_member(source, target, item):
+    """Copies archive member 'item' from 'source' to 'target' ZipFile as raw compressed data,
+    see RAW_COPY_SUPPORTED"""
+    source.fp.seek(item.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, source.fp.read(zipfile.sizeFileHeader))
+
+    if header[FH_SIGNATURE] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad magic number for file header of {item.filename}")
+
+    source.fp.seek(header[FH_FILENAME_LENGTH] + header[FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+
+    member = copy.copy(item)
+    # Sizes and CRC are known, so they are written to the local header instead of data descriptor
+    member.flag_bits &= ~DATA_DESCRIPTOR_FLAG
+    # ZIP64 extra field is recreated by ZipInfo.FileHeader if it is needed
+    member.extra = strip_extra(item.extra, ZIP64_EXTRA_ID)
+    member.header_offset = target.fp.tell()
+
+    zip64 = member.file_size > zipfile.ZIP64_LIMIT or member.compress_size > zipfile.ZIP64_LIMIT
+    target.fp.write(member.FileHeader(zip64))
+
+    remaining = member.compress_size
+    while remaining > 0:
+        chunk = source.fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated data of {item.filename}")
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+
+    target.start_dir = target.fp.tell()
+    target.filelist.append(member)
+    target.NameToInfo[member.filename] = member
+
+
+def strip_extra(extra, header_id):
+    """Removes extra field records with 'header_id' from the extra field data"""
+    result = []
+    position = 0
+
+    while position + 4 <= len(extra):
+        record_id, record_length = struct.unpack('<HH', extra[position:position + 4])
+        if record_id != header_id:
+            result.append(extra[position:position + 4 + record_length])
+        position += 4 + record_length
+
+    return b''.join(result)
@@ -0,0 +1,75 @@
+"""Warm-up of the worker before it takes jobs, enabled by WARMUP. File translator modules are imported,
+Okapi Tikal and the worker processes filtering DOCX document parts are started once, and connections
+to the translation API and the file translation service are opened, so that the first job does not wait for them.
+The worker is not ready and does not consume jobs until the warm-up has finished"""
+
+import logging
+import os
+import threading
+import time
+
+import tildemt.file_translator
+from tildemt.services import file_translation_service, text_translation_service
+
+WARMUP = os.environ.get("WARMUP", "false").lower() == "true"
+
+_finished = threading.Event()
+
+
+def is_finished():
+    return _finished.is_set()
+
+
+def warm_up():
+    """Runs the warm-up steps, failed steps are logged and skipped"""
+    logger = logging.getLogger('WarmUp')
+
+    if not WARMUP:
+        _finished.set()
+        return
+
+    start_time = time.perf_counter()
+    steps = [
+        ('file translators', _import_file_translators, ()),
+        ('Okapi Tikal', _start_tikal, ()),
+        ('DOCX preprocessing workers', _start_preprocess_workers, ()),
+        ('translation API connection', _connect, ("TRANSLATION_API_SERVICE_URL", text_translation_service)),
+        ('file translation service connection', _connect, ("FILE_TRANSLATION_SERVICE_URL", file_translation_service))
+    ]
+
+    for name, step, arguments in steps:
+        step_start_time = time.perf_counter()
+        try:
+            step(*arguments)
+            logger.info("Warm-up of %s finished in %.2f s", name, time.perf_counter() - step_start_time)
+        except Exception as ex:
+            logger.warning("Warm-up of %s failed: %s", name, ex)
+
+    logger.info("Warm-up finished in %.2f s", time.perf_counter() - start_time)
+    _finished.set()
+
+
+def _import_file_translators():
+    for extension in tildemt.file_translator.FILE_TYPES:
+        tildemt.file_translator.get_file_translator(extension)
+
+
+def _start_tikal():
+    # Modules of the file translators are imported by the previous step
+    from tildemt.file_translator.types.tikal import TikalTranslator # pylint: disable=import-outside-toplevel
+    TikalTranslator.start_tikal()
+
+
+def _start_preprocess_workers():
+    from tildemt.file_translator.types.docx import DOCXTranslator # pylint: disable=import-outside-toplevel
+    DOCXTranslator.start_preprocess_workers()
+
+
+def _connect(url_variable, service_module):
+    """Opens a connection of the service's HTTP client, it is kept open for the first job"""
+    url = os.environ.get(url_variable)
+    if not url:
+        raise ValueError(f"{url_variable} is not set")
+
+    # Any response keeps the connection open
+    service_module.HTTP_CLIENT.head(url, timeout=30)